@@ -0,0 +1,97 @@
+"""
+Standalone performance benchmarks.
+
+Run them from the project directory, e.g. `python -m benchmarks.search`.
+Each one builds its fixture in a throwaway test database, so the configured
+database is never touched.
+"""
+import contextlib
+import os
+import random
+import statistics
+import time
+
+WORDS = (
+    "chicken beef pork tofu salmon shrimp egg spinach kale tomato onion garlic "
+    "basil oregano thyme rosemary lemon lime butter cream cheese parmesan rice "
+    "pasta noodle potato carrot pepper chili ginger soy honey maple vanilla "
+    "chocolate strawberry banana apple oat flour sugar yogurt coconut curry "
+    "roasted grilled baked fried braised creamy spicy crispy quick easy classic"
+).split()
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cook4all.settings")
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def benchmark_database():
+    """Create a fresh, migrated test database for the duration of the block."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+# Filler vocabulary with a Zipf-like frequency curve, so that like real text a
+# few words are everywhere and most are rare
+SYLLABLES = "ka lo mi ne ru sa te vo zi pa".split()
+FILLER = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+FILLER_WEIGHTS = [1 / rank for rank in range(1, len(FILLER) + 1)]
+
+
+def sentence(rng, length, food_ratio=0.2):
+    """Random text in which roughly `food_ratio` of the words are from WORDS."""
+    food = round(length * food_ratio)
+    words = [rng.choice(WORDS) for _ in range(food)]
+    words += rng.choices(FILLER, FILLER_WEIGHTS, k=length - food)
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def create_recipes(count, author, batch_size=5000, seed=0):
+    """Bulk insert `count` recipes of random text; signals are not sent."""
+    from recipes.models import Recipe
+
+    rng = random.Random(seed)
+    categories = [choice for choice, _ in Recipe.CATEGORY_CHOICES]
+    for start in range(0, count, batch_size):
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                title=sentence(rng, 3, food_ratio=0.67).title(),
+                description=sentence(rng, 20),
+                ingredients="\n".join(sentence(rng, 2, food_ratio=0.5) for _ in range(6)),
+                instructions=sentence(rng, 60, food_ratio=0.05),
+                category=rng.choice(categories),
+            )
+            for _ in range(start, min(start + batch_size, count))
+        ])
+
+
+def measure(func, repeat):
+    """Call `func` `repeat` times and return the wall-clock timings in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "p50": round(quantiles[49], 3),
+        "p95": round(quantiles[94], 3),
+        "p99": round(quantiles[98], 3),
+        "mean": round(statistics.fmean(timings), 3),
+    }
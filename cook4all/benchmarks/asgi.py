@@ -0,0 +1,255 @@
+"""
+Concurrent-request throughput over ASGI, where the search, detail and
+like/save/rate views are async, against the WSGI path a thread pool serves.
+
+    python -m benchmarks.asgi --concurrency 1 8 32 128 --latency 20 --threads 8
+
+Both servers are simulated in-process, so the numbers compare the two
+request paths through Django rather than two server implementations: the
+ASGI application is driven from one asyncio event loop, as uvicorn would,
+and the WSGI application from a pool of `--threads` threads, as gunicorn's
+threaded worker would. Every request spends `--latency` milliseconds on the
+network (half reading the request, half writing the response), which a
+worker thread sits out but the event loop spends on other requests.
+
+The mix is anonymous and logged-in recipe pages, AJAX searches and like
+toggles on a seeded, file-backed SQLite database.
+
+Each request costs more CPU over ASGI (Django runs the sync middleware
+hooks and the ORM work through thread hops), so while the threads can cover
+the network time, WSGI is ahead; once `concurrency * latency` is more than
+the pool can wait out, the event loop keeps serving at its CPU limit while
+WSGI throughput drops to threads / latency.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from . import benchmark_database, setup, summarize
+
+SEARCHES = ("chicken", "pasta", "lemon", "curry", "chocolate cake", "garlic butter", "tofu bowl", "spicy")
+# Any 32 alphanumeric characters make a valid CSRF secret, sent as both cookie and header
+CSRF_TOKEN = "abcdefghijklmnopqrstuvwxyz012345"
+
+
+def workload(rng, count, recipe_ids, weights):
+    """`count` (method, path, query, logged in) requests, popular recipes most often."""
+    from django.urls import reverse
+
+    requests = []
+    for _ in range(count):
+        recipe_id = rng.choices(recipe_ids, cum_weights=weights)[0]
+        kind = rng.random()
+        if kind < 0.35:
+            requests.append(("GET", reverse("recipe_detail", args=[recipe_id]), {}, False))
+        elif kind < 0.6:
+            requests.append(("GET", reverse("recipe_detail", args=[recipe_id]), {}, True))
+        elif kind < 0.85:
+            requests.append(("GET", reverse("ajax_search_recipes"), {"q": rng.choice(SEARCHES)}, False))
+        else:
+            requests.append(("POST", reverse("api_toggle_like", args=[recipe_id]), {}, True))
+    return requests
+
+
+def request_headers(method, logged_in, session):
+    """[(name, value)] as strings: cookies, and the CSRF header for POSTs."""
+    from django.conf import settings
+
+    cookies = [f"{settings.CSRF_COOKIE_NAME}={CSRF_TOKEN}"]
+    if logged_in:
+        cookies.append(f"{settings.SESSION_COOKIE_NAME}={session}")
+    headers = [("host", "testserver"), ("cookie", "; ".join(cookies))]
+    if method == "POST":
+        headers.append(("x-csrftoken", CSRF_TOKEN))
+    return headers
+
+
+# ---------------------------------------
+# ASGI: one event loop, every request in flight at once
+# ---------------------------------------
+async def asgi_request(application, method, path, query, headers, latency):
+    finished = asyncio.Event()
+    received = False
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            await asyncio.sleep(latency / 2)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Django listens for a disconnect while the view runs
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body"):
+            await asyncio.sleep(latency / 2)
+            finished.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(query).encode(),
+        "root_path": "",
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    await application(scope, receive, send)
+    return status
+
+
+async def serve_asgi(application, requests, concurrency, latency, session):
+    pending = iter(requests)
+    timings, statuses = [], []
+
+    async def client():
+        for method, path, query, logged_in in pending:
+            begin = time.perf_counter()
+            statuses.append(await asgi_request(
+                application, method, path, query, request_headers(method, logged_in, session), latency,
+            ))
+            timings.append((time.perf_counter() - begin) * 1000)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return timings, statuses
+
+
+# ---------------------------------------
+# WSGI: a pool of worker threads, one request each
+# ---------------------------------------
+def wsgi_request(application, method, path, query, headers, latency):
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": urlencode(query),
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "CONTENT_LENGTH": "0",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.url_scheme": "http",
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        **{f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers},
+    }
+    statuses = []
+    time.sleep(latency / 2)
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+    try:
+        b"".join(response)
+    finally:
+        response.close()
+    time.sleep(latency / 2)
+    return statuses[0]
+
+
+def serve_wsgi(application, requests, concurrency, latency, session, threads):
+    pending = iter(requests)
+    timings, statuses = [], []
+    lock = threading.Lock()
+
+    def client(pool):
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            method, path, query, logged_in = request
+            begin = time.perf_counter()
+            # Clients beyond the pool size wait for a thread, as for a free worker
+            status = pool.submit(
+                wsgi_request, application, method, path, query,
+                request_headers(method, logged_in, session), latency,
+            ).result()
+            with lock:
+                timings.append((time.perf_counter() - begin) * 1000)
+                statuses.append(status)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        clients = [threading.Thread(target=client, args=(pool,)) for _ in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+    return timings, statuses
+
+
+def report(name, concurrency, elapsed, timings, statuses):
+    errors = sum(status >= 400 for status in statuses)
+    print(
+        f"{name:5} concurrency {concurrency:4}  {len(timings) / elapsed:7.0f} requests/s  "
+        f"{summarize(timings)}  errors: {errors}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per run.")
+    parser.add_argument("--latency", type=float, default=20, help="Network time per request, in ms.")
+    parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads.")
+    parser.add_argument("--recipes", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test import Client
+
+    from recipes.models import Recipe
+    from recipes.seeding import seed, zipf_weights
+
+    settings.DEBUG = False
+    settings.INSTRUMENTATION_ENABLED = False
+    latency = args.latency / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        # A file, so that the WSGI threads each get a connection to the same database
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(directory, "asgi.sqlite3")
+        with benchmark_database():
+            seed(users=200, recipes=args.recipes, likes=args.recipes * 10, saves=args.recipes,
+                 ratings=args.recipes * 2, comments=args.recipes * 2)
+            recipe_ids = list(Recipe.objects.order_by("-like_count", "pk").values_list("pk", flat=True))
+            weights = zipf_weights(len(recipe_ids), 1.1)
+            client = Client()
+            client.force_login(User.objects.order_by("pk").first())
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+            asgi, wsgi = ASGIHandler(), WSGIHandler()
+            rng = random.Random(0)
+            for concurrency in args.concurrency:
+                requests = workload(rng, args.requests, recipe_ids, weights)
+
+                begin = time.perf_counter()
+                timings, statuses = asyncio.run(serve_asgi(asgi, requests, concurrency, latency, session))
+                report("asgi", concurrency, time.perf_counter() - begin, timings, statuses)
+
+                begin = time.perf_counter()
+                timings, statuses = serve_wsgi(wsgi, requests, concurrency, latency, session, args.threads)
+                report("wsgi", concurrency, time.perf_counter() - begin, timings, statuses)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Concurrent writers on one SQLite file: Django's default connection set-up
+against the tuned profile in settings.DATABASES (WAL, BEGIN IMMEDIATE,
+busy_timeout and the other SQLITE_PRAGMAS).
+
+    python -m benchmarks.concurrency --writers 8 --operations 200
+
+Each writer is a separate process, as a gunicorn worker would be, logged in
+as its own user, sending like toggles (most requests), ratings and comments
+on a handful of popular recipes through the test client. The report gives
+throughput, latency and the requests that failed with "database is locked",
+and checks that the stored like counters still match the likes.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from . import benchmark_database, create_recipes, setup, summarize
+
+
+def profiles():
+    """{name: (journal mode, connection OPTIONS)}."""
+    from django.conf import settings
+
+    return {
+        # What a bare sqlite3 entry in DATABASES gets: rollback journal,
+        # deferred transactions and sqlite3's 5 second timeout
+        "default": ("DELETE", {}),
+        "tuned": ("WAL", settings.DATABASES["default"]["OPTIONS"]),
+    }
+
+
+def writer(number, client, options, recipe_ids, operations, start, results):
+    from django.db import OperationalError, connection
+    from django.urls import reverse
+
+    connection.settings_dict["OPTIONS"] = options
+    rng = random.Random(number)
+    timings, locked, failed = [], 0, 0
+    start.wait()
+    try:
+        for _ in range(operations):
+            recipe_id = rng.choice(recipe_ids)
+            kind = rng.random()
+            begin = time.perf_counter()
+            try:
+                if kind < 0.7:
+                    response = client.post(reverse("api_toggle_like", args=[recipe_id]))
+                elif kind < 0.85:
+                    response = client.post(reverse("recipe_rate", args=[recipe_id]), {"rating": rng.randint(1, 5)})
+                else:
+                    response = client.post(reverse("add_comment", args=[recipe_id]), {"content": "Lovely!"})
+                failed += response.status_code >= 400
+            except OperationalError as exc:
+                if "locked" not in str(exc):
+                    raise
+                locked += 1
+            timings.append((time.perf_counter() - begin) * 1000)
+    finally:
+        # Reported even if a writer fails, so the run doesn't wait for it forever
+        results.put((timings, locked, failed))
+
+
+def run(profile, journal_mode, options, writers, operations, recipe_ids):
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client
+
+    # Logged in up front: the writers inherit the clients and the cached sessions
+    clients = []
+    for number in range(writers):
+        client = Client()
+        client.force_login(User.objects.get(username=f"writer{number}"))
+        clients.append(client)
+
+    context = multiprocessing.get_context("fork")
+    start = context.Barrier(writers + 1)
+    results = context.Queue()
+    # The journal mode is stored in the file and only changes while no other
+    # connection is open. Forked writers must not share the parent's connection.
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+    connection.close()
+    processes = [
+        context.Process(target=writer, args=(number, client, options, recipe_ids, operations, start, results))
+        for number, client in enumerate(clients)
+    ]
+    for process in processes:
+        process.start()
+    start.wait()
+    begin = time.perf_counter()
+    outcomes = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - begin
+    for process in processes:
+        process.join()
+
+    timings = [timing for outcome in outcomes for timing in outcome[0]]
+    locked = sum(outcome[1] for outcome in outcomes)
+    failed = sum(outcome[2] for outcome in outcomes)
+    print(
+        f"{profile:8} {writers} writers  {len(timings) / elapsed:6.0f} requests/s  {summarize(timings)}  "
+        f"'database is locked': {locked}  other failures: {failed}"
+    )
+
+
+def check_counters(recipe_ids):
+    from django.db.models import Count, F
+
+    from recipes.models import Recipe
+
+    mismatched = (
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .annotate(likes_stored=Count("likes"))
+        .exclude(like_count=F("likes_stored"))
+        .count()
+    )
+    print(f"         like counters {'consistent' if not mismatched else f'wrong on {mismatched} recipes'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, nargs="+", default=[2, 8])
+    parser.add_argument("--operations", type=int, default=200, help="Requests per writer.")
+    parser.add_argument("--recipes", type=int, default=10, help="Recipes the writers compete for.")
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+
+    from recipes.models import Comment, Rating, Recipe
+
+    settings.DEBUG = False
+    settings.INSTRUMENTATION_ENABLED = False
+    with tempfile.TemporaryDirectory() as directory:
+        # A file, not the usual in-memory test database, so locking is SQLite's own
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(directory, "concurrency.sqlite3")
+        with benchmark_database():
+            author = User.objects.create_user("author")
+            User.objects.bulk_create([User(username=f"writer{number}") for number in range(max(args.writers))])
+            create_recipes(args.recipes, author)
+            recipe_ids = list(Recipe.objects.values_list("pk", flat=True))
+
+            for writers in args.writers:
+                for profile, (journal_mode, options) in profiles().items():
+                    Recipe.likes.through.objects.all().delete()
+                    Rating.objects.all().delete()
+                    Comment.objects.all().delete()
+                    Recipe.objects.update(like_count=0, rating_sum=0, rating_count=0,
+                                          rating_average=0, comment_count=0)
+                    run(profile, journal_mode, options, writers, args.operations, recipe_ids)
+                    check_counters(recipe_ids)
+
+
+if __name__ == "__main__":
+    main()
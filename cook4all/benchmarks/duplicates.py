@@ -0,0 +1,114 @@
+"""
+Near-duplicate lookups through the MinHash/LSH index vs comparing the new
+recipe's signature with every stored one.
+
+    python -m benchmarks.duplicates --recipes 100000
+
+Also reports how fast recipes are signed, how many bytes the index takes
+per recipe (from SQLite's dbstat table), the recall on reposted recipes and
+how long clustering the whole catalogue takes.
+"""
+import argparse
+import random
+import time
+
+from . import benchmark_database, create_recipes, measure, setup, summarize
+
+INDEX_TABLES = ("recipes_recipesignature", "recipes_signaturebucket", "signature_bucket_idx")
+
+
+def reword(rng, text, edits=3):
+    """`text` with a few words replaced, as a repost would be."""
+    words = text.split()
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = rng.choice(("fresh", "homemade", "lovely", "quick"))
+    return " ".join(words)
+
+
+def table_bytes(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(['%s'] * len(INDEX_TABLES))}) "
+            f"OR name LIKE 'recipes_signaturebucket%%' GROUP BY name",
+            INDEX_TABLES,
+        )
+        return dict(cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--reposts", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+
+    from recipes.duplicates import (
+        _unpack, duplicate_clusters, duplicate_threshold, find_duplicates, index_recipes, signature, similarity,
+    )
+    from recipes.models import Recipe, RecipeSignature
+
+    rng = random.Random(0)
+    with benchmark_database() as connection:
+        author = User.objects.create_user("benchmark")
+        create_recipes(args.recipes, author)
+
+        signing = 0.0
+        last_pk = 0
+        while True:
+            batch = list(Recipe.objects.filter(pk__gt=last_pk).order_by("pk")[:5000])
+            if not batch:
+                break
+            begin = time.perf_counter()
+            index_recipes(batch)
+            signing += time.perf_counter() - begin
+            last_pk = batch[-1].pk
+        print(f"{args.recipes} recipes signed and indexed at {args.recipes / signing:,.0f} recipes/s")
+
+        sizes = table_bytes(connection)
+        for name, size in sorted(sizes.items()):
+            print(f"  {name:40} {size / args.recipes:6.0f} bytes/recipe")
+        total = sum(sizes.values()) / args.recipes
+        print(f"  {'total':40} {total:6.0f} bytes/recipe, {total * 1e6 / 2 ** 30:.2f} GiB per 1M recipes")
+
+        # Reposts of random recipes, not saved: what an author would submit
+        originals = list(Recipe.objects.order_by("?")[:args.reposts])
+        reposts = [
+            Recipe(title=original.title, ingredients=original.ingredients,
+                   instructions=reword(rng, original.instructions))
+            for original in originals
+        ]
+        found = sum(
+            original.pk in {duplicate.pk for duplicate in find_duplicates(repost)}
+            for original, repost in zip(originals, reposts)
+        )
+        print(f"recall on {args.reposts} reworded reposts: {found / args.reposts:.1%}")
+
+        probe = reposts[0]
+        print(f"lookup, LSH index    {summarize(measure(lambda: find_duplicates(probe), args.repeat))}")
+
+        threshold = duplicate_threshold()
+
+        def brute_force():
+            minhashes = signature(probe)
+            return [
+                recipe_id
+                for recipe_id, data in RecipeSignature.objects.values_list("recipe", "minhashes").iterator(chunk_size=10000)
+                if similarity(minhashes, _unpack(data)) >= threshold
+            ]
+
+        print(f"lookup, full scan    {summarize(measure(brute_force, max(args.repeat // 10, 2)))}")
+
+        # Post them, so the catalogue has some duplicates to cluster
+        for repost in reposts:
+            repost.author = author
+        index_recipes(Recipe.objects.bulk_create(reposts))
+        begin = time.perf_counter()
+        clusters = duplicate_clusters()
+        print(f"clustered the catalogue in {time.perf_counter() - begin:.2f}s: {len(clusters)} clusters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Bytes a recipe list page transfers for its card images: the original
+uploads vs the generated renditions, and the time spent rendering them.
+
+    python -m benchmarks.images --width 3000 --height 2000 --cards 6
+"""
+import argparse
+import io
+import random
+import time
+
+from . import setup
+
+
+def synthetic_photo(rng, width, height):
+    """A JPEG with smooth gradients, shapes and a little grain, like a photo."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    image = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(image)
+    top, bottom = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(2)]
+    for y in range(height):
+        t = y / height
+        draw.line([(0, y), (width, y)], fill=tuple(round(a + (b - a) * t) for a, b in zip(top, bottom)))
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(width // 20, width // 5)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    grain = Image.effect_noise((width, height), 12).convert("RGB")
+    image = Image.blend(image, grain, 0.08)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--cards", type=int, default=6, help="cards per list page")
+    args = parser.parse_args()
+
+    setup()
+    from images.pipeline import SOURCES, render_variants
+
+    rng = random.Random(0)
+    originals = [synthetic_photo(rng, args.width, args.height) for _ in range(args.cards)]
+    transferred = {}
+    render_ms = []
+    for original in originals:
+        start = time.perf_counter()
+        renditions = list(render_variants(io.BytesIO(original), SOURCES["recipes.recipe"]))
+        render_ms.append((time.perf_counter() - start) * 1000)
+        for variant, name, width, content in renditions:
+            if variant == "card":
+                transferred[(name, width)] = transferred.get((name, width), 0) + len(content)
+
+    page = sum(len(original) for original in originals)
+    print(f"{args.cards} cards from {args.width}x{args.height} JPEG uploads")
+    print(f"  original uploads   {page / 1024:9.1f} KiB")
+    for (name, width), size in sorted(transferred.items()):
+        print(f"  card {name:4} {width:4}w   {size / 1024:9.1f} KiB  ({size / page:6.1%})")
+    print(f"  render time per upload (card + detail): {sum(render_ms) / len(render_ms):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Ingredient queries through the inverted index vs a substring scan of the
+free-text ingredient lists.
+
+    python -m benchmarks.ingredients --recipes 100000
+
+Also reports how fast the backfill parses and indexes recipes.
+"""
+import argparse
+import random
+import time
+
+from . import WORDS, benchmark_database, measure, setup, summarize
+
+UNITS = ("", "1 cup", "2 tbsp", "1 tsp", "200g", "3", "1 can (400g)", "½ cup", "2 cloves")
+PREPARATION = ("", "", ", chopped", ", finely diced", " (optional)", ", to taste")
+
+QUERIES = (
+    ("all", ("egg", "spinach")),
+    ("all", ("garlic", "butter", "lemon")),
+    ("any", ("tofu", "salmon")),
+    ("missing-one", ("egg", "spinach", "onion", "butter", "cream", "cheese")),
+    ("missing-one", ("chicken", "rice", "garlic", "ginger", "soy", "onion", "pepper", "lime")),
+)
+
+
+def vocabulary():
+    """Food words plus two-word combinations, most common first."""
+    foods = WORDS[:46]
+    return foods + [f"{a} {b}" for a in foods[:30] for b in foods[30:46]]
+
+
+def ingredient_list(rng, names, weights):
+    lines = []
+    for name in dict.fromkeys(rng.choices(names, weights, k=rng.randint(5, 12))):
+        lines.append(f"{rng.choice(UNITS)} {name}{rng.choice(PREPARATION)}".strip())
+    return "\n".join(lines)
+
+
+def scan(queryset, mode, names):
+    """The unindexed way: substring matches on the text column."""
+    from django.db.models import Q
+
+    conditions = [Q(ingredients__icontains=name) for name in names]
+    combined = conditions[0]
+    for condition in conditions[1:]:
+        combined = combined & condition if mode == "all" else combined | condition
+    return queryset.filter(combined)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+
+    from recipes.ingredients import MATCH_MODES, index_recipes
+    from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+    rng = random.Random(0)
+    names = vocabulary()
+    weights = [1 / rank for rank in range(1, len(names) + 1)]
+
+    with benchmark_database():
+        author = User.objects.create_user("benchmark")
+        indexed = 0
+        index_seconds = 0.0
+        for start in range(0, args.recipes, 5000):
+            batch = Recipe.objects.bulk_create([
+                Recipe(author=author, title=f"Recipe {i}", description="", instructions="",
+                       ingredients=ingredient_list(rng, names, weights))
+                for i in range(start, min(start + 5000, args.recipes))
+            ])
+            begin = time.perf_counter()
+            indexed += index_recipes(batch)
+            index_seconds += time.perf_counter() - begin
+
+        print(
+            f"{args.recipes} recipes, {indexed} ingredient rows, "
+            f"{Ingredient.objects.count()} ingredients; indexed "
+            f"{args.recipes / index_seconds:,.0f} recipes/s"
+        )
+        assert RecipeIngredient.objects.count() == indexed
+
+        recipes = Recipe.objects.only("pk", "title")
+        for mode, query in QUERIES:
+            found = MATCH_MODES[mode](recipes, query)
+            if mode == "all":
+                found = found.order_by("-like_count", "-id")
+            indexed_timings = measure(lambda: list(found[:12]), args.repeat)
+            count = found.count()
+            print(f"{mode:11} {', '.join(query)}  ({count} recipes)")
+            print(f"  index  {summarize(indexed_timings)}")
+            if mode != "missing-one":
+                scanned = scan(recipes, mode, query).order_by("-like_count", "-id")
+                print(f"  scan   {summarize(measure(lambda: list(scanned[:12]), max(args.repeat // 4, 2)))}")
+
+
+if __name__ == "__main__":
+    main()
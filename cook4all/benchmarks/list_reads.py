@@ -0,0 +1,85 @@
+"""
+Load test for recipe list reads: latency, queries and database writes per
+request, for each session engine, for anonymous and logged-in visitors.
+
+    python -m benchmarks.list_reads --recipes 2000 --requests 500
+
+Every request is a plain read (filters, pages, cursors, searches), so the
+"writes" column should be 0 everywhere.
+"""
+import argparse
+import random
+
+from . import benchmark_database, create_recipes, measure, setup, summarize
+
+ENGINES = (
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+    "django.contrib.sessions.backends.signed_cookies",
+)
+
+FILTERS = ("", "most_liked", "top_rated", "breakfast", "dinner", "snack", "dessert", "other")
+
+
+def request_mix(rng, count):
+    """Random list URLs as a browsing visitor would request them."""
+    params = []
+    for _ in range(count):
+        choice = {}
+        if rng.random() < 0.7:
+            choice["filter"] = rng.choice(FILTERS)
+        if rng.random() < 0.4:
+            choice["page"] = rng.randint(1, 20)
+        if rng.random() < 0.1:
+            choice = {"q": rng.choice(("chicken", "pasta", "lemon", "chocolate"))}
+        params.append(choice)
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from django.urls import reverse
+
+    with benchmark_database():
+        author = User.objects.create_user("benchmark")
+        create_recipes(args.recipes, author)
+        url = reverse("recipe_list")
+        mix = request_mix(random.Random(0), args.requests)
+
+        print(f"{args.recipes} recipes, {args.requests} list requests per row")
+        for engine in ENGINES:
+            for viewer in ("anonymous", "logged in"):
+                # Whole-page caching would hide the work; measure the view itself
+                with override_settings(SESSION_ENGINE=engine, RECIPES_PAGE_CACHE_TIMEOUT=0):
+                    cache.clear()
+                    client = Client()
+                    if viewer == "logged in":
+                        client.force_login(author)
+                    requests = iter(mix)
+
+                    with CaptureQueriesContext(connection) as ctx:
+                        timings = measure(lambda: client.get(url, next(requests)), len(mix))
+
+                writes = sum(
+                    not query["sql"].lstrip().upper().startswith("SELECT")
+                    for query in ctx.captured_queries
+                )
+                print(
+                    f"{engine.rsplit('.', 1)[1]:15} {viewer:10} "
+                    f"queries/request {len(ctx.captured_queries) / len(mix):5.2f}  "
+                    f"writes {writes}  {summarize(timings)}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cost of the /metrics registry: per update, per flush and scrape, and per
+request through the instrumentation middleware.
+
+    python -m benchmarks.metrics
+
+Per-request overhead is measured by sending the same requests with the
+middleware on and off (INSTRUMENTATION_ENABLED), in alternating rounds so
+drift affects both alike.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import timeit
+from pathlib import Path
+
+from . import benchmark_database, create_recipes, measure, setup, summarize
+
+
+def per_call_ns(statement, number, **names):
+    best = min(timeit.repeat(statement, globals=names, number=number, repeat=5))
+    return best / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=4)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    from instrumentation.metrics import Counter, Gauge, Histogram, Registry
+    from recipes.models import Recipe
+
+    settings.DEBUG = False
+
+    registry = Registry()
+    counter = registry.register(Counter, "bench_total", "Counter.", ["view", "method", "status"])
+    gauge = registry.register(Gauge, "bench_in_progress", "Gauge.")
+    histogram = registry.register(Histogram, "bench_seconds", "Histogram.", ["view"])
+    print("per update")
+    for label, statement in (
+        ("counter.inc, 3 labels", "counter.inc(view='recipe_list', method='GET', status=200)"),
+        ("gauge.inc", "gauge.inc()"),
+        ("histogram.observe, 1 label", "histogram.observe(0.042, view='recipe_list')"),
+    ):
+        ns = per_call_ns(statement, args.calls, counter=counter, gauge=gauge, histogram=histogram)
+        print(f"  {label:28} {ns:7.0f} ns")
+
+    # A registry the size of a busy site's: every view × method × status
+    for view in range(40):
+        for status in (200, 302, 304, 404):
+            counter.inc(view=f"view{view}", method="GET", status=status)
+            histogram.observe(0.01, view=f"view{view}")
+    with tempfile.TemporaryDirectory() as directory:
+        settings.METRICS_MULTIPROCESS_DIR = directory
+        flush = summarize(measure(registry.flush, 200))
+        print(f"flush to file                  {flush}")
+        # Seven more workers, as copies of this process's file
+        own = Path(directory, f"metrics-{os.getpid()}.json")
+        for number in range(7):
+            shutil.copy(own, Path(directory, f"metrics-{4000000 + number}.json"))
+        scrape = summarize(measure(registry.expose, 50))
+        print(f"scrape, 8 process files        {scrape}")
+        settings.METRICS_MULTIPROCESS_DIR = ""
+    print(f"scrape, in process             {summarize(measure(registry.expose, 50))}")
+
+    with benchmark_database():
+        author = User.objects.create_user("benchmark", password="benchmark")
+        create_recipes(200, author)
+        recipe_id = Recipe.objects.values_list("pk", flat=True).first()
+
+        def requests(client):
+            client.get("/recipes/?page=2")
+            client.post(f"/recipes/api/{recipe_id}/like/")
+
+        timings = {True: [], False: []}
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                # A new client builds a new handler, so the middleware setting applies
+                settings.INSTRUMENTATION_ENABLED = enabled
+                client = Client()
+                client.force_login(author)
+                for _ in range(20):
+                    requests(client)
+                timings[enabled].extend(measure(lambda: requests(client), args.requests // args.rounds))
+
+        off, on = summarize(timings[False]), summarize(timings[True])
+        print("list page + like toggle, per pair of requests")
+        print(f"  instrumentation off          {off}")
+        print(f"  instrumentation on           {on}")
+        overhead = statistics.median(timings[True]) - statistics.median(timings[False])
+        print(f"  overhead at p50              {overhead * 1000 / 2:.0f} µs per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Page latency from page 1 to page 10,000: OFFSET pagination vs keyset cursors.
+
+    python -m benchmarks.pagination --per-page 6 --pages 10000
+"""
+import argparse
+
+from . import benchmark_database, create_recipes, measure, setup, summarize
+
+SORTS = {
+    "newest": ("-created_at", "-id"),
+    "most_liked": ("-like_count", "-created_at", "-id"),
+    "top_rated": ("-rating_average", "-created_at", "-id"),
+}
+# The list view's filter for each sort
+FILTERS = {
+    "most_liked": {"like_count__gt": 0},
+    "top_rated": {"rating_count__gt": 0},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=10_000)
+    parser.add_argument("--per-page", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.core.paginator import Paginator
+    from django.db.models import F
+
+    from recipes.models import Recipe
+    from recipes.pagination import KeysetPaginator
+
+    with benchmark_database():
+        author = User.objects.create_user("benchmark")
+        create_recipes(args.pages * args.per_page, author)
+        Recipe.objects.update(like_count=F("id") % 50 + 1, rating_count=F("id") % 20)
+        # Every twentieth recipe unrated; averages from 1 to 5
+        Recipe.objects.filter(rating_count__gt=0).update(
+            rating_sum=F("rating_count") * (F("id") % 5 + 1), rating_average=F("id") % 5 + 1,
+        )
+
+        page_numbers = [n for n in (1, 10, 100, 1000, 10_000, 100_000) if n <= args.pages]
+        print(f"{args.pages * args.per_page} recipes, {args.per_page} per page, "
+              f"{args.repeat} runs each (ms)")
+
+        for sort, ordering in SORTS.items():
+            queryset = Recipe.objects.with_stats().filter(**FILTERS.get(sort, {})).order_by(*ordering)
+            keyset = KeysetPaginator(queryset, ordering, args.per_page)
+
+            for number in page_numbers:
+                def offset_page():
+                    list(Paginator(queryset, args.per_page).get_page(number))
+
+                cursor = None
+                if number > 1:
+                    boundary = queryset[(number - 1) * args.per_page - 1]
+                    cursor = keyset.cursor_for(boundary, "next")
+
+                def keyset_page():
+                    list(keyset.get_page(cursor))
+
+                print(f"{sort:11} page {number:<7} offset {summarize(measure(offset_page, args.repeat))}")
+                print(f"{sort:11} page {number:<7} keyset {summarize(measure(keyset_page, args.repeat))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Build time of the item-to-item recommendations as the engagement history
+grows, and the cost of reading them back.
+
+    python -m benchmarks.recommendations --interactions 10000 50000 100000 200000
+
+Users and recipes are drawn from power laws, as in real traffic: a few
+heavy users, a few very popular recipes and a long tail of both.
+"""
+import argparse
+import random
+import time
+
+from . import benchmark_database, create_recipes, measure, setup, summarize
+
+
+def synthetic_interactions(count, users, recipes, seed=0):
+    rng = random.Random(seed)
+    user_weights = [1 / rank for rank in range(1, users + 1)]
+    recipe_weights = [1 / rank ** 0.8 for rank in range(1, recipes + 1)]
+    user_ids = rng.choices(range(users), user_weights, k=count)
+    recipe_ids = rng.choices(range(1, recipes + 1), recipe_weights, k=count)
+    return [(user, recipe, rng.choice((1.0, 1.0, 2.0))) for user, recipe in zip(user_ids, recipe_ids)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interactions", type=int, nargs="+", default=[10000, 50000, 100000, 200000])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+
+    from recipes.models import Recipe, RecipeNeighbor
+    from recipes.recommendations import compute_neighbors, recommended_for, similar_recipes, store_neighbors
+
+    print(f"{args.users} users, {args.recipes} recipes")
+    neighbors = {}
+    for count in args.interactions:
+        data = synthetic_interactions(count, args.users, args.recipes)
+        begin = time.perf_counter()
+        neighbors = compute_neighbors(data)
+        elapsed = time.perf_counter() - begin
+        pairs = sum(len(ranked) for ranked in neighbors.values())
+        print(f"{count:>8} interactions: computed in {elapsed:6.2f}s, {len(neighbors)} recipes, {pairs} neighbours")
+
+    with benchmark_database():
+        author = User.objects.create_user("benchmark")
+        create_recipes(args.recipes, author)
+        recipes = list(Recipe.objects.order_by("pk"))
+        # Map the synthetic ids onto real rows
+        ids = {number: recipe.pk for number, recipe in enumerate(recipes, start=1)}
+        mapped = {
+            ids[recipe_id]: [(ids[neighbor], score) for neighbor, score in ranked]
+            for recipe_id, ranked in neighbors.items()
+        }
+        begin = time.perf_counter()
+        written = store_neighbors(mapped)
+        print(f"stored {written} neighbours in {time.perf_counter() - begin:.2f}s")
+        assert RecipeNeighbor.objects.count() == written
+
+        from django.core.cache import cache
+
+        popular = recipes[0]
+        print(f"similar_recipes, uncached  {summarize(measure(lambda: (cache.clear(), similar_recipes(popular)), args.repeat))}")
+        print(f"similar_recipes, cached    {summarize(measure(lambda: similar_recipes(popular), args.repeat))}")
+
+        reader = User.objects.create_user("reader")
+        for recipe in recipes[:50]:
+            recipe.likes.add(reader)
+        print(f"recommended_for, uncached  {summarize(measure(lambda: (cache.clear(), recommended_for(reader)), args.repeat))}")
+
+
+if __name__ == "__main__":
+    main()
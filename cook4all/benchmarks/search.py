@@ -0,0 +1,42 @@
+"""
+Compare recipe search latency: the old icontains scan vs the indexed backend.
+
+    python -m benchmarks.search --recipes 100000
+"""
+import argparse
+import io
+
+from . import benchmark_database, create_recipes, measure, setup, summarize
+
+QUERIES = ("chicken", "spicy tofu", "garlic butter pasta", "choc", "vanilla honey oat", "zizizi")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    from recipes.models import Recipe
+    from recipes.search import IContainsSearchBackend, get_search_backend
+
+    with benchmark_database():
+        author = User.objects.create_user("benchmark")
+        create_recipes(args.recipes, author)
+        call_command("rebuild_search_index", batch_size=5000, stdout=io.StringIO())
+
+        backends = {"icontains": IContainsSearchBackend(), "indexed": get_search_backend()}
+        print(f"{args.recipes} recipes, first page of 6 results, {args.repeat} runs each (ms)")
+        for query in QUERIES:
+            for name, backend in backends.items():
+                def run():
+                    list(backend.search(Recipe.objects.order_by("-created_at"), query)[:6])
+                print(f"{query!r:24} {name:10} {summarize(measure(run, args.repeat))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Load test of the main pages and endpoints on production-scale data, with a
+JSON report to diff between commits.
+
+    python -m benchmarks.site --output before.json
+    git checkout my-branch
+    python -m benchmarks.site --output after.json --compare before.json
+
+The database is filled by recipes.seeding (as `manage.py seed_scale`), then
+each scenario sends `--requests` requests through the Django test client,
+as anonymous visitors or as a logged-in user, and records the latency
+percentiles and the queries per request. Recipes are picked by the same
+power law as the seeded likes, so most requests hit popular recipes, as
+in production; the page cache is on, as in production.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from . import benchmark_database, setup, summarize
+
+FILTERS = ("", "most_liked", "top_rated", "breakfast", "dinner", "snack", "dessert", "other")
+SEARCHES = ("chicken", "pasta", "lemon", "curry", "chocolate cake", "garlic butter", "tofu bowl", "spicy")
+
+
+def scenarios(rng, recipe_ids, weights):
+    """(name, viewer, method, url factory) for every measured request kind."""
+    from django.urls import reverse
+
+    def popular_recipe():
+        return rng.choices(recipe_ids, cum_weights=weights)[0]
+
+    def list_url(filter_option):
+        def url():
+            params = {"page": rng.randint(1, 5)}
+            if filter_option:
+                params["filter"] = filter_option
+            return reverse("recipe_list"), params
+        return url
+
+    yield "home", "anonymous", "get", lambda: (reverse("home"), {})
+    yield "home", "user", "get", lambda: (reverse("home"), {})
+    for filter_option in FILTERS:
+        for viewer in ("anonymous", "user"):
+            yield f"list[{filter_option or 'all'}]", viewer, "get", list_url(filter_option)
+    yield "list[search]", "anonymous", "get", lambda: (reverse("recipe_list"), {"q": rng.choice(SEARCHES)})
+    for viewer in ("anonymous", "user"):
+        yield "detail", viewer, "get", lambda: (reverse("recipe_detail", args=[popular_recipe()]), {})
+    yield "ajax_search", "anonymous", "get", lambda: (reverse("ajax_search_recipes"), {"q": rng.choice(SEARCHES)})
+    # Toggles are sent twice per recipe on average, so likes come and go
+    yield "api_toggle_like", "user", "post", lambda: (reverse("api_toggle_like", args=[popular_recipe()]), {})
+    yield "api_toggle_save", "user", "post", lambda: (reverse("api_toggle_save", args=[popular_recipe()]), {})
+    yield "toggle_like", "user", "post", lambda: (reverse("recipe_like", args=[popular_recipe()]), {})
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, previous):
+    """Print the change in latency and queries against an earlier report."""
+    print(f"\nAgainst {previous['meta'].get('commit') or 'previous report'}:")
+    print(f"{'scenario':32} {'p50 ms':>17} {'p95 ms':>17} {'queries':>13}")
+    for key, result in report["scenarios"].items():
+        before = previous["scenarios"].get(key)
+        if before is None:
+            print(f"{key:32} (new)")
+            continue
+        cells = []
+        for metric in ("p50", "p95"):
+            old, new = before[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0
+            cells.append(f"{old:6.1f} → {new:6.1f} {change:+4.0f}%")
+        cells.append(f"{before['queries']['mean']:5.1f} → {result['queries']['mean']:5.1f}")
+        print(f"{key:32} " + " ".join(f"{cell:>17}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--likes", type=int, default=100000)
+    parser.add_argument("--saves", type=int, default=20000)
+    parser.add_argument("--ratings", type=int, default=30000)
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per scenario.")
+    parser.add_argument("--output", default="site-report.json")
+    parser.add_argument("--compare", help="An earlier report to compare with.")
+    args = parser.parse_args()
+
+    setup()
+    import django
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    from recipes.models import Recipe
+    from recipes.seeding import seed, zipf_weights
+
+    # As in production; the queries are still captured per request
+    settings.DEBUG = False
+
+    with benchmark_database():
+        started = time.perf_counter()
+        counts = seed(
+            users=args.users, recipes=args.recipes, likes=args.likes, saves=args.saves,
+            ratings=args.ratings, comments=args.comments,
+        )
+        print(f"seeded {counts} in {time.perf_counter() - started:.0f}s")
+
+        # The most liked recipes first, weighted like the seeded popularity
+        recipe_ids = list(Recipe.objects.order_by("-like_count", "pk").values_list("pk", flat=True))
+        weights = zipf_weights(len(recipe_ids), 1.1)
+        user = User.objects.order_by("pk").first()
+        clients = {"anonymous": Client(), "user": Client()}
+        clients["user"].force_login(user)
+
+        rng = random.Random(0)
+        results = {}
+        for name, viewer, method, make_url in scenarios(rng, recipe_ids, weights):
+            client = clients[viewer]
+            send = getattr(client, method)
+            for url, params in (make_url() for _ in range(args.warmup)):
+                send(url, params)
+
+            timings, queries, statuses = [], [], set()
+            for _ in range(args.requests):
+                url, params = make_url()
+                with CaptureQueriesContext(connection) as captured:
+                    begin = time.perf_counter()
+                    response = send(url, params)
+                    timings.append((time.perf_counter() - begin) * 1000)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+
+            key = f"{name} ({viewer})"
+            results[key] = {
+                **summarize(timings),
+                "queries": {
+                    "mean": round(statistics.fmean(queries), 2),
+                    "p95": sorted(queries)[int(len(queries) * 0.95) - 1],
+                    "max": max(queries),
+                },
+                "status": sorted(statuses),
+            }
+            print(
+                f"{key:32} p50 {results[key]['p50']:7.2f}  p95 {results[key]['p95']:7.2f}  "
+                f"p99 {results[key]['p99']:7.2f} ms  queries {results[key]['queries']['mean']:5.2f} "
+                f"(max {results[key]['queries']['max']})  {results[key]['status']}"
+            )
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "data": counts,
+            "requests": args.requests,
+            "argv": sys.argv[1:],
+        },
+        "scenarios": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as stream:
+        json.dump(report, stream, indent=2)
+    print(f"report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as stream:
+            compare(report, json.load(stream))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Throughput of `import_recipes` / `export_recipes`.
+
+    python -m benchmarks.transfer --recipes 100000
+
+Writes a JSON Lines file of random recipes, imports it with and without the
+indexes and with several worker counts, emptying the recipe tables between
+runs, then exports it back as JSON Lines and CSV.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+from . import benchmark_database, sentence, setup
+
+
+def write_file(path, count, authors=500, seed=0):
+    rng = random.Random(seed)
+    categories = ["breakfast", "dinner", "snack", "dessert", "other"]
+    with open(path, "w", encoding="utf-8") as stream:
+        for _ in range(count):
+            stream.write(json.dumps({
+                "title": sentence(rng, 3, food_ratio=0.67).title(),
+                "description": sentence(rng, 20),
+                "ingredients": "\n".join(sentence(rng, 2, food_ratio=0.5) for _ in range(6)),
+                "instructions": sentence(rng, 60, food_ratio=0.05),
+                "category": rng.choice(categories),
+                "author": f"author{rng.randrange(authors)}",
+            }) + "\n")
+
+
+def clear(connection):
+    """Empty the recipe tables, faster than a cascading delete."""
+    from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeSignature, SignatureBucket
+    from recipes.search import SQLiteFTS5SearchBackend
+
+    with connection.cursor() as cursor:
+        for model in (SignatureBucket, RecipeSignature, RecipeIngredient, Ingredient, Recipe):
+            cursor.execute(f"DELETE FROM {model._meta.db_table}")
+        if connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {SQLiteFTS5SearchBackend.table}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+
+    # As in production: no query log kept for every insert
+    settings.DEBUG = False
+
+    from recipes.models import Recipe
+    from recipes.transfer import export_recipes, import_recipes
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "recipes.jsonl")
+        write_file(source, args.recipes)
+        print(f"{args.recipes} recipes, {os.path.getsize(source) / 2 ** 20:.0f} MiB of JSON Lines")
+
+        runs = [(index, workers) for index in (False, True) for workers in args.workers]
+        with benchmark_database() as connection:
+            for index, workers in runs:
+                clear(connection)
+                begin = time.perf_counter()
+                with open(source, encoding="utf-8") as stream:
+                    result = import_recipes(stream, "jsonl", batch_size=args.batch_size, workers=workers,
+                                            create_authors=True, index=index)
+                elapsed = time.perf_counter() - begin
+                assert result.imported == args.recipes and Recipe.objects.count() == args.recipes
+                print(
+                    f"import  workers={workers} index={'yes' if index else 'no '}  {elapsed:6.1f}s  "
+                    f"{args.recipes / elapsed:8,.0f} recipes/s"
+                )
+
+            for format in ("jsonl", "csv"):
+                target = os.path.join(directory, f"export.{format}")
+                begin = time.perf_counter()
+                with open(target, "w", newline="", encoding="utf-8") as stream:
+                    count = export_recipes(stream, format)
+                elapsed = time.perf_counter() - begin
+                print(f"export  {format:5}                 {elapsed:6.1f}s  {count / elapsed:8,.0f} recipes/s")
+
+        # Linux reports kilobytes. Mostly the in-memory test database itself.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+        print(f"peak RSS {peak:.0f} MiB")
+
+if __name__ == "__main__":
+    main()
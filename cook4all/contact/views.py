@@ -1,6 +1,10 @@
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
+from instrumentation import metrics
+
+MESSAGES = metrics.counter("contact_messages_total", "Messages sent through the contact form.")
+
 
 class ContactView(TemplateView):
     template_name = "contact/contact.html"
@@ -10,6 +14,7 @@ class ContactView(TemplateView):
         name = request.POST.get("name")
         email = request.POST.get("email")
         message = request.POST.get("message")
+        MESSAGES.inc()
         context = {
             "success": True,
             "name": name,
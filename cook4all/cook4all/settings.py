@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 import os
 
 if os.path.isfile('env.py'):
@@ -50,6 +51,10 @@ INSTALLED_APPS = [
     'widget_tweaks',
     'about',
     'contact',
+    'images',
+    'tasks',
+    'instrumentation',
+    'replicas',
 
     # django-allauth
     'django.contrib.sites',          # REQUIRED
@@ -60,6 +65,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'instrumentation.middleware.InstrumentationMiddleware',
+    # Before anything that reads the database (sessions, auth)
+    'replicas.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,13 +102,178 @@ WSGI_APPLICATION = 'cook4all.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DATABASE_PROFILE picks one of two set-ups:
+#
+# sqlite (default): a file next to the project, in WAL mode so readers never
+# wait for the writer and the writer never waits for readers. Transactions
+# start with BEGIN IMMEDIATE, taking the write lock up front: a transaction
+# that read first and then tried to write could otherwise fail at once with
+# "database is locked" instead of waiting. busy_timeout is how long a writer
+# waits for another to finish. synchronous=NORMAL is durable in WAL mode
+# except for the last transactions on power loss.
+#
+# postgresql: POSTGRES_DB / _USER / _PASSWORD / _HOST / _PORT, with a
+# connection pool per process (needs psycopg[pool]); POSTGRES_POOL=0 keeps
+# persistent connections instead, e.g. behind PgBouncer.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
+# Seconds a connection is kept for the next request (0 closes it after each
+# request); CONN_HEALTH_CHECKS tests a reused connection before handing it out.
+# Under ASGI (cook4all/asgi.py sets DJANGO_ASGI=1) the async views run their
+# database work in executor threads, whose connections would outlive the
+# request, so persistent connections default to off there, as Django's docs
+# advise; the PostgreSQL pool is the way to reuse connections under ASGI.
+SERVED_BY_ASGI = os.environ.get('DJANGO_ASGI', '') == '1'
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', '0' if SERVED_BY_ASGI else '600'))
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,
+    # Negative: KiB, so 64 MiB of page cache per connection
+    'cache_size': -64000,
+    # Reads of the first 256 MiB of the file go through the OS page cache
+    'mmap_size': 256 * 2 ** 20,
+    'temp_store': 'MEMORY',
 }
 
+if DATABASE_PROFILE == 'postgresql':
+    POSTGRES_POOL = os.environ.get('POSTGRES_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'cook4all'),
+            'USER': os.environ.get('POSTGRES_USER', 'cook4all'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # A pool replaces persistent connections; Django refuses both
+            'CONN_MAX_AGE': 0 if POSTGRES_POOL else DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': not POSTGRES_POOL,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', '10')),
+                    # Seconds a request waits for a free connection
+                    'timeout': 10,
+                },
+            } if POSTGRES_POOL else {},
+        }
+    }
+elif DATABASE_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                # Seconds, for the lock taken by BEGIN IMMEDIATE itself
+                'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+                'init_command': '; '.join(
+                    f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DATABASE_PROFILE must be 'sqlite' or 'postgresql', not {DATABASE_PROFILE!r}")
+
+# Read replicas (replicas.router): requests read from them, writes and the
+# reads that follow a write go to 'default'. POSTGRES_REPLICA_HOSTS lists
+# streaming replicas; SQLITE_REPLICAS=2 adds two local copies of the SQLite
+# file, refreshed by `manage.py replicate_sqlite --interval 2`, to try the
+# routing on one machine. Tests read the replicas from 'default' (MIRROR).
+DATABASE_REPLICAS = []
+if DATABASE_PROFILE == 'postgresql':
+    replica_hosts = [host.strip() for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host.strip()]
+    replica_settings = [{'HOST': host} for host in replica_hosts]
+else:
+    primary_path = Path(DATABASES['default']['NAME'])
+    replica_settings = [
+        {'NAME': primary_path.with_name(f'{primary_path.stem}-replica{number}{primary_path.suffix}')}
+        for number in range(1, int(os.environ.get('SQLITE_REPLICAS', '0')) + 1)
+    ]
+for number, overrides in enumerate(replica_settings, start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+        **overrides,
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['replicas.router.ReplicaRouter']
+# Seconds a visitor reads from the primary after writing: longer than the
+# replicas usually lag, so they see their own likes, ratings and comments
+REPLICA_PIN_SECONDS = 5
+# Seconds between health checks of a replica, per process
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default (per process). Set CACHE_DIR to share one cache
+# between processes on a single machine, or REDIS_URL for a shared cache
+# across machines in production.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cook4all',
+        }
+    }
+
+# Seconds an anonymous page / a recipe fragment stays cached; a change to
+# the recipe retires it sooner (see recipes/caching.py)
+RECIPES_PAGE_CACHE_TIMEOUT = 300
+RECIPES_FRAGMENT_CACHE_TIMEOUT = 3600
+
+# How the recipe list pages: "page" for numbered pages, "keyset" for
+# previous/next cursors that seek on an index however deep the page (see
+# recipes/pagination.py). A request that carries a cursor is always served
+# by keyset; searches always get numbered pages, ordered by relevance.
+RECIPES_LIST_PAGINATION = os.environ.get('RECIPES_LIST_PAGINATION', 'page')
+
+# Sessions
+# Read from the cache and only written through to the database when they
+# change. Set SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+# to keep sessions in a signed cookie instead, with no server-side storage.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Seconds browsers and proxies may reuse an anonymous recipe page or search
+# result before revalidating it (logged-in pages always revalidate)
+RECIPES_HTTP_MAX_AGE = 60
+
+# "You might also like" (recipes/recommendations.py), rebuilt by
+# `manage.py build_recommendations`: neighbours kept per recipe, damping for
+# pairs with few users in common, and seconds a user's feed is cached
+RECIPES_RECOMMENDATION_NEIGHBORS = 20
+RECIPES_RECOMMENDATION_SHRINK = 10.0
+RECIPES_FEED_CACHE_TIMEOUT = 300
+
+# Estimated share of wording two recipes must have in common to be flagged
+# as duplicates when one is posted (recipes/duplicates.py)
+RECIPES_DUPLICATE_THRESHOLD = 0.7
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -173,4 +347,53 @@ CLOUDINARY_STORAGE = {
 
 MEDIA_URL = '/media/'
 # Use Cloudinary for media storage
-DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
\ No newline at end of file
+DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+
+# Generated image renditions (images.pipeline). Local files by default;
+# with Cloudinary configured they are uploaded there alongside the originals.
+if os.environ.get('CLOUDINARY_CLOUD_NAME'):
+    IMAGES_STORAGE = {
+        'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage',
+    }
+else:
+    IMAGES_STORAGE = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': BASE_DIR / 'media' / 'images',
+            'base_url': MEDIA_URL + 'images/',
+        },
+    }
+
+# Background task queue (tasks.queue); run workers with `manage.py runworker`
+# Unless TASKS_ALWAYS_EAGER is set, a worker must be running: saved recipes are
+# only (re)indexed for search, ingredients and duplicates (recipes.signals) and
+# uploads only get their variants once it runs
+TASKS_ALWAYS_EAGER = os.environ.get('TASKS_ALWAYS_EAGER', '') == '1'
+# Seconds before a task left "running" by a dead worker is queued again
+TASKS_LOCK_TIMEOUT = 600
+# Days finished tasks (and their idempotency keys) are kept
+TASKS_RETENTION_DAYS = 7
+
+# Request instrumentation (instrumentation.middleware): Server-Timing headers,
+# per-view latency histograms at /_instrumentation/ and slow-request profiles
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1') == '1'
+# Seconds of traffic the histograms cover
+INSTRUMENTATION_WINDOW = 300
+# Runs of one SQL statement in a request that are logged as an N+1 pattern
+INSTRUMENTATION_DUPLICATE_QUERIES = 3
+# Share of requests run under cProfile (0 disables, 0.01 profiles 1 in 100)
+INSTRUMENTATION_PROFILE_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_PROFILE_SAMPLE_RATE', '0'))
+# Profiled requests at least this slow are written to INSTRUMENTATION_PROFILE_DIR
+INSTRUMENTATION_PROFILE_THRESHOLD_MS = 500
+INSTRUMENTATION_PROFILE_DIR = BASE_DIR / 'cprofile'
+# Newest profiles kept; older ones are deleted
+INSTRUMENTATION_PROFILE_KEEP = 50
+
+# Prometheus metrics at /metrics (instrumentation.metrics). Scrapers send
+# "Authorization: Bearer <METRICS_TOKEN>"; without it only staff see them.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# With several worker processes: a directory shared by them, emptied at
+# server start, where each writes its values for /metrics to add up
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR', '')
+# Seconds between a worker's writes to that directory
+METRICS_FLUSH_INTERVAL = 1.0
@@ -28,6 +28,7 @@ urlpatterns = [
     path('about/', include('about.urls')),
     path('contact/', include('contact.urls')),
     path("profile/", include("users.urls")),
+    path("", include("instrumentation.urls")),
 ]
 
 # if settings.DEBUG:
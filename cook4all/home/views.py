@@ -6,8 +6,14 @@ from django.contrib.auth import logout
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 
-from recipes.models import Recipe, Rating
-from django.db.models import Count, Avg
+from recipes.models import Recipe
+from recipes import engagement
+from recipes.caching import attach_cache_versions, cache_anonymous_page
+from recipes.leaderboards import get_leaderboards
+from recipes.recommendations import recommended_for
+from instrumentation import metrics
+
+REGISTRATIONS = metrics.counter("users_registrations_total", "Accounts created through the sign-up form.")
 
 
 @login_required
@@ -21,24 +27,25 @@ def logout_view(request):
     return redirect("home")
 
 
+@cache_anonymous_page()
 def home(request):
+    leaderboards = get_leaderboards(request.user)
+
     # ⭐ Top 3 Most Liked Recipes
-    top_recipes = (
-        Recipe.objects
-        .annotate(total_likes_count=Count("likes"))  # "likes" = ManyToManyField
-        .order_by("-total_likes_count")[:3]
-    )
-
-    # ⭐ Top 3 Rated Recipes
-    top_rated = (
-        Recipe.objects
-        .annotate(avg_rating=Avg("ratings__value"))  # average rating from Rating model
-        .order_by("-avg_rating")[:3]
-    )
+    top_recipes = leaderboards["liked"][:3]
+
+    # ⭐ Top 3 Rated Recipes (Bayesian average, see recipes.leaderboards)
+    top_rated = leaderboards["rated"][:3]
+
+    attach_cache_versions(top_recipes + top_rated)
+
+    # Picked from what the user liked, saved and rated (see recipes.recommendations)
+    recommended = recommended_for(request.user) if request.user.is_authenticated else []
 
     return render(request, 'home/home.html', {
         "top_recipes": top_recipes,
-        "top_rated": top_rated
+        "top_rated": top_rated,
+        "recommended": recommended,
     })
 
 
@@ -48,6 +55,7 @@ def register(request):
         form = UserCreationForm(request.POST)
         if form.is_valid():
             form.save()
+            REGISTRATIONS.inc()
             messages.success(request, 'Account created successfully! You can now log in.')
             return redirect('login')
     else:
@@ -58,23 +66,14 @@ def register(request):
 
 @login_required
 def toggle_like(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-
-    if request.user in recipe.likes.all():
-        recipe.likes.remove(request.user)
-    else:
-        recipe.likes.add(request.user)
-
+    recipe = get_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    engagement.toggle_like(recipe, request.user)
     return redirect(request.META.get("HTTP_REFERER", "recipe_list"))
 
 
 @login_required
 def toggle_save(request, pk):
     """Save or unsave a recipe for the logged-in user."""
-    recipe = get_object_or_404(Recipe, pk=pk)
-    user = request.user
-    if user in recipe.saved_by.all():
-        recipe.saved_by.remove(user)
-    else:
-        recipe.saved_by.add(user)
+    recipe = get_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    engagement.toggle_save(recipe, request.user)
     return redirect(request.META.get("HTTP_REFERER", "recipe_list"))
@@ -0,0 +1,181 @@
+"""
+Responsive image variants for uploaded pictures.
+
+An upload is copied into the image storage as the "original" and the
+request returns straight away. After the transaction commits, a task on
+the background queue (see tasks.queue) decodes the original once and
+writes WebP (and AVIF, where Pillow supports it) renditions at every
+width of the variants the model uses.
+It then records them in the model's `image_variants` JSON field:
+
+    {"source": "<digest>",
+     "card": {"avif": [[320, "<name>"], [640, "<name>"]], "webp": [...]},
+     ...}
+
+Until that happens the field only holds the pending "source" digest. Pages
+then fall back to the original URL.
+
+Renditions are stored under the original's content digest, so their URLs
+never change meaning and can be cached forever. A newer upload simply
+supersedes an older one: a worker only records its variants if its digest
+is still the current source.
+"""
+import hashlib
+import io
+import os
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from tasks.queue import task
+
+from .storage import get_storage
+
+# Rendition widths in pixels: 1x and 2x (and wider) for the CSS size the
+# variant is shown at. Avatars are cropped square.
+VARIANTS = {
+    "card": (320, 640),
+    "detail": (800, 1200, 1600),
+    "avatar": (150, 300),
+}
+SQUARE_VARIANTS = {"avatar"}
+
+# Models with an image_variants field: the variants each one gets
+SOURCES = {
+    "recipes.recipe": ("card", "detail"),
+    "users.profile": ("avatar",),
+}
+
+# Best first; a <picture> offers them in this order
+FORMATS = {
+    "avif": {"format": "AVIF", "quality": 55},
+    "webp": {"format": "WEBP", "quality": 78, "method": 6},
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if features.check(name)]
+
+
+def _label(instance):
+    return instance._meta.label_lower
+
+
+def _original_name(label, pk, digest, extension):
+    return f"originals/{label}/{pk}/{digest}{extension}"
+
+
+# ---------------------------------------
+# Rendering
+# ---------------------------------------
+def _prepare(original):
+    image = ImageOps.exif_transpose(Image.open(original))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    return image
+
+
+def render_variants(original, variants):
+    """
+    Resize the image file `original` for each of `variants`.
+
+    Yields (variant, format, width, bytes). Widths wider than the original
+    are skipped, but every variant gets at least one rendition.
+    """
+    image = _prepare(original)
+    formats = available_formats()
+
+    for variant in variants:
+        square = variant in SQUARE_VARIANTS
+        source_width = min(image.size) if square else image.width
+        widths = [width for width in VARIANTS[variant] if width <= source_width] or [source_width]
+
+        for width in widths:
+            if square:
+                resized = ImageOps.fit(image, (width, width), Image.Resampling.LANCZOS)
+            else:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+            for name in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, **FORMATS[name])
+                yield variant, name, width, buffer.getvalue()
+
+
+# ---------------------------------------
+# Jobs
+# ---------------------------------------
+@task(max_attempts=3, backoff=60)
+def generate_variants(label, pk, digest, original_name):
+    """Background job: render and store the variants for one upload."""
+    storage = get_storage()
+    variants = SOURCES[label]
+
+    with storage.open(original_name) as original:
+        renditions = list(render_variants(original, variants))
+
+    manifest = {"source": digest}
+    for variant, name, width, content in renditions:
+        path = f"{label}/{pk}/{digest}/{variant}-{width}.{name}"
+        if not storage.exists(path):
+            path = storage.save(path, ContentFile(content))
+        manifest.setdefault(variant, {}).setdefault(name, []).append([width, path])
+
+    model = apps.get_model(label)
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk).first()
+        if instance is None or (instance.image_variants or {}).get("source") != digest:
+            # Deleted, or a newer upload has taken over
+            return None
+        instance.image_variants = manifest
+        # Also move auto_now timestamps: the pages showing it have changed
+        update_fields = ["image_variants"] + [
+            field.name for field in model._meta.concrete_fields if getattr(field, "auto_now", False)
+        ]
+        instance.save(update_fields=update_fields)
+    return manifest
+
+
+def schedule_variants(instance, upload):
+    """
+    Keep a copy of `upload` (an uploaded image file) for `instance` and
+    have its variants generated once the current transaction commits.
+    """
+    label = _label(instance)
+    if label not in SOURCES:
+        raise ValueError(f"{label} has no image variants configured")
+
+    upload.seek(0)
+    content = upload.read()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    extension = os.path.splitext(upload.name)[1].lower() or ".img"
+    storage = get_storage()
+    original_name = _original_name(label, instance.pk, digest, extension)
+    if not storage.exists(original_name):
+        original_name = storage.save(original_name, ContentFile(content))
+
+    # Mark the upload as pending; older renditions no longer apply
+    type(instance).objects.filter(pk=instance.pk).update(image_variants={"source": digest})
+    instance.image_variants = {"source": digest}
+
+    generate_variants.enqueue(
+        label, instance.pk, digest, original_name,
+        idempotency_key=f"images:{label}:{instance.pk}:{digest}",
+    )
+    return digest
+
+
+# ---------------------------------------
+# URLs
+# ---------------------------------------
+def srcsets(image_variants, variant):
+    """{format: "url 320w, url 640w"} for one variant, best format first."""
+    formats = (image_variants or {}).get(variant) or {}
+    storage = get_storage()
+    return {
+        name: ", ".join(f"{storage.url(path)} {width}w" for width, path in formats[name])
+        for name in FORMATS if name in formats
+    }
@@ -0,0 +1,18 @@
+"""
+Storage for uploaded originals and their renditions.
+
+settings.IMAGES_STORAGE takes the same shape as an entry of Django's
+STORAGES setting, so any storage class can be plugged in: the local
+filesystem in development and tests, Cloudinary (or S3, ...) in production.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+
+def get_storage():
+    config = getattr(settings, "IMAGES_STORAGE", None)
+    if not config:
+        return FileSystemStorage()
+    backend = import_string(config.get("BACKEND", "django.core.files.storage.FileSystemStorage"))
+    return backend(**config.get("OPTIONS", {}))
@@ -0,0 +1,38 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from ..pipeline import srcsets
+
+register = template.Library()
+
+# Rendered width of each variant, for the browser to pick a rendition
+DEFAULT_SIZES = {
+    "card": "(min-width: 768px) 33vw, 100vw",
+    "detail": "(min-width: 992px) 66vw, 100vw",
+    "avatar": "150px",
+}
+
+
+@register.simple_tag
+def picture(obj, variant, fallback_url, sizes=None, **attrs):
+    """
+    A <picture> offering `obj`'s generated renditions of `variant` (AVIF,
+    then WebP) with `fallback_url` as the <img> for everything else, e.g.
+
+        {% picture recipe "card" recipe.image.url alt=recipe.title class="card-img-top" %}
+
+    Until the renditions exist this is just the <img>.
+    """
+    attrs = {"src": fallback_url, "loading": "lazy", "decoding": "async", **attrs}
+    img = format_html("<img{}>", flatatt(attrs))
+
+    sets = srcsets(getattr(obj, "image_variants", None), variant)
+    if not sets:
+        return img
+
+    sources = format_html_join(
+        "", '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((name, srcset, sizes or DEFAULT_SIZES[variant]) for name, srcset in sets.items()),
+    )
+    return format_html("<picture>{}{}</picture>", sources, img)
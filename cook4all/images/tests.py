@@ -0,0 +1,127 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, ImageDraw
+
+from recipes.models import Recipe
+
+from .pipeline import available_formats, render_variants, schedule_variants
+from .storage import get_storage
+
+
+def photo(width=1800, height=1200, format="JPEG"):
+    """A photo-like test image: gradients and shapes rather than noise."""
+    image = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(image)
+    for y in range(height):
+        draw.line([(0, y), (width, y)], fill=(y * 255 // height, 120, 255 - y * 255 // height))
+    for i in range(12):
+        draw.ellipse([i * 140, i * 80, i * 140 + 300, i * 80 + 220], fill=(240, 200 - i * 10, 40))
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, quality=92)
+    return buffer.getvalue()
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(
+            TASKS_ALWAYS_EAGER=True,
+            MEDIA_ROOT=self.media,
+            IMAGES_STORAGE={
+                "BACKEND": "django.core.files.storage.FileSystemStorage",
+                "OPTIONS": {"location": self.media, "base_url": "/media/images/"},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = Recipe.objects.create(
+            author=self.user, title="Pancakes", description="", ingredients="", instructions="",
+        )
+
+    def upload(self, content=None, name="pancakes.jpg"):
+        return SimpleUploadedFile(name, content or photo(), content_type="image/jpeg")
+
+    def test_renders_every_width_and_format_without_upscaling(self):
+        renditions = list(render_variants(io.BytesIO(photo(1000, 500)), ("card", "detail", "avatar")))
+        sizes = {(variant, width) for variant, _, width, _ in renditions}
+        self.assertEqual(sizes, {
+            ("card", 320), ("card", 640), ("detail", 800), ("avatar", 150), ("avatar", 300),
+        })
+        self.assertEqual({name for _, name, _, _ in renditions}, set(available_formats()))
+
+        avatar = next(content for variant, _, width, content in renditions if variant == "avatar")
+        self.assertEqual(Image.open(io.BytesIO(avatar)).size, (150, 150))
+
+    def test_small_images_still_get_a_rendition(self):
+        renditions = list(render_variants(io.BytesIO(photo(200, 100)), ("card",)))
+        self.assertEqual({width for _, _, width, _ in renditions}, {200})
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            digest = schedule_variants(self.recipe, self.upload())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {"source": digest})
+
+        for callback in callbacks:
+            callback()
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants
+        self.assertEqual(sorted(variants["card"]), sorted(available_formats()))
+        self.assertEqual([width for width, _ in variants["card"]["webp"]], [320, 640])
+        self.assertEqual([width for width, _ in variants["detail"]["webp"]], [800, 1200, 1600])
+
+        storage = get_storage()
+        _, largest_card = variants["card"]["webp"][-1]
+        self.assertLess(storage.size(largest_card), len(photo()) / 5)
+
+    def test_newer_upload_wins(self):
+        with self.captureOnCommitCallbacks(execute=False) as first:
+            schedule_variants(self.recipe, self.upload(photo(900, 600)))
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = schedule_variants(self.recipe, self.upload(photo(1200, 900)))
+
+        # The older job finishing late must not replace the newer variants
+        for callback in first:
+            callback()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants["source"], newer)
+        self.assertIn(1200, [width for width, _ in self.recipe.image_variants["detail"]["webp"]])
+
+    def test_picture_tag(self):
+        template = Template(
+            '{% load responsive_images %}'
+            '{% picture recipe "card" "/original.jpg" alt=recipe.title class="card-img-top" %}'
+        )
+        html = template.render(Context({"recipe": self.recipe}))
+        self.assertNotIn("<picture>", html)
+        self.assertIn('src="/original.jpg"', html)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_variants(self.recipe, self.upload())
+        self.recipe.refresh_from_db()
+        html = template.render(Context({"recipe": self.recipe}))
+        self.assertIn('<source type="image/webp" srcset="/media/images/recipes.recipe/', html)
+        self.assertIn("320w, ", html)
+        self.assertIn('sizes="(min-width: 768px) 33vw, 100vw"', html)
+        self.assertIn('alt="Pancakes"', html)
+
+    def test_profile_upload_gets_avatar(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("edit_profile"), {
+                "bio": "Cook", "profile_image": self.upload(name="me.jpg"),
+            })
+        self.user.profile.refresh_from_db()
+        self.assertEqual(
+            [width for width, _ in self.user.profile.image_variants["avatar"]["webp"]], [150, 300]
+        )
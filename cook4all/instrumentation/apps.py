@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class InstrumentationConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'instrumentation'
+
+    def ready(self):
+        from .middleware import enabled, install_template_timing
+
+        if enabled():
+            install_template_timing()
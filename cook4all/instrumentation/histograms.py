@@ -0,0 +1,132 @@
+"""
+Rolling latency histograms, one per URL name, kept in process memory.
+
+Each histogram covers the last INSTRUMENTATION_WINDOW seconds, split into
+SLOTS slices: a request is counted in the current slice, and a slice older
+than the window is recycled, so old traffic ages out in steps of
+window / SLOTS without storing every request. Percentiles are estimated
+from the bucket counts by interpolating inside the bucket that holds them.
+
+Every worker process has its own histograms; /_instrumentation/ shows
+those of the process that serves it.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+# Upper bounds of the latency buckets, in milliseconds; one more bucket
+# holds everything slower
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+SLOTS = 10
+
+
+def window():
+    return getattr(settings, "INSTRUMENTATION_WINDOW", 300)
+
+
+class _Slot:
+    __slots__ = ("index", "buckets", "count", "total_ms", "max_ms", "queries", "db_ms")
+
+    def __init__(self, index):
+        self.index = index
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.db_ms = 0.0
+
+
+class RollingHistogram:
+    def __init__(self, seconds=None):
+        self.slot_seconds = (seconds or window()) / SLOTS
+        self.slots = [None] * SLOTS
+        self.lock = threading.Lock()
+
+    def record(self, ms, queries=0, db_ms=0.0, now=None):
+        index = int((time.time() if now is None else now) // self.slot_seconds)
+        with self.lock:
+            slot = self.slots[index % SLOTS]
+            if slot is None or slot.index != index:
+                slot = self.slots[index % SLOTS] = _Slot(index)
+            slot.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+            slot.count += 1
+            slot.total_ms += ms
+            slot.max_ms = max(slot.max_ms, ms)
+            slot.queries += queries
+            slot.db_ms += db_ms
+
+    def snapshot(self, now=None):
+        """Totals over the window: count, mean, max, p50/p95/p99 and buckets."""
+        current = int((time.time() if now is None else now) // self.slot_seconds)
+        buckets = [0] * (len(BUCKETS_MS) + 1)
+        count = queries = 0
+        total_ms = max_ms = db_ms = 0.0
+        with self.lock:
+            for slot in self.slots:
+                if slot is None or slot.index <= current - SLOTS:
+                    continue
+                buckets = [a + b for a, b in zip(buckets, slot.buckets)]
+                count += slot.count
+                total_ms += slot.total_ms
+                max_ms = max(max_ms, slot.max_ms)
+                queries += slot.queries
+                db_ms += slot.db_ms
+        if not count:
+            return {"count": 0}
+        return {
+            "count": count,
+            "mean_ms": round(total_ms / count, 2),
+            "max_ms": round(max_ms, 2),
+            **{f"p{q}_ms": round(percentile(buckets, q / 100, max_ms), 2) for q in (50, 95, 99)},
+            "queries_mean": round(queries / count, 2),
+            "db_ms_mean": round(db_ms / count, 2),
+            "buckets": {
+                (f"le_{bound}" if position < len(BUCKETS_MS) else "inf"): buckets[position]
+                for position, bound in enumerate(BUCKETS_MS + (None,))
+                if buckets[position]
+            },
+        }
+
+
+def percentile(buckets, quantile, max_ms):
+    """The `quantile` latency, assuming requests are spread evenly inside each bucket."""
+    rank = quantile * sum(buckets)
+    seen = 0
+    for position, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            lower = BUCKETS_MS[position - 1] if position else 0.0
+            upper = BUCKETS_MS[position] if position < len(BUCKETS_MS) else max_ms
+            return lower + (min(upper, max_ms) - lower) * (rank - seen) / count
+        seen += count
+    return max_ms
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+
+def record(name, ms, queries=0, db_ms=0.0):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, RollingHistogram())
+    histogram.record(ms, queries, db_ms)
+
+
+def snapshot():
+    """{URL name: histogram snapshot}, slowest p95 first; idle names are left out."""
+    with _lock:
+        histograms = list(_histograms.items())
+    snapshots = [(name, histogram.snapshot()) for name, histogram in histograms]
+    return dict(sorted(
+        ((name, data) for name, data in snapshots if data["count"]),
+        key=lambda item: -item[1]["p95_ms"],
+    ))
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
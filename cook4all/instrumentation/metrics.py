@@ -0,0 +1,296 @@
+"""
+Counters, gauges and histograms, served in the Prometheus text format at
+/metrics.
+
+Metrics are declared once, at import time, next to the code that updates
+them:
+
+    LIKES = metrics.counter("recipes_likes_total", "Likes added and removed.", ["action"])
+    LIKES.inc(action="add")
+
+Updating one is a dict lookup and an addition under a lock, one to two
+microseconds (see benchmarks/metrics.py).
+
+Values live in the memory of the process that updates them. With several
+worker processes (gunicorn, uWSGI), set METRICS_MULTIPROCESS_DIR to a
+directory shared by the workers and emptied when the server starts: each
+process then writes its values there, at most every METRICS_FLUSH_INTERVAL
+seconds, after a request, and /metrics adds up the files of all processes.
+Counters and histograms of processes that have exited are still counted,
+so totals don't drop when a worker is recycled; gauges only count live
+processes, summed or the maximum as the gauge declares.
+"""
+import atexit
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# Latency buckets in seconds, as Prometheus client libraries use by default
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def multiprocess_dir():
+    directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+    return Path(directory) if directory else None
+
+
+def flush_interval():
+    return getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if not labels and not self.labelnames:
+            return ()
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple([str(labels[name]) for name in self.labelnames])
+        except KeyError:
+            pass
+        raise ValueError(f"{self.name} takes the labels {', '.join(self.labelnames) or '(none)'}")
+
+    def dump(self):
+        """[[label values, value]] as JSON-friendly lists."""
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def samples(self, values):
+        """(suffix, label pairs, value) lines for the exposition format."""
+        for key, value in sorted(values.items()):
+            yield "", _labels(self.labelnames, key), value
+
+    def expose(self, values):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(
+            f"{self.name}{suffix}{labels} {_format_value(value)}"
+            for suffix, labels, value in self.samples(values)
+        )
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, total, value, live):
+        return (total or 0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), aggregate="sum"):
+        super().__init__(name, documentation, labelnames)
+        if aggregate not in ("sum", "max"):
+            raise ValueError("aggregate is 'sum' or 'max'")
+        self.aggregate = aggregate
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def merge(self, total, value, live):
+        if not live:
+            return total
+        if total is None:
+            return value
+        return max(total, value) if self.aggregate == "max" else total + value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            # Per-bucket counts (the last for values above every bound), sum
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[position] += 1
+            counts[-1] += value
+
+    def dump(self):
+        with self.lock:
+            return [[list(key), list(counts)] for key, counts in self.values.items()]
+
+    def merge(self, total, value, live):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values):
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", _labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative
+            yield "_sum", _labels(self.labelnames, key), counts[-1]
+            yield "_count", _labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flushed = 0.0
+
+    def register(self, cls, name, *args, **kwargs):
+        """The metric called `name`, created on first use; declaring it again returns it."""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already a {metric.type}")
+            return metric
+
+    def dump(self):
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    # Multiprocess mode
+    def flush(self, directory=None):
+        """Write this process's values to `directory`, replacing its previous file."""
+        directory = directory or multiprocess_dir()
+        if directory is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"metrics-{os.getpid()}.json"
+        # Unique per thread, as two requests may flush at once
+        temporary = directory / f"metrics-{os.getpid()}-{threading.get_ident()}.tmp"
+        temporary.write_text(json.dumps(self.dump()), encoding="utf-8")
+        os.replace(temporary, path)
+        self.flushed = time.monotonic()
+
+    def maybe_flush(self):
+        """flush() if multiprocess mode is on and the last one is older than the interval."""
+        if multiprocess_dir() is not None and time.monotonic() - self.flushed >= flush_interval():
+            self.flush()
+
+    def collect(self):
+        """{metric name: {label values: merged value}} over every process's file, or this process."""
+        directory = multiprocess_dir()
+        if directory is None:
+            return {name: {tuple(key): value for key, value in dump} for name, dump in self.dump().items()}
+
+        self.flush(directory)
+        merged = {name: {} for name in self.metrics}
+        for path in directory.glob("metrics-*.json"):
+            try:
+                dumps = json.loads(path.read_text(encoding="utf-8"))
+                live = _alive(int(path.stem.split("-", 1)[1]))
+            except (OSError, ValueError):
+                # Being replaced, or not ours
+                continue
+            for name, dump in dumps.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                values = merged[name]
+                for key, value in dump:
+                    key = tuple(key)
+                    total = metric.merge(values.get(key), value, live)
+                    if total is not None:
+                        values[key] = total
+        return merged
+
+    def expose(self):
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        collected = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.extend(metric.expose(collected.get(name, {})))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget every value (for tests); the metrics stay declared."""
+        for metric in self.metrics.values():
+            with metric.lock:
+                metric.values.clear()
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=(), aggregate="sum"):
+    return REGISTRY.register(Gauge, name, documentation, labelnames, aggregate=aggregate)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def _flush_at_exit():
+    if settings.configured and multiprocess_dir() is not None:
+        REGISTRY.flush()
+
+
+atexit.register(_flush_at_exit)
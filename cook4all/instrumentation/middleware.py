@@ -0,0 +1,259 @@
+"""
+Per-request measurements: SQL queries, DB time, repeated queries, template
+render time and total latency.
+
+Every request through InstrumentationMiddleware gets a RequestTimings. The
+queries of all database connections go through it (as an execute_wrapper,
+so nothing is kept when DEBUG is off), templates rendered while the request
+is handled add their time to it, and when the response is ready:
+
+- the numbers are sent as a Server-Timing header, which the browser's
+  developer tools show under Network > Timing (only with DEBUG on or to
+  staff users: query counts tell outsiders more than they should know);
+- the latency, query count and DB time go into the rolling histogram of the
+  view's URL name (instrumentation.histograms), and the request and its
+  queries are counted in the /metrics registry (instrumentation.metrics);
+- the same SQL run INSTRUMENTATION_DUPLICATE_QUERIES times or more, as a
+  template calling `recipe.comments.count` once per card does, is logged as
+  a warning on the "instrumentation" logger with the view name;
+- one request in 1 / INSTRUMENTATION_PROFILE_SAMPLE_RATE is run under
+  cProfile, and its stats are written to INSTRUMENTATION_PROFILE_DIR when it
+  took INSTRUMENTATION_PROFILE_THRESHOLD_MS or longer. Open them with
+  `python -m pstats <file>` or snakeviz.
+"""
+import cProfile
+import contextvars
+import itertools
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import histograms, metrics
+
+logger = logging.getLogger("instrumentation")
+
+REQUESTS = metrics.counter("http_requests_total", "Requests answered, by URL name.", ["view", "method", "status"])
+REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds", "Time to answer a request.", ["view"])
+IN_PROGRESS = metrics.gauge("http_requests_in_progress", "Requests being answered.")
+QUERY_SECONDS = metrics.histogram(
+    "db_query_duration_seconds", "Time of each SQL query run by a request.", ["alias"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# The timings of the request being handled, for the template hook
+_current = contextvars.ContextVar("instrumentation_timings", default=None)
+
+
+def enabled():
+    return getattr(settings, "INSTRUMENTATION_ENABLED", True)
+
+
+def duplicate_threshold():
+    return getattr(settings, "INSTRUMENTATION_DUPLICATE_QUERIES", 3)
+
+
+def profile_sample_rate():
+    return getattr(settings, "INSTRUMENTATION_PROFILE_SAMPLE_RATE", 0.0)
+
+
+def profile_threshold_ms():
+    return getattr(settings, "INSTRUMENTATION_PROFILE_THRESHOLD_MS", 500)
+
+
+def profile_dir():
+    return Path(getattr(settings, "INSTRUMENTATION_PROFILE_DIR", settings.BASE_DIR / "cprofile"))
+
+
+def profile_keep():
+    return getattr(settings, "INSTRUMENTATION_PROFILE_KEEP", 50)
+
+
+class RequestTimings:
+    """What one request spent, in milliseconds; also the connections' execute_wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.statements = Counter()
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        begin = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - begin
+            alias = context["connection"].alias
+            self.db_ms += seconds * 1000
+            self.queries += 1
+            self.statements[(alias, sql)] += 1
+            QUERY_SECONDS.observe(seconds, alias=alias)
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def duplicates(self, threshold):
+        """[(alias, sql, count)] for the statements run `threshold` times or more, most repeated first."""
+        return [
+            (alias, sql, count)
+            for (alias, sql), count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self, total_ms, duplicates):
+        entries = [
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"',
+            f"template;dur={self.template_ms:.1f}",
+            f"total;dur={total_ms:.1f}",
+        ]
+        if duplicates:
+            repeated = sum(count for _, _, count in duplicates)
+            entries.append(f'dup;desc="{repeated} repeated queries in {len(duplicates)} statements"')
+        return ", ".join(entries)
+
+
+def install_template_timing():
+    """
+    Wrap the Django template backend's render() so the time spent rendering
+    is added to the current request's timings. Templates included by a
+    template are part of its time and are not counted again.
+    """
+    from django.template.backends.django import Template
+
+    render = Template.render
+    if getattr(render, "instrumented", False):
+        return
+
+    def timed_render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None or timings.rendering:
+            return render(self, context, request)
+        timings.rendering = True
+        begin = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            timings.template_ms += (time.perf_counter() - begin) * 1000
+            timings.rendering = False
+
+    timed_render.instrumented = True
+    Template.render = timed_render
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match and match.view_name else "<unresolved>"
+
+
+_slug = re.compile(r"[^\w.-]+")
+# Tells apart profiles written by this process in the same second
+_dumps = itertools.count()
+
+
+def dump_profile(profiler, request, total_ms):
+    """Write the stats to the profile directory and keep only the newest files."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = (
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{total_ms:.0f}ms-{_slug.sub('_', view_name(request))}"
+        f"-{os.getpid()}.{next(_dumps)}.prof"
+    )
+    path = directory / name
+    profiler.dump_stats(path)
+    snapshots = sorted(directory.glob("*.prof"), key=lambda file: (file.stat().st_mtime_ns, file.name))
+    for stale in snapshots[:-profile_keep()]:
+        stale.unlink(missing_ok=True)
+    return path
+
+
+class InstrumentationMiddleware:
+    """
+    Put first in MIDDLEWARE, so the whole stack is measured. Works under
+    WSGI and ASGI; under ASGI requests are not profiled, as cProfile would
+    time every request the event loop interleaves with this one.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings = RequestTimings()
+        rate = profile_sample_rate()
+        profiler = cProfile.Profile() if rate and random.random() < rate else None
+        with self.measuring(timings):
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+
+        user = getattr(request, "user", None)
+        self.report(request, response, timings, user is not None and user.is_staff)
+        if profiler and timings.total_ms >= profile_threshold_ms():
+            path = dump_profile(profiler, request, timings.total_ms)
+            logger.info("%s took %.0f ms; profile written to %s", view_name(request), timings.total_ms, path)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        with self.measuring(timings):
+            response = await self.get_response(request)
+
+        # request.user would query the database from the event loop
+        is_staff = False
+        if not settings.DEBUG and hasattr(request, "auser"):
+            is_staff = (await request.auser()).is_staff
+        self.report(request, response, timings, is_staff)
+        return response
+
+    @contextmanager
+    def measuring(self, timings):
+        token = _current.set(timings)
+        IN_PROGRESS.inc()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                yield
+        finally:
+            _current.reset(token)
+            IN_PROGRESS.dec()
+
+    def report(self, request, response, timings, is_staff):
+        total_ms = timings.total_ms
+        name = view_name(request)
+        duplicates = timings.duplicates(duplicate_threshold())
+        for alias, sql, count in duplicates:
+            logger.warning("%s ran the same query %d times on %r: %s", name, count, alias, sql)
+        histograms.record(name, total_ms, timings.queries, timings.db_ms)
+        REQUESTS.inc(view=name, method=request.method, status=response.status_code)
+        REQUEST_SECONDS.observe(total_ms / 1000, view=name)
+
+        if settings.DEBUG or is_staff:
+            response["Server-Timing"] = timings.server_timing(total_ms, duplicates)
+        metrics.REGISTRY.maybe_flush()
@@ -0,0 +1,203 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.template import engines
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from recipes.models import Recipe
+
+from . import histograms
+from .histograms import RollingHistogram
+from .metrics import REGISTRY, Counter, Gauge, Histogram, Registry
+from .middleware import InstrumentationMiddleware
+
+
+class InstrumentationMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user("author", password="pw")
+        cls.staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        Recipe.objects.bulk_create([
+            Recipe(author=cls.author, title=f"Recipe {number}", ingredients="egg", instructions="Cook.")
+            for number in range(4)
+        ])
+
+    def setUp(self):
+        histograms.reset()
+
+    def test_server_timing_for_staff_only(self):
+        self.client.login(username="staff", password="pw")
+        response = self.client.get(reverse("recipe_list"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r"template;dur=[\d.]+")
+        self.assertRegex(timing, r"total;dur=[\d.]+")
+
+        self.client.login(username="author", password="pw")
+        self.assertNotIn("Server-Timing", self.client.get(reverse("recipe_list")))
+
+    def test_repeated_queries_are_flagged(self):
+        def per_card_counts(request):
+            for recipe in Recipe.objects.order_by("pk"):
+                recipe.comments.count()
+            return HttpResponse(engines["django"].from_string("{{ value }}").render({"value": 1}))
+
+        request = RequestFactory().get("/")
+        with self.settings(DEBUG=True), self.assertLogs("instrumentation", "WARNING") as logs:
+            response = InstrumentationMiddleware(per_card_counts)(request)
+        self.assertIn('dup;desc="4 repeated queries in 1 statements"', response["Server-Timing"])
+        self.assertIn("5 queries", response["Server-Timing"])
+        self.assertIn("ran the same query 4 times", logs.output[0])
+
+    def test_histogram_per_url_name(self):
+        for _ in range(3):
+            self.client.get(reverse("recipe_list"))
+        self.client.get(reverse("home"))
+        report = histograms.snapshot()
+        self.assertEqual(report["recipe_list"]["count"], 3)
+        self.assertEqual(report["home"]["count"], 1)
+        self.assertGreater(report["recipe_list"]["queries_mean"], 0)
+
+    def test_slow_sampled_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            INSTRUMENTATION_PROFILE_DIR=Path(directory), INSTRUMENTATION_PROFILE_SAMPLE_RATE=1.0,
+            INSTRUMENTATION_PROFILE_THRESHOLD_MS=0, INSTRUMENTATION_PROFILE_KEEP=2,
+        ):
+            for _ in range(3):
+                self.client.get(reverse("recipe_list"))
+            profiles = list(Path(directory).glob("*.prof"))
+            self.assertEqual(len(profiles), 2)
+            self.assertIn("recipe_list", profiles[0].name)
+
+            with self.settings(INSTRUMENTATION_PROFILE_THRESHOLD_MS=60000):
+                self.client.get(reverse("home"))
+            self.assertEqual(len(list(Path(directory).glob("*home*.prof"))), 0)
+
+    def test_report_is_staff_only(self):
+        self.client.get(reverse("recipe_list"))
+        self.client.login(username="author", password="pw")
+        self.assertEqual(self.client.get(reverse("instrumentation_report")).status_code, 404)
+
+        self.client.login(username="staff", password="pw")
+        report = self.client.get(reverse("instrumentation_report")).json()
+        self.assertIn("recipe_list", report["views"])
+
+
+class RollingHistogramTests(TestCase):
+    def test_percentiles_and_expiry(self):
+        histogram = RollingHistogram(seconds=100)
+        for ms in [4] * 90 + [150] * 10:
+            histogram.record(ms, queries=2, now=1000)
+        snapshot = histogram.snapshot(now=1000)
+        self.assertEqual(snapshot["count"], 100)
+        self.assertTrue(2 < snapshot["p50_ms"] <= 5)
+        self.assertTrue(100 < snapshot["p95_ms"] <= 150)
+        self.assertEqual(snapshot["max_ms"], 150)
+        self.assertEqual(snapshot["queries_mean"], 2)
+        self.assertEqual(snapshot["buckets"], {"le_5": 90, "le_200": 10})
+
+        histogram.record(30, now=1050)
+        self.assertEqual(histogram.snapshot(now=1050)["count"], 101)
+        # The first slice has left the window
+        self.assertEqual(histogram.snapshot(now=1101)["count"], 1)
+        self.assertEqual(histogram.snapshot(now=1200), {"count": 0})
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("user", password="pw")
+        cls.recipe = Recipe.objects.create(author=cls.user, title="Soup", ingredients="leek", instructions="Boil.")
+
+    def setUp(self):
+        REGISTRY.reset()
+
+    def make_registry(self):
+        registry = Registry()
+        hits = registry.register(Counter, "hits_total", "Hits.", ["page"])
+        busy = registry.register(Gauge, "busy", "Busy workers.")
+        latency = registry.register(Histogram, "latency_seconds", "Latency.", buckets=(0.1, 1))
+        return registry, hits, busy, latency
+
+    def test_exposition_format(self):
+        registry, hits, busy, latency = self.make_registry()
+        hits.inc(page="home")
+        hits.inc(2, page='say "hi"')
+        busy.set(3)
+        for seconds in (0.05, 0.1, 0.5, 4):
+            latency.observe(seconds)
+        lines = registry.expose().splitlines()
+        self.assertIn("# TYPE hits_total counter", lines)
+        self.assertIn('hits_total{page="home"} 1', lines)
+        self.assertIn('hits_total{page="say \\"hi\\""} 2', lines)
+        self.assertIn("busy 3", lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn("latency_seconds_count 4", lines)
+        self.assertIn("latency_seconds_sum 4.65", lines)
+        with self.assertRaises(ValueError):
+            hits.inc()
+
+    def test_processes_are_added_up(self):
+        registry, hits, busy, latency = self.make_registry()
+        hits.inc(page="home")
+        busy.set(2)
+        latency.observe(0.5)
+        # A worker that has exited: its counters still count, its gauges don't
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                capture_output=True, text=True, check=True)
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_MULTIPROCESS_DIR=directory):
+            Path(directory, f"metrics-{exited.stdout.strip()}.json").write_text(json.dumps({
+                "hits_total": [[["home"], 5], [["list"], 1]],
+                "busy": [[[], 7]],
+                "latency_seconds": [[[], [1, 0, 0, 0.05]]],
+            }))
+            lines = registry.expose().splitlines()
+            self.assertTrue(Path(directory, f"metrics-{os.getpid()}.json").exists())
+        self.assertIn('hits_total{page="home"} 6', lines)
+        self.assertIn('hits_total{page="list"} 1', lines)
+        self.assertIn("busy 2", lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn("latency_seconds_count 2", lines)
+
+    def test_requests_and_engagement_are_counted(self):
+        self.client.login(username="user", password="pw")
+        self.client.post(reverse("api_toggle_like", args=[self.recipe.pk]))
+        self.client.post(reverse("api_toggle_like", args=[self.recipe.pk]))
+        self.client.post(reverse("recipe_rate", args=[self.recipe.pk]), {"rating": 4})
+        self.client.post(reverse("add_comment", args=[self.recipe.pk]), {"content": "Nice"})
+        self.client.get(reverse("recipe_list"), {"q": "soup"})
+        self.client.get(reverse("recipe_list"))
+
+        with self.settings(METRICS_TOKEN="secret"):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        for line in (
+            'recipes_likes_total{action="add"} 1',
+            'recipes_likes_total{action="remove"} 1',
+            'recipes_ratings_total{action="new"} 1',
+            'recipes_comments_total{action="add"} 1',
+            'recipes_searches_total{kind="list"} 1',
+            'http_requests_total{view="recipe_list",method="GET",status="200"} 2',
+            'http_requests_total{view="api_toggle_like",method="POST",status="200"} 2',
+        ):
+            self.assertIn(line, lines)
+        self.assertTrue(any(line.startswith('db_query_duration_seconds_count{alias="default"}') for line in lines))
+
+    def test_scraping_needs_token_or_staff(self):
+        with self.settings(METRICS_TOKEN="secret", DEBUG=False):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+            self.assertEqual(
+                self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong").status_code, 404,
+            )
+            self.client.force_login(User.objects.create_user("staff", is_staff=True))
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("_instrumentation/", views.report, name="instrumentation_report"),
+    path("metrics", views.metrics, name="metrics"),
+]
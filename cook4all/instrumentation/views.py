@@ -0,0 +1,40 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+
+from . import histograms
+from .metrics import REGISTRY
+from .middleware import profile_dir
+
+
+def report(request):
+    """The latency histograms of this process and the saved profiles, for staff."""
+    if not request.user.is_staff:
+        raise Http404
+    directory = profile_dir()
+    profiles = sorted(
+        (path.name for path in directory.glob("*.prof")), reverse=True,
+    ) if directory.is_dir() else []
+    return JsonResponse({
+        "pid": os.getpid(),
+        "window": histograms.window(),
+        "views": histograms.snapshot(),
+        "profiles": profiles,
+    })
+
+
+def _may_scrape(request):
+    # The scraper sends METRICS_TOKEN as a bearer token; people need staff rights
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    return settings.DEBUG or request.user.is_staff
+
+
+def metrics(request):
+    """Every metric in the Prometheus text format."""
+    if not _may_scrape(request):
+        raise Http404
+    return HttpResponse(REGISTRY.expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
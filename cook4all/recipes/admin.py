@@ -1,8 +1,14 @@
 from django.contrib import admin
-from .models import Recipe
+from .models import Ingredient, Recipe
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('title', 'created_at')
     search_fields = ('title', 'description')
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(admin.ModelAdmin):
+    list_display = ('name', 'recipe_count')
+    search_fields = ('name',)
@@ -0,0 +1,203 @@
+"""
+Page and fragment caching for recipe pages.
+
+Cached entries are never deleted one by one. Their keys carry a version
+number, and a change moves to a new version so that the old entries simply
+stop being read and age out:
+
+* every recipe has its own version, used by its detail page and by the
+  rendered fragments of its card and body;
+* one site-wide version covers pages that show many recipes (home page,
+  recipe list).
+* a recommendations version moves when the "you might also like" lists
+  are rebuilt (see recipes.recommendations); detail pages include it;
+* a search version moves when the search index changes, retiring the
+  cached search results (see recipes.search.search_cache_key).
+
+The signal receivers in recipes.signals bump both when a recipe, its
+comments, ratings, likes or saves change. Only anonymous GET requests are
+served whole pages from the cache; logged-in visitors get freshly rendered
+pages that reuse the cached fragments.
+
+Any Django cache backend works: local memory or files for development and
+tests, a shared one such as Redis in production, so every worker process
+sees the same versions.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+PAGE_VERSION_KEY = "recipes:cache:pages"
+RECOMMENDATIONS_VERSION_KEY = "recipes:cache:recommendations"
+RECIPE_VERSION_KEY = "recipes:cache:recipe:{}"
+SEARCH_VERSION_KEY = "recipes:cache:search"
+
+
+def page_cache_timeout():
+    return getattr(settings, "RECIPES_PAGE_CACHE_TIMEOUT", 300)
+
+
+def fragment_cache_timeout():
+    return getattr(settings, "RECIPES_FRAGMENT_CACHE_TIMEOUT", 3600)
+
+
+# ---------------------------------------
+# Versions
+# ---------------------------------------
+def _get_version(key):
+    # A fresh version starts from the clock, so an evicted counter can never
+    # fall back onto a version whose entries are still cached
+    return cache.get_or_set(key, time.time_ns, timeout=None)
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def page_version():
+    return _get_version(PAGE_VERSION_KEY)
+
+
+def recipe_version(recipe_id):
+    return _get_version(RECIPE_VERSION_KEY.format(recipe_id))
+
+
+def recipe_versions(recipe_ids):
+    """Versions for many recipes at once: {recipe_id: version}."""
+    keys = {RECIPE_VERSION_KEY.format(pk): pk for pk in recipe_ids}
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def attach_cache_versions(recipes):
+    """
+    Set `cache_version` on each recipe with a single cache read, so the
+    {% recipe_fragment %} tags of a list don't each look theirs up.
+    """
+    recipes = list(recipes)
+    versions = recipe_versions({recipe.pk for recipe in recipes})
+    for recipe in recipes:
+        recipe.cache_version = versions[recipe.pk]
+    return recipes
+
+
+def invalidate_recipe(recipe_id):
+    """Retire the cached detail page and fragments of a recipe, and every
+    cached listing page."""
+    _bump_version(RECIPE_VERSION_KEY.format(recipe_id))
+    _bump_version(PAGE_VERSION_KEY)
+
+
+def invalidate_pages():
+    """Retire every cached listing page, e.g. after recipes were added in bulk."""
+    _bump_version(PAGE_VERSION_KEY)
+
+
+def recommendations_version():
+    return _get_version(RECOMMENDATIONS_VERSION_KEY)
+
+
+def invalidate_recommendations():
+    """Retire cached neighbour lists and feeds, and the detail pages showing them."""
+    _bump_version(RECOMMENDATIONS_VERSION_KEY)
+
+
+def search_version():
+    return _get_version(SEARCH_VERSION_KEY)
+
+
+def invalidate_search_cache():
+    """Orphan every cached search result by moving to a new version."""
+    _bump_version(SEARCH_VERSION_KEY)
+
+
+def fragment_cache_key(name, recipe_id, version):
+    return f"recipes:fragment:{name}:{recipe_id}:{version}"
+
+
+# ---------------------------------------
+# Anonymous full-page cache
+# ---------------------------------------
+def _is_cacheable_request(request):
+    return (
+        request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+        # Pending flash messages are rendered once and must not be cached
+        and "messages" not in request.COOKIES
+    )
+
+
+def _is_cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # A page with a CSRF token is tied to this visitor's cookie
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+def cache_anonymous_page(version=page_version):
+    """
+    Serve anonymous GET requests for the decorated view from the cache.
+
+    `version` is called with the view's URL kwargs and returns the version
+    the page is cached under; by default the site-wide page version. Async
+    views are supported: the cache lookup and the rendering run in a thread,
+    as they may query the database (for the viewer, or lazily in templates).
+    """
+    def decorator(view):
+        def lookup(request, kwargs):
+            """(cache key, cached response); no key if the request is not served from the cache."""
+            if not page_cache_timeout() or not _is_cacheable_request(request):
+                return None, None
+            digest = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()
+            key = f"recipes:page:{version(**kwargs)}:{digest}"
+            return key, cache.get(key)
+
+        def store(request, key, response):
+            if hasattr(response, "render") and callable(response.render):
+                response = response.render()
+            if _is_cacheable_response(request, response):
+                cache.set(key, response, page_cache_timeout())
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(lookup)(request, kwargs)
+                if response is not None:
+                    return response
+                response = await view(request, *args, **kwargs)
+                if key is None:
+                    return response
+                return await sync_to_async(store)(request, key, response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, response = lookup(request, kwargs)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if key is None:
+                return response
+            return store(request, key, response)
+        return wrapper
+    return decorator
+
+
+def recipe_page_version(pk, **kwargs):
+    # The page also lists the recipe's neighbours
+    return f"{recipe_version(pk)}.{recommendations_version()}"
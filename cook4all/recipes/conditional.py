@@ -0,0 +1,173 @@
+"""
+HTTP conditional GET for recipe pages and search results.
+
+Each view gets an ETag and a Last-Modified date before it runs. When the
+browser's copy is still current the answer is a bodiless 304 with nothing
+rendered. The timestamps come from one small query, whose result is cached
+under the recipe cache versions of recipes.caching, so a 304 usually costs
+no query at all.
+
+* A recipe page changes when the recipe or its counters change (both move
+  Recipe.updated_at; ratings and likes go through adjust_counters) or when
+  one of its comments is edited (Comment.updated_at).
+* Listings and search results change when any recipe does, or when one is
+  deleted, so they use the latest Recipe.updated_at and the recipe count.
+
+Pages for logged-in users also show that user's own state and carry their
+CSRF token, so their ETags include the user and the CSRF cookie and they are
+marked private.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .caching import fragment_cache_timeout, page_version, recipe_version, recommendations_version
+from .models import Comment, Recipe
+
+
+def _memoize(func):
+    # condition() asks for the ETag and Last-Modified separately; both come
+    # from the same query, so run it once per request
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        memo = request.__dict__.setdefault("_recipe_validators", {})
+        if func.__name__ not in memo:
+            memo[func.__name__] = func(request, *args, **kwargs)
+        return memo[func.__name__]
+    return wrapper
+
+
+def _etag(*parts):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    # Weak: bodies differ byte for byte (masked CSRF tokens) but not in meaning
+    return f'W/"{digest}"'
+
+
+def _cached_state(key, compute):
+    state = cache.get(key)
+    if state is None:
+        state = compute()
+        if state is not None:
+            cache.set(key, state, fragment_cache_timeout())
+    return state
+
+
+def _viewer(request):
+    if request.user.is_authenticated:
+        return request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+    return None
+
+
+# ---------------------------------------
+# Validators
+# ---------------------------------------
+@_memoize
+def recipe_state(request, pk, **kwargs):
+    """(updated_at, latest comment edit) for recipe `pk`, or None if missing."""
+    latest_comment = (
+        Comment.objects.filter(recipe=OuterRef("pk"))
+        .order_by().values("recipe").annotate(latest=Max("updated_at")).values("latest")
+    )
+    return _cached_state(
+        f"recipes:http:recipe:{pk}:{recipe_version(pk)}",
+        lambda: (
+            Recipe.objects.filter(pk=pk)
+            .annotate(latest_comment=Subquery(latest_comment))
+            .values_list("updated_at", "latest_comment")
+            .first()
+        ),
+    )
+
+
+def recipe_last_modified(request, pk, **kwargs):
+    state = recipe_state(request, pk)
+    if state is None:
+        return None
+    return max(timestamp for timestamp in state if timestamp is not None)
+
+
+def recipe_etag(request, pk, **kwargs):
+    state = recipe_state(request, pk)
+    if state is None:
+        return None
+    return _etag("recipe", pk, state, recommendations_version(), _viewer(request))
+
+
+@_memoize
+def recipes_state(request, *args, **kwargs):
+    """(latest updated_at, count) across all recipes."""
+    def compute():
+        totals = Recipe.objects.aggregate(latest=Max("updated_at"), count=Count("pk"))
+        return totals["latest"], totals["count"]
+    return _cached_state(f"recipes:http:recipes:{page_version()}", compute)
+
+
+def recipes_last_modified(request, *args, **kwargs):
+    return recipes_state(request)[0]
+
+
+def recipes_etag(request, *args, **kwargs):
+    return _etag("recipes", recipes_state(request), _viewer(request))
+
+
+def search_etag(request, *args, **kwargs):
+    # Search results are the same for everybody
+    return _etag("search", recipes_state(request))
+
+
+# ---------------------------------------
+# Decorator
+# ---------------------------------------
+def conditional_page(etag_func, last_modified_func, max_age=None):
+    """
+    Answer conditional GETs for the decorated view with 304s and add
+    Cache-Control: anonymous responses may be cached by browsers and shared
+    caches for `max_age` seconds (settings.RECIPES_HTTP_MAX_AGE by default);
+    logged-in ones are private and revalidated on every use.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        def add_cache_control(request, response, is_authenticated):
+            if request.method not in ("GET", "HEAD"):
+                return response
+
+            if is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                seconds = max_age if max_age is not None else getattr(settings, "RECIPES_HTTP_MAX_AGE", 60)
+                patch_cache_control(response, public=True, max_age=seconds)
+            # Logging in changes the page at the same URL
+            patch_vary_headers(response, ("Cookie",))
+            return response
+
+        if iscoroutinefunction(view):
+            def prepare(request, *args, **kwargs):
+                # The validators query the database, so they run here, in a
+                # thread; condition() then gets their memoized results
+                etag_func(request, *args, **kwargs)
+                last_modified_func(request, *args, **kwargs)
+                return request.user.is_authenticated
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # One user lookup for the validators, the view and the
+                # template: auser() and request.user cache separately
+                request.user = await request.auser()
+                is_authenticated = await sync_to_async(prepare)(request, *args, **kwargs)
+                response = await conditional_view(request, *args, **kwargs)
+                return add_cache_control(request, response, is_authenticated)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            return add_cache_control(request, response, request.user.is_authenticated)
+        return wrapper
+    return decorator
@@ -0,0 +1,244 @@
+"""
+Near-duplicate recipes: MinHash signatures and an LSH index.
+
+A recipe is reduced to its set of shingles, the runs of three consecutive
+words in its title, ingredients and instructions. Two recipes are
+near-duplicates when the Jaccard similarity of those sets (shared shingles
+over all shingles) is at least RECIPES_DUPLICATE_THRESHOLD. A repost with a
+reworded sentence or two keeps most of its shingles.
+
+Comparing a new recipe with every recipe is linear in the catalogue, so:
+
+- Each recipe is summarized by a MinHash signature of NUM_PERM values: for
+  each of NUM_PERM random hash functions, the smallest hash of any of its
+  shingles. Two signatures agree at a position with probability equal to
+  the Jaccard similarity, so the fraction of agreeing positions estimates it.
+- The signature is cut into BANDS bands of ROWS values and each band is
+  hashed to a bucket, stored as a SignatureBucket row indexed on bucket.
+  Recipes sharing any bucket are candidates. A pair with similarity s
+  becomes a candidate with probability 1 - (1 - s^ROWS)^BANDS: 99.98% at
+  s = 0.8, 93% at 0.6, 12% at 0.3. Candidates are then checked with their
+  signatures.
+
+A lookup is one indexed read of BANDS bucket values, whatever the size of
+the catalogue, plus the signatures of the few candidates it finds.
+
+Storage, as measured by `python -m benchmarks.duplicates` on SQLite, per
+recipe: 275 bytes for the signature, 260 for its 16 bucket rows and 480 for
+the two bucket indexes (by bucket, for lookups, and by recipe, for deletes).
+About 1 KB per recipe, so 1 GB on disk for a 1M-recipe catalogue. Nothing is held in memory
+between requests; a lookup reads a few pages of the bucket index.
+`manage.py find_duplicates` streams the shared buckets in order and keeps
+only the candidate pairs and their signatures in memory.
+
+Changing NUM_PERM, BANDS or the shingling makes the stored signatures
+incomparable with new ones, so run `manage.py find_duplicates --rebuild`
+afterwards.
+"""
+import hashlib
+import itertools
+import re
+import struct
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Recipe, RecipeSignature, SignatureBucket
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+WORD_RE = re.compile(r"[^\W_]+")
+SIGNATURE_FORMAT = struct.Struct(f"<{NUM_PERM}I")
+
+
+def duplicate_threshold():
+    return getattr(settings, "RECIPES_DUPLICATE_THRESHOLD", 0.7)
+
+
+# ---------------------------------------
+# Signatures
+# ---------------------------------------
+def shingles(recipe):
+    """The set of SHINGLE_SIZE-word runs in each field of `recipe`."""
+    found = set()
+    for text in (recipe.title, recipe.ingredients, recipe.instructions):
+        words = WORD_RE.findall(text.lower())
+        if len(words) < SHINGLE_SIZE:
+            if words:
+                found.add(" ".join(words))
+            continue
+        found.update(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    return found
+
+
+def signature(recipe):
+    """The MinHash signature of `recipe`: NUM_PERM ints, or None if it has no text."""
+    # NUM_PERM independent hash functions at once: the 32-bit words of each
+    # shingle's SHAKE-128 digest. Hashing and the column minimums run in C.
+    hashes = [
+        SIGNATURE_FORMAT.unpack(hashlib.shake_128(shingle.encode()).digest(SIGNATURE_FORMAT.size))
+        for shingle in shingles(recipe)
+    ]
+    if not hashes:
+        return None
+    return tuple(map(min, zip(*hashes)))
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the recipes behind two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def buckets(signature):
+    """The LSH bucket of each band of `signature`, as signed 32-bit ints."""
+    result = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        # The band number is part of the key: equal values in different
+        # bands are not a match
+        digest = hashlib.blake2b(struct.pack(f"<B{ROWS}I", band, *values), digest_size=4).digest()
+        result.append(int.from_bytes(digest, "little", signed=True))
+    return result
+
+
+def _unpack(data):
+    return SIGNATURE_FORMAT.unpack(bytes(data))
+
+
+# ---------------------------------------
+# Index
+# ---------------------------------------
+def index_recipes(recipes, signatures=None):
+    """
+    Replace the signatures and buckets of `recipes`. `signatures` may hold
+    signatures computed elsewhere, {recipe pk: signature}. Returns the
+    number of recipes indexed (recipes without any text have no signature).
+    """
+    recipes = list(recipes)
+    if not recipes:
+        return 0
+    signatures = dict(signatures or {})
+    for recipe in recipes:
+        if recipe.pk not in signatures:
+            signatures[recipe.pk] = signature(recipe)
+
+    rows, bucket_rows = [], []
+    for recipe_id, minhashes in signatures.items():
+        if minhashes is None:
+            continue
+        rows.append(RecipeSignature(recipe_id=recipe_id, minhashes=SIGNATURE_FORMAT.pack(*minhashes)))
+        bucket_rows.extend(SignatureBucket(recipe_id=recipe_id, bucket=bucket) for bucket in buckets(minhashes))
+
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe__in=signatures.keys()).delete()
+        SignatureBucket.objects.filter(recipe__in=signatures.keys()).delete()
+        RecipeSignature.objects.bulk_create(rows, batch_size=1000)
+        SignatureBucket.objects.bulk_create(bucket_rows, batch_size=2000)
+    return len(rows)
+
+
+def index_recipe(recipe):
+    index_recipes([recipe])
+
+
+# ---------------------------------------
+# Lookups
+# ---------------------------------------
+def find_duplicates(recipe, threshold=None, limit=5, candidates=200):
+    """
+    Recipes that are near-duplicates of `recipe`, which need not be saved,
+    most similar first. Each has a `similarity` attribute.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    minhashes = signature(recipe)
+    if minhashes is None:
+        return []
+
+    # The recipes sharing the most bands are the likeliest duplicates
+    matches = SignatureBucket.objects.filter(bucket__in=buckets(minhashes))
+    if recipe.pk is not None:
+        matches = matches.exclude(recipe=recipe.pk)
+    candidate_ids = list(
+        matches.values("recipe").annotate(shared=Count("id"))
+        .order_by("-shared", "-recipe").values_list("recipe", flat=True)[:candidates]
+    )
+    if not candidate_ids:
+        return []
+
+    scores = {}
+    for recipe_id, data in RecipeSignature.objects.filter(recipe__in=candidate_ids).values_list("recipe", "minhashes"):
+        score = similarity(minhashes, _unpack(data))
+        if score >= threshold:
+            scores[recipe_id] = score
+    if not scores:
+        return []
+
+    duplicates = sorted(
+        Recipe.objects.filter(pk__in=scores).select_related("author").only("title", "created_at", "author__username"),
+        key=lambda duplicate: (-scores[duplicate.pk], duplicate.pk),
+    )[:limit]
+    for duplicate in duplicates:
+        duplicate.similarity = scores[duplicate.pk]
+    return duplicates
+
+
+def duplicate_clusters(threshold=None, max_bucket=500, batch_size=1000):
+    """
+    Group the indexed recipes into clusters of near-duplicates: lists of
+    recipe ids, oldest first, largest cluster first. Recipes without a
+    duplicate are left out.
+
+    Buckets holding more than `max_bucket` recipes (boilerplate shared by
+    many recipes) only pair each member with the bucket's first recipe.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    shared = (
+        SignatureBucket.objects.values("bucket").annotate(size=Count("id"))
+        .filter(size__gt=1).values("bucket")
+    )
+    rows = (
+        SignatureBucket.objects.filter(bucket__in=shared).order_by("bucket", "recipe")
+        .values_list("bucket", "recipe").iterator(chunk_size=10000)
+    )
+    pairs = set()
+    for _, group in itertools.groupby(rows, key=lambda row: row[0]):
+        members = [recipe_id for _, recipe_id in group]
+        if len(members) > max_bucket:
+            pairs.update((members[0], other) for other in members[1:])
+        else:
+            pairs.update(itertools.combinations(members, 2))
+
+    # Union-find over the pairs whose signatures agree
+    parent = {}
+
+    def find(recipe_id):
+        root = recipe_id
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while recipe_id != root:
+            parent[recipe_id], recipe_id = root, parent[recipe_id]
+        return root
+
+    ids = sorted({recipe_id for pair in pairs for recipe_id in pair})
+    signatures = {}
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        for recipe_id, data in RecipeSignature.objects.filter(recipe__in=chunk).values_list("recipe", "minhashes"):
+            signatures[recipe_id] = _unpack(data)
+
+    for first, second in pairs:
+        if first in signatures and second in signatures and similarity(signatures[first], signatures[second]) >= threshold:
+            parent.setdefault(first, first)
+            parent.setdefault(second, second)
+            a, b = find(first), find(second)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    clusters = {}
+    for recipe_id in parent:
+        clusters.setdefault(find(recipe_id), []).append(recipe_id)
+    return sorted((sorted(members) for members in clusters.values()), key=lambda members: (-len(members), members[0]))
@@ -0,0 +1,69 @@
+"""
+Like and save toggles shared by every view that offers them.
+
+Membership is decided by the write itself: a DELETE on the through table's
+(recipe_id, user_id) unique index either removes the row or finds nothing,
+in which case the row is inserted. A concurrent insert of the same row (a
+double click) loses on the unique constraint and is treated as "already on".
+The stored counter moves in the same transaction, and is read back in it
+for the caller to show.
+"""
+from django.db import IntegrityError, router, transaction
+from django.db.models.signals import m2m_changed
+
+from instrumentation import metrics
+
+from .models import Recipe
+
+LIKES = metrics.counter("recipes_likes_total", "Recipes liked and unliked.", ["action"])
+SAVES = metrics.counter("recipes_saves_total", "Recipes saved and unsaved.", ["action"])
+
+
+def _toggle(field_name, counter, metric, recipe, user):
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    # A read queryset's .db may name a replica; the writes go here
+    db = router.db_for_write(through, instance=recipe)
+    membership = through.objects.using(db).filter(recipe_id=recipe.pk, user_id=user.pk)
+
+    with transaction.atomic(using=db):
+        deleted, _ = membership.delete()
+        if deleted:
+            active, action = False, "post_remove"
+        else:
+            try:
+                with transaction.atomic(using=db):
+                    through.objects.using(db).create(recipe_id=recipe.pk, user_id=user.pk)
+            except IntegrityError:
+                action = None
+            else:
+                action = "post_add"
+            active = True
+
+        if action:
+            recipe.adjust_counters(**{counter: 1 if active else -1})
+        count = Recipe.objects.using(db).filter(pk=recipe.pk).values_list(counter, flat=True).get()
+
+    if action is None:
+        # The other request added the row and counted it
+        return active, count
+
+    metric.inc(action="add" if active else "remove")
+
+    # Raw writes bypass the related manager, so announce the change the way
+    # recipe.likes.add()/remove() would for any m2m_changed receivers
+    m2m_changed.send(
+        sender=through, action=action, instance=recipe, reverse=False,
+        model=field.related_model, pk_set={user.pk}, using=db,
+    )
+    return active, count
+
+
+def toggle_like(recipe, user):
+    """Like or unlike `recipe` for `user`; returns (liked now, like count)."""
+    return _toggle("likes", "like_count", LIKES, recipe, user)
+
+
+def toggle_save(recipe, user):
+    """Save or unsave `recipe` for `user`; returns (saved now, save count)."""
+    return _toggle("saved_by", "save_count", SAVES, recipe, user)
@@ -0,0 +1,451 @@
+"""
+Structured ingredients and the ingredient index.
+
+`parse_ingredients()` turns a recipe's free-text ingredient list into
+normalized entries:
+
+    "1 can (400g) diced tomatoes"  -> ParsedIngredient("tomato", 1.0, "can", ...)
+    "3 garlic cloves, minced"      -> ParsedIngredient("garlic", 3.0, "", ...)
+    "Salt and pepper, to taste"    -> "salt", "pepper"
+
+Names are lower case and singular, with preparation words ("chopped",
+"fresh") dropped and common synonyms folded together ("scallion" and
+"spring onion" are both "green onion").
+
+Each recipe's entries are stored as RecipeIngredient rows, one per distinct
+ingredient. Their (ingredient, recipe) index is an inverted index: the
+recipes using an ingredient are one range scan, and Ingredient.recipe_count
+says how long each of those posting lists is. The lookups below use it to
+answer "recipes with all / any of these ingredients" and "recipes I can cook
+with these, missing at most N" without reading the recipes table.
+"""
+import functools
+import re
+from fractions import Fraction
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Ingredient, Recipe, RecipeIngredient
+
+UNICODE_FRACTIONS = {
+    "¼": "1/4", "½": "1/2", "¾": "3/4", "⅓": "1/3", "⅔": "2/3",
+    "⅛": "1/8", "⅜": "3/8", "⅝": "5/8", "⅞": "7/8",
+}
+FRACTION_RE = re.compile(rf"(\d?)([{''.join(UNICODE_FRACTIONS)}])")
+
+# Spellings of each unit, canonical name first
+UNITS = {
+    "tsp": ("teaspoon", "teaspoons", "tsps", "t"),
+    "tbsp": ("tablespoon", "tablespoons", "tbsps", "tbs", "tbl", "tbls"),
+    "cup": ("cups", "c"),
+    "ml": ("milliliter", "milliliters", "millilitre", "millilitres"),
+    "l": ("liter", "liters", "litre", "litres"),
+    "g": ("gram", "grams", "gr", "grs"),
+    "kg": ("kilogram", "kilograms", "kilo", "kilos", "kgs"),
+    "oz": ("ounce", "ounces"),
+    "lb": ("pound", "pounds", "lbs"),
+    "pinch": ("pinches",),
+    "dash": ("dashes",),
+    "can": ("cans", "tin", "tins"),
+    "jar": ("jars",),
+    "package": ("packages", "pack", "packs", "packet", "packets"),
+    "stick": ("sticks",),
+    "handful": ("handfuls",),
+    "bunch": ("bunches",),
+    "sprig": ("sprigs",),
+    "slice": ("slices",),
+    "clove": ("cloves",),
+    "sheet": ("sheets",),
+}
+UNIT_ALIASES = {alias: unit for unit, aliases in UNITS.items() for alias in (unit, *aliases)}
+
+# Words about preparation, size or state rather than what the ingredient is
+DESCRIPTORS = {
+    "fresh", "freshly", "dried", "frozen", "chopped", "finely", "roughly", "coarsely",
+    "thinly", "minced", "diced", "sliced", "grated", "shredded", "crushed", "peeled",
+    "cubed", "halved", "quartered", "trimmed", "rinsed", "drained", "cleaned", "beaten",
+    "melted", "softened", "cooked", "uncooked", "boneless", "skinless", "large", "small",
+    "medium", "ripe", "whole", "extra", "virgin", "unsalted", "salted", "plain", "organic",
+    "good", "quality", "about", "approx", "approximately", "heaping", "level",
+    "warm", "cold", "lukewarm", "chilled",
+}
+
+# Words naming a part of the ingredient, dropped when something else is left
+# ("garlic cloves" is garlic, "celery stalks" is celery)
+PART_WORDS = {"clove", "stalk", "sprig", "wedge", "bunch", "piece", "slice", "head", "fillet"}
+
+# Words that, as the first of two choices, share the second one's noun
+# ("white or brown rice" is white rice)
+MODIFIERS = {
+    "white", "brown", "red", "green", "yellow", "black", "dark", "light", "sweet", "dry",
+    "corn", "flour", "wheat", "rice", "almond", "oat", "soy", "coconut", "olive", "vegetable",
+}
+
+# Trailing serving notes ("to taste", "for garnish", ...)
+NOTE_RE = re.compile(r"\b(to taste|to serve|for serving|for garnish|as needed|if needed|to garnish)\b.*$")
+
+OPTIONAL_PREFIX_RE = re.compile(r"^optional[^:]*:\s*")  # "Optional toppings: ..."
+PARENTHESES_RE = re.compile(r"\([^)]*\)?")                # "(400g)", "(optional)"
+UNIT_RE = re.compile(r"([a-z]+)\.?\b\s*")
+CHOICE_RE = re.compile(r"\s+or\s+|/")
+WORD_RE = re.compile(r"[a-z][a-z'-]*")
+
+QUANTITY_RE = re.compile(
+    r"^(?P<quantity>(\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?)(\s*(?:-|–|to)\s*(\d+/\d+|\d+(?:[.,]\d+)?))?|an?\b)\s*"
+)
+
+# Lines that mention two ingredients
+COMPOUNDS = {
+    "salt and pepper": ("salt", "pepper"),
+    "salt & pepper": ("salt", "pepper"),
+    "salt and black pepper": ("salt", "pepper"),
+    "oil and vinegar": ("oil", "vinegar"),
+}
+
+SYNONYMS = {
+    "scallion": "green onion",
+    "spring onion": "green onion",
+    "coriander leaf": "cilantro",
+    "garbanzo bean": "chickpea",
+    "garbanzo": "chickpea",
+    "aubergine": "eggplant",
+    "courgette": "zucchini",
+    "capsicum": "bell pepper",
+    "red bell pepper": "bell pepper",
+    "green bell pepper": "bell pepper",
+    "yellow bell pepper": "bell pepper",
+    "prawn": "shrimp",
+    "rocket": "arugula",
+    "icing sugar": "powdered sugar",
+    "confectioners sugar": "powdered sugar",
+    "confectioner's sugar": "powdered sugar",
+    "caster sugar": "sugar",
+    "granulated sugar": "sugar",
+    "white sugar": "sugar",
+    "double cream": "heavy cream",
+    "heavy whipping cream": "heavy cream",
+    "all-purpose flour": "flour",
+    "all purpose flour": "flour",
+    "chicken broth": "chicken stock",
+    "beef broth": "beef stock",
+    "vegetable broth": "vegetable stock",
+    "minced meat": "ground beef",
+    "beef mince": "ground beef",
+    "black pepper": "pepper",
+    "ground black pepper": "pepper",
+    "ground pepper": "pepper",
+    "sea salt": "salt",
+    "kosher salt": "salt",
+    "table salt": "salt",
+    "parmesan cheese": "parmesan",
+    "parmigiano reggiano": "parmesan",
+    "mozzarella cheese": "mozzarella",
+    "ricotta cheese": "ricotta",
+    "cheddar cheese": "cheddar",
+    "feta cheese": "feta",
+    "hen egg": "egg",
+}
+
+# Plurals the suffix rules below would get wrong
+IRREGULAR_PLURALS = {
+    "leaves": "leaf", "halves": "half", "loaves": "loaf", "knives": "knife",
+    "cookies": "cookie", "brownies": "brownie", "calories": "calorie",
+    "molasses": "molasses", "hummus": "hummus", "couscous": "couscous",
+    "asparagus": "asparagus", "grits": "grits", "swiss": "swiss", "citrus": "citrus",
+    "lentils": "lentil", "anchovies": "anchovy", "fries": "fries",
+}
+
+
+class ParsedIngredient(NamedTuple):
+    name: str
+    quantity: float | None
+    unit: str
+    optional: bool
+    raw: str
+
+
+def singular(word):
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes", "zes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+@functools.lru_cache(maxsize=8192)
+def normalize_name(text):
+    """The canonical ingredient name for `text` ("Fresh Tomatoes" -> "tomato")."""
+    text = text.lower().replace("’", "'")
+    words = [word for word in WORD_RE.findall(text) if word not in DESCRIPTORS]
+    while words and words[0] in ("of", "a", "an", "the", "some"):
+        words = words[1:]
+    if not words:
+        return ""
+    words[-1] = singular(words[-1])
+    if len(words) > 1:
+        words = [word for word in words if singular(word) not in PART_WORDS] or words
+        words[-1] = singular(words[-1])
+    name = " ".join(words)
+    return SYNONYMS.get(name, name)
+
+
+def _quantity(text):
+    text = text.replace(",", ".")
+    if text in ("a", "an"):
+        return 1.0
+    try:
+        return float(sum(Fraction(part) for part in text.split()))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _expand_fraction(match):
+    # "1½" is one and a half
+    digit, char = match.groups()
+    return f"{digit} {UNICODE_FRACTIONS[char]}" if digit else UNICODE_FRACTIONS[char]
+
+
+# Lines repeat a lot across recipes ("Salt and pepper, to taste")
+@functools.lru_cache(maxsize=16384)
+def parse_line(line):
+    """Parse one ingredient line into a tuple of ParsedIngredient (often one)."""
+    raw = line.strip()
+    text = FRACTION_RE.sub(_expand_fraction, raw.lower())
+    text = text.lstrip("-*•· \t")
+    if not text or text.endswith(":"):
+        # Blank, or a heading such as "For the sauce:"
+        return ()
+
+    optional = "optional" in text
+    text = OPTIONAL_PREFIX_RE.sub("", text)
+    text = PARENTHESES_RE.sub(" ", text)
+    text = text.split(",")[0]                       # ", finely chopped"
+    text = NOTE_RE.sub("", text).strip()
+
+    quantity, unit = None, ""
+    match = QUANTITY_RE.match(text)
+    if match:
+        # A range ("2-3 cloves") counts as its lower bound
+        quantity = _quantity(match.group(2) or match.group("quantity"))
+        text = text[match.end():]
+        # "200g chorizo": the unit is glued to the number
+        word = UNIT_RE.match(text)
+        if word and word.group(1) in UNIT_ALIASES:
+            unit = UNIT_ALIASES[word.group(1)]
+            text = text[word.end():]
+    text = text.strip().removeprefix("of ")
+
+    if text in COMPOUNDS:
+        return tuple(ParsedIngredient(name, None, "", optional, raw) for name in COMPOUNDS[text])
+
+    # "parsley or basil": the first choice
+    choices = [normalize_name(choice) for choice in CHOICE_RE.split(text)]
+    choices = [choice for choice in choices if choice]
+    if not choices:
+        return ()
+    name = choices[0]
+    if len(choices) > 1 and name in MODIFIERS and " " in choices[-1]:
+        name = normalize_name(f"{name} {choices[-1].split()[-1]}")
+    if not name:
+        return ()
+    return (ParsedIngredient(name, quantity, unit, optional, raw),)
+
+
+def parse_ingredients(text):
+    """Parse a recipe's ingredient list, one ingredient per line."""
+    return [parsed for line in (text or "").splitlines() for parsed in parse_line(line)]
+
+
+def distinct_ingredients(parsed):
+    """One entry per ingredient name, in first-seen order; optional only if always optional."""
+    by_name = {}
+    for entry in parsed:
+        if entry.name in by_name:
+            if not entry.optional:
+                by_name[entry.name] = by_name[entry.name]._replace(optional=False)
+        else:
+            by_name[entry.name] = entry
+    return list(by_name.values())
+
+
+# ---------------------------------------
+# Index maintenance
+# ---------------------------------------
+def _ingredient_ids(names):
+    """{name: Ingredient id}, creating the ingredients that don't exist yet."""
+    names = set(names)
+    ids = dict(Ingredient.objects.filter(name__in=names).values_list("name", "id"))
+    missing = names - ids.keys()
+    if missing:
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name) for name in sorted(missing)], ignore_conflicts=True
+        )
+        ids.update(Ingredient.objects.filter(name__in=missing).values_list("name", "id"))
+    return ids
+
+
+def _adjust_recipe_counts(deltas):
+    for delta in {value for value in deltas.values() if value}:
+        ids = [pk for pk, value in deltas.items() if value == delta]
+        Ingredient.objects.filter(pk__in=ids).update(recipe_count=F("recipe_count") + delta)
+
+
+def index_recipes(recipes, parsed=None):
+    """
+    Parse the ingredients of `recipes` and replace their RecipeIngredient
+    rows, keeping Ingredient.recipe_count and Recipe.ingredient_count current.
+    `parsed` may hold entries already parsed elsewhere, {recipe pk: entries}.
+    Returns the number of RecipeIngredient rows written.
+    """
+    recipes = list(recipes)
+    if not recipes:
+        return 0
+    parsed = dict(parsed or {})
+    for recipe in recipes:
+        if recipe.pk not in parsed:
+            parsed[recipe.pk] = distinct_ingredients(parse_ingredients(recipe.ingredients))
+
+    with transaction.atomic():
+        ids = _ingredient_ids(entry.name for entries in parsed.values() for entry in entries)
+        deltas = {}
+        old = RecipeIngredient.objects.filter(recipe__in=parsed.keys())
+        for ingredient_id in old.values_list("ingredient_id", flat=True):
+            deltas[ingredient_id] = deltas.get(ingredient_id, 0) - 1
+        old.delete()
+
+        rows = []
+        by_count = {}
+        for recipe in recipes:
+            recipe.ingredient_count = sum(not entry.optional for entry in parsed[recipe.pk])
+            by_count.setdefault(recipe.ingredient_count, []).append(recipe.pk)
+            for position, entry in enumerate(parsed[recipe.pk]):
+                ingredient_id = ids[entry.name]
+                deltas[ingredient_id] = deltas.get(ingredient_id, 0) + 1
+                rows.append(RecipeIngredient(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id, position=position,
+                    quantity=entry.quantity, unit=entry.unit, optional=entry.optional,
+                    recipe_size=recipe.ingredient_count, raw=entry.raw[:255],
+                ))
+        RecipeIngredient.objects.bulk_create(rows, batch_size=1000)
+        _adjust_recipe_counts(deltas)
+        # Recipes have a handful of distinct sizes: one UPDATE per size
+        for count, pks in by_count.items():
+            Recipe.objects.filter(pk__in=pks).update(ingredient_count=count)
+    return len(rows)
+
+
+def index_recipe(recipe):
+    index_recipes([recipe])
+
+
+def recount_ingredients():
+    """Recompute every Ingredient.recipe_count from the RecipeIngredient rows."""
+    postings = (
+        RecipeIngredient.objects.filter(ingredient=OuterRef("pk"))
+        .order_by().values("ingredient").annotate(n=Count("pk")).values("n")
+    )
+    return Ingredient.objects.update(
+        recipe_count=Coalesce(Subquery(postings, output_field=IntegerField()), Value(0))
+    )
+
+
+# ---------------------------------------
+# Lookups
+# ---------------------------------------
+def lookup_ingredients(names):
+    """Ingredient ids for the user-typed `names`, rarest first; None if any is unknown."""
+    wanted = {normalize_name(name) for name in names} - {""}
+    found = list(
+        Ingredient.objects.filter(name__in=wanted, recipe_count__gt=0)
+        .order_by("recipe_count").values_list("pk", flat=True)
+    )
+    if not wanted or len(found) < len(wanted):
+        return None
+    return found
+
+
+def _matched(ingredient_ids, **filters):
+    """Subquery: how many of `ingredient_ids` each recipe uses."""
+    matches = (
+        RecipeIngredient.objects.filter(recipe=OuterRef("pk"), ingredient_id__in=ingredient_ids, **filters)
+        .order_by().values("recipe").annotate(n=Count("pk")).values("n")
+    )
+    return Coalesce(Subquery(matches, output_field=IntegerField()), Value(0))
+
+
+def with_all_ingredients(queryset, names):
+    """Recipes in `queryset` that use every one of `names`."""
+    ingredient_ids = lookup_ingredients(names)
+    if ingredient_ids is None:
+        return queryset.none()
+
+    # Walk the shortest posting list and probe the index for the others
+    rarest, *others = ingredient_ids
+    postings = RecipeIngredient.objects.filter(ingredient_id=rarest)
+    for other in others:
+        postings = postings.filter(Exists(
+            RecipeIngredient.objects.filter(recipe_id=OuterRef("recipe_id"), ingredient_id=other)
+        ))
+    return queryset.filter(pk__in=postings.values("recipe_id")).annotate(matched=Value(len(ingredient_ids)))
+
+
+def with_any_ingredients(queryset, names):
+    """Recipes in `queryset` that use at least one of `names`, most matches first."""
+    wanted = {normalize_name(name) for name in names} - {""}
+    ingredient_ids = list(Ingredient.objects.filter(name__in=wanted).values_list("pk", flat=True))
+    if not ingredient_ids:
+        return queryset.none()
+
+    # One pass over the posting lists, grouped by recipe
+    return (
+        queryset.filter(parsed_ingredients__ingredient_id__in=ingredient_ids)
+        .annotate(matched=Count("parsed_ingredients"))
+        .order_by("-matched", "-like_count", "-id")
+    )
+
+
+def cookable_with(queryset, names, missing=1):
+    """
+    Recipes in `queryset` that need at most `missing` required ingredients
+    beyond `names` (and use at least one of them), fewest missing first.
+    """
+    wanted = {normalize_name(name) for name in names} - {""}
+    ingredient_ids = list(Ingredient.objects.filter(name__in=wanted).values_list("pk", flat=True))
+    if not ingredient_ids:
+        return queryset.none()
+
+    # Only recipes needing at most len(names) + missing ingredients can
+    # qualify; the index has those first in each posting list, so the long
+    # tail is never read. Counting what they match happens in the index too.
+    candidates = (
+        RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids, optional=False,
+            recipe_size__lte=len(ingredient_ids) + missing,
+        )
+        .order_by().values("recipe_id")
+        .annotate(have=Count("*"), size=Max("recipe_size"))
+        .filter(have__gte=F("size") - missing)
+        .values("recipe_id")
+    )
+    return (
+        queryset.filter(pk__in=candidates)
+        .annotate(matched=_matched(ingredient_ids, optional=False))
+        .annotate(missing=F("ingredient_count") - F("matched"))
+        .order_by("missing", "-like_count", "-id")
+    )
+
+
+MATCH_MODES = {
+    "all": with_all_ingredients,
+    "any": with_any_ingredients,
+    "missing-one": lambda queryset, names: cookable_with(queryset, names, missing=1),
+}
@@ -0,0 +1,149 @@
+"""
+Materialized leaderboards for the home page and recipe list rails.
+
+The boards are built in one go and kept in the Django cache, so showing the
+rails costs a single cache read (plus one small query for the viewer's own
+liked/saved flags when logged in). They go stale after
+RECIPES_LEADERBOARD_TIMEOUT seconds or when an engagement event the rails
+display marks them so, and are rebuilt by `manage.py refresh_leaderboards`
+or by the next request. Only one request rebuilds at a time; the others keep
+serving the stale boards meanwhile, so a busy page doesn't run the site-wide
+aggregates once per concurrent miss.
+"""
+import itertools
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef, Sum, Value
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+
+from .models import Recipe
+
+LEADERBOARD_CACHE_KEY = "recipes:leaderboards"
+# Present while the cached boards are fresh
+LEADERBOARD_FRESH_KEY = "recipes:leaderboards:fresh"
+LEADERBOARD_LOCK_KEY = "recipes:leaderboards:rebuilding"
+# Longer than a rebuild could take; frees the lock if its holder dies
+LEADERBOARD_LOCK_TIMEOUT = 30
+
+
+def leaderboard_size():
+    return getattr(settings, "RECIPES_LEADERBOARD_SIZE", 10)
+
+
+def bayesian_rating(min_votes=None):
+    """
+    Expression for a recipe's rating shrunk towards the site-wide mean:
+
+        (min_votes * mean + rating_sum) / (min_votes + rating_count)
+
+    so a single 5-star vote cannot outrank a recipe with many 4-star votes.
+    """
+    if min_votes is None:
+        min_votes = getattr(settings, "RECIPES_LEADERBOARD_MIN_VOTES", 5)
+    # Unrated recipes add nothing; skipping them lets the count index narrow the read
+    totals = Recipe.objects.filter(rating_count__gt=0).aggregate(sum=Sum("rating_sum"), count=Sum("rating_count"))
+    mean = totals["sum"] / totals["count"] if totals["count"] else 0.0
+    return (
+        (Value(min_votes * mean) + F("rating_sum") * 1.0)
+        / (Value(float(min_votes)) + F("rating_count"))
+    )
+
+
+def leaderboard_queries(size=None):
+    """The query behind each board, {"liked"|"rated"|"by_category": queryset}."""
+    size = size or leaderboard_size()
+    recipes = Recipe.objects.with_stats()
+
+    ranked = recipes.filter(like_count__gt=0).annotate(category_rank=Window(
+        RowNumber(),
+        partition_by=F("category"),
+        order_by=[F("like_count").desc(), F("created_at").desc(), F("id").desc()],
+    ))
+    return {
+        "liked": recipes.filter(like_count__gt=0).order_by("-like_count", "-created_at", "-id")[:size],
+        # Shrunk towards a mean that changes with every vote, so no index
+        # holds this order: the rated recipes are read and sorted
+        "rated": (
+            recipes.filter(rating_count__gt=0)
+            .annotate(bayesian_rating=bayesian_rating())
+            .order_by("-bayesian_rating", "-created_at", "-id")[:size]
+        ),
+        "by_category": ranked.filter(category_rank__lte=size).order_by("category", "category_rank"),
+    }
+
+
+def build_leaderboards(size=None):
+    """Compute every board from the stored engagement counters."""
+    queries = leaderboard_queries(size)
+    by_category = {category: [] for category, _ in Recipe.CATEGORY_CHOICES}
+    for recipe in queries["by_category"]:
+        by_category[recipe.category].append(recipe)
+
+    return {"liked": list(queries["liked"]), "rated": list(queries["rated"]), "by_category": by_category}
+
+
+def refresh_leaderboards():
+    boards = build_leaderboards()
+    # Kept past their freshness, so they can be served while the next rebuild runs
+    cache.set(LEADERBOARD_CACHE_KEY, boards, getattr(settings, "RECIPES_LEADERBOARD_STALE_TIMEOUT", 86400))
+    cache.set(LEADERBOARD_FRESH_KEY, True, getattr(settings, "RECIPES_LEADERBOARD_TIMEOUT", 300))
+    return boards
+
+
+def invalidate_leaderboards():
+    cache.delete(LEADERBOARD_FRESH_KEY)
+
+
+def _rebuild_once():
+    """Rebuild the boards unless another request already is; the new boards, or None."""
+    if not cache.add(LEADERBOARD_LOCK_KEY, True, LEADERBOARD_LOCK_TIMEOUT):
+        return None
+    try:
+        return refresh_leaderboards()
+    finally:
+        cache.delete(LEADERBOARD_LOCK_KEY)
+
+
+def _cached_boards():
+    """(boards or None, fresh) in one cache round trip."""
+    cached = cache.get_many([LEADERBOARD_CACHE_KEY, LEADERBOARD_FRESH_KEY])
+    return cached.get(LEADERBOARD_CACHE_KEY), LEADERBOARD_FRESH_KEY in cached
+
+
+def get_leaderboards(user=None, category=None):
+    """
+    Return the cached boards, rebuilding them if stale or missing, with
+    is_liked and is_saved filled in for `user` on the liked and rated boards
+    and on the board for `category`, if given.
+    """
+    boards, fresh = _cached_boards()
+    if not fresh:
+        boards = _rebuild_once() or boards
+    if boards is None:
+        # Nothing to serve while another request builds the first boards:
+        # wait for them, up to the time a rebuild may take, then build too
+        deadline = time.monotonic() + LEADERBOARD_LOCK_TIMEOUT
+        while boards is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            boards = _cached_boards()[0]
+        if boards is None:
+            boards = build_leaderboards()
+
+    if user is not None and user.is_authenticated:
+        shown = [boards["liked"], boards["rated"], boards["by_category"].get(category, [])]
+        entries = list(itertools.chain.from_iterable(shown))
+        likes = Recipe.likes.through.objects.filter(recipe=OuterRef("pk"), user=user)
+        saves = Recipe.saved_by.through.objects.filter(recipe=OuterRef("pk"), user=user)
+        flags = {
+            pk: (is_liked, is_saved)
+            for pk, is_liked, is_saved in Recipe.objects.filter(pk__in={r.pk for r in entries})
+            .annotate(is_liked=Exists(likes), is_saved=Exists(saves))
+            .values_list("pk", "is_liked", "is_saved")
+        }
+        for recipe in entries:
+            recipe.is_liked, recipe.is_saved = flags.get(recipe.pk, (False, False))
+
+    return boards
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import compute_neighbors, interactions, store_neighbors
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the \"you might also like\" neighbours of every recipe from likes, "
+        "saves and ratings (run from cron, e.g. nightly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--neighbors", type=int, default=None,
+            help="Neighbours kept per recipe (default: settings.RECIPES_RECOMMENDATION_NEIGHBORS).",
+        )
+        parser.add_argument(
+            "--shrink", type=float, default=None,
+            help="Damping for pairs with few users in common (default: settings.RECIPES_RECOMMENDATION_SHRINK).",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        neighbors = compute_neighbors(interactions(), k=options["neighbors"], shrink=options["shrink"])
+        computed = time.perf_counter()
+        written = store_neighbors(neighbors)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} neighbours for {len(neighbors)} recipes "
+            f"(computed in {computed - start:.1f}s, written in {time.perf_counter() - computed:.1f}s)."
+        ))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from recipes.transfer import FORMATS, detect_format, export_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Write recipes to a JSON Lines or CSV file, streaming them in batches "
+        "so any number of recipes can be exported in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-",
+            help="File to write; '-' (the default) writes to standard output.",
+        )
+        parser.add_argument(
+            "--format", choices=FORMATS,
+            help="Output format (default: from the file extension, jsonl for standard output).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=2000,
+            help="Number of recipes read per query (default: 2000).",
+        )
+        parser.add_argument(
+            "--category", choices=[key for key, _ in Recipe.CATEGORY_CHOICES],
+            help="Only export recipes of this category.",
+        )
+        parser.add_argument(
+            "--author",
+            help="Only export recipes by this username.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            format = detect_format(path, options["format"] or ("jsonl" if path == "-" else None))
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        recipes = Recipe.objects.all()
+        if options["category"]:
+            recipes = recipes.filter(category=options["category"])
+        if options["author"]:
+            recipes = recipes.filter(author__username=options["author"])
+
+        start = time.perf_counter()
+        if path == "-":
+            count = export_recipes(self.stdout, format, recipes, options["batch_size"])
+            # The records are on standard output; the summary goes elsewhere
+            report = self.stderr
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as stream:
+                count = export_recipes(stream, format, recipes, options["batch_size"])
+            report = self.stdout
+        elapsed = time.perf_counter() - start
+
+        report.write(self.style.SUCCESS(
+            f"Exported {count} recipes in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} recipes/s)."
+        ))
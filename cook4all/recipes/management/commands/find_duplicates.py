@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from recipes.duplicates import duplicate_clusters, duplicate_threshold, index_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "List clusters of near-duplicate recipes found through the MinHash "
+        "index. With --rebuild, recompute every recipe's signature first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Recompute the signatures of all recipes before clustering.",
+        )
+        parser.add_argument(
+            "--missing", action="store_true",
+            help="Compute the signatures of recipes that have none before clustering.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of recipes signed and written per transaction (default: 1000).",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=None,
+            help=f"Estimated similarity for two recipes to be duplicates (default: {duplicate_threshold()}).",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=50,
+            help="Number of clusters listed, largest first (default: 50).",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"] or options["missing"]:
+            recipes = Recipe.objects.only("pk", "title", "ingredients", "instructions").order_by("pk")
+            if options["missing"] and not options["rebuild"]:
+                recipes = recipes.filter(signature__isnull=True)
+
+            # Keyset batches, one transaction each, like backfill_ingredients
+            signed = 0
+            last_pk = 0
+            while True:
+                batch = list(recipes.filter(pk__gt=last_pk)[:options["batch_size"]])
+                if not batch:
+                    break
+                signed += index_recipes(batch)
+                last_pk = batch[-1].pk
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"  {signed} recipes...")
+            self.stdout.write(f"Signed {signed} recipes.")
+
+        clusters = duplicate_clusters(options["threshold"])
+        titles = Recipe.objects.only("title").in_bulk(
+            [recipe_id for cluster in clusters[:options["limit"]] for recipe_id in cluster],
+        )
+        for cluster in clusters[:options["limit"]]:
+            self.stdout.write(f"{len(cluster)} recipes:")
+            for recipe_id in cluster:
+                recipe = titles.get(recipe_id)
+                self.stdout.write(f"  #{recipe_id} {recipe.title if recipe else '(deleted)'}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {len(clusters)} clusters of near-duplicates "
+            f"({sum(len(cluster) for cluster in clusters)} recipes)."
+        ))
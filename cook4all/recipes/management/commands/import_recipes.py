@@ -0,0 +1,91 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.transfer import FORMATS, detect_format, import_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Load recipes from a JSON Lines or CSV file in batches, one "
+        "transaction and one bulk insert per batch. Invalid records are "
+        "skipped and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="File to read; '-' reads standard input.",
+        )
+        parser.add_argument(
+            "--format", choices=FORMATS,
+            help="Input format (default: from the file extension, jsonl for standard input).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of recipes written per transaction (default: 1000).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=0,
+            help="Processes decoding and validating records while this one writes (default: none).",
+        )
+        parser.add_argument(
+            "--create-authors", action="store_true",
+            help="Create a user (with no usable password) for each unknown author.",
+        )
+        parser.add_argument(
+            "--default-author",
+            help="Username to attribute recipes by unknown authors to, instead of skipping them.",
+        )
+        parser.add_argument(
+            "--no-index", action="store_true",
+            help=(
+                "Skip the ingredient, duplicate and search indexes; rebuild them afterwards "
+                "with backfill_ingredients, find_duplicates --missing and rebuild_search_index."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            format = detect_format(path, options["format"] or ("jsonl" if path == "-" else None))
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        default_author = None
+        if options["default_author"]:
+            try:
+                default_author = User.objects.get(username=options["default_author"])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['default_author']!r}.")
+
+        start = time.perf_counter()
+
+        def progress(imported, skipped):
+            if options["verbosity"] > 1:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"  {imported} recipes, {skipped} skipped ({imported / elapsed:,.0f}/s)...")
+
+        arguments = dict(
+            format=format, batch_size=options["batch_size"], workers=options["workers"],
+            create_authors=options["create_authors"], default_author=default_author,
+            index=not options["no_index"], progress=progress,
+        )
+        if path == "-":
+            result = import_recipes(sys.stdin, **arguments)
+        else:
+            with open(path, newline="", encoding="utf-8") as stream:
+                result = import_recipes(stream, **arguments)
+        elapsed = time.perf_counter() - start
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.skipped > len(result.errors):
+            self.stderr.write(f"... and {result.skipped - len(result.errors)} more invalid records.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported} recipes ({result.skipped} skipped) in {elapsed:.1f}s "
+            f"({result.imported / max(elapsed, 1e-9):,.0f} recipes/s)."
+        ))
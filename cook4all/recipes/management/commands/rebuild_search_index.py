@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the recipe full-text search index from the recipes table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of recipes read and indexed per batch (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        # One transaction so searches never see a half-built index
+        with transaction.atomic():
+            indexed = backend.rebuild(Recipe.objects.all(), batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} recipes with {type(backend).__name__}."
+        ))
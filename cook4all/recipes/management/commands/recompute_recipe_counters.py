@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored like/save/comment/rating counters on every recipe."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of recipes updated per transaction (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        pks = Recipe.objects.order_by("pk").values_list("pk", flat=True)
+
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += Recipe.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).recompute_counters()
+            last_pk = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed counters for {updated} recipes."))
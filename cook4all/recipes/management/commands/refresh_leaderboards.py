@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.leaderboards import refresh_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the cached recipe leaderboards (run from cron to keep them warm)."
+
+    def handle(self, *args, **options):
+        boards = refresh_leaderboards()
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed leaderboards: {len(boards['liked'])} liked, {len(boards['rated'])} rated."
+        ))
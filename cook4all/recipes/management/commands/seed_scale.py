@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, recipes, likes, saves, ratings "
+        "and comments, with power-law activity and popularity, using bulk "
+        "inserts. For load tests; never run it against production."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in (
+            ("users", 1000), ("recipes", 5000), ("likes", 50000),
+            ("saves", 10000), ("ratings", 20000), ("comments", 10000),
+        ):
+            parser.add_argument(
+                f"--{name}", type=int, default=default,
+                help=f"Number of {name} to add (default: {default}).",
+            )
+        parser.add_argument(
+            "--author-skew", type=float, default=1.2,
+            help="Power-law exponent of recipes per author; 0 is uniform (default: 1.2).",
+        )
+        parser.add_argument(
+            "--activity-skew", type=float, default=1.0,
+            help="Power-law exponent of likes, saves, ratings and comments per user (default: 1.0).",
+        )
+        parser.add_argument(
+            "--popularity-skew", type=float, default=1.1,
+            help="Power-law exponent of engagement per recipe (default: 1.1).",
+        )
+        parser.add_argument(
+            "--days", type=int, default=365,
+            help="Spread recipe and sign-up dates over this many past days (default: 365).",
+        )
+        parser.add_argument(
+            "--password",
+            help="Password of every new user (default: none, they cannot log in).",
+        )
+        parser.add_argument(
+            "--prefix", default="seed",
+            help="Username prefix of the new users (default: seed).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="Number of rows per bulk insert (default: 5000).",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Random seed; the same seed on an empty database gives the same data (default: 0).",
+        )
+        parser.add_argument(
+            "--no-index", action="store_true",
+            help="Skip the ingredient, duplicate and search indexes.",
+        )
+        parser.add_argument(
+            "--no-recommendations", action="store_true",
+            help="Skip building the recipe recommendations.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        counts = seed(
+            users=options["users"], recipes=options["recipes"], likes=options["likes"],
+            saves=options["saves"], ratings=options["ratings"], comments=options["comments"],
+            author_skew=options["author_skew"], activity_skew=options["activity_skew"],
+            popularity_skew=options["popularity_skew"], days=options["days"],
+            password=options["password"], prefix=options["prefix"], batch_size=options["batch_size"],
+            index=not options["no_index"], recommendations=not options["no_recommendations"],
+            random_seed=options["seed"], log=log,
+        )
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Added {summary} in {time.perf_counter() - start:.1f}s."))
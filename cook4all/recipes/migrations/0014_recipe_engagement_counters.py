@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:28
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Comment = apps.get_model('recipes', 'Comment')
+    Rating = apps.get_model('recipes', 'Rating')
+
+    def aggregate(queryset, expression):
+        values = queryset.order_by().values('recipe').annotate(v=expression).values('v')
+        return Coalesce(Subquery(values, output_field=IntegerField()), Value(0))
+
+    recipe = OuterRef('pk')
+    Recipe.objects.update(
+        like_count=aggregate(Recipe.likes.through.objects.filter(recipe=recipe), Count('pk')),
+        save_count=aggregate(Recipe.saved_by.through.objects.filter(recipe=recipe), Count('pk')),
+        comment_count=aggregate(Comment.objects.filter(recipe=recipe), Count('pk')),
+        rating_sum=aggregate(Rating.objects.filter(recipe=recipe), Sum('value')),
+        rating_count=aggregate(Rating.objects.filter(recipe=recipe), Count('pk')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_alter_recipe_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='like_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='save_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
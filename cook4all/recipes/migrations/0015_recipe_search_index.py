@@ -0,0 +1,43 @@
+from django.db import migrations
+
+SEARCH_FIELDS = ('title', 'description', 'ingredients', 'instructions')
+
+POSTGRES_VECTOR = " || ".join(
+    f"setweight(to_tsvector('english', coalesce({field}, '')), '{label}')"
+    for field, label in zip(SEARCH_FIELDS, ('A', 'B', 'C', 'D'))
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    columns = ', '.join(SEARCH_FIELDS)
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5({columns}, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO recipes_recipe_fts (rowid, {columns}) SELECT id, {columns} FROM recipes_recipe"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX recipes_recipe_search_idx ON recipes_recipe USING GIN (({POSTGRES_VECTOR}))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS recipes_recipe_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS recipes_recipe_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
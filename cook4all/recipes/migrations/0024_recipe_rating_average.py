@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:20
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Greatest
+
+
+def populate_rating_average(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(rating_average=ExpressionWrapper(
+        F('rating_sum') * 1.0 / Greatest(F('rating_count'), Value(1)), output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_duplicate_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(populate_rating_average, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['rating_average', 'created_at', 'id'], name='recipe_rating_average_idx'),
+        ),
+    ]
@@ -1,7 +1,68 @@
 from django.db import models
 from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField
-from django.db.models import Avg
+from django.db.models import (
+    Count, Exists, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Now
+
+
+def _subquery_aggregate(queryset, aggregate):
+    """Wrap a per-recipe queryset as a correlated aggregate subquery."""
+    values = queryset.order_by().values("recipe").annotate(v=aggregate).values("v")
+    return Coalesce(Subquery(values, output_field=IntegerField()), Value(0))
+
+
+def _average(total, count):
+    """total / count as a float; 0 for a recipe without ratings."""
+    return ExpressionWrapper(total * 1.0 / Greatest(count, Value(1)), output_field=FloatField())
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_stats(self, user=None):
+        """
+        Annotate each recipe with the numbers a recipe card or page displays,
+        so they cost one query instead of several per recipe:
+
+        num_likes, num_comments, num_ratings, avg_rating, and for `user`
+        is_liked, is_saved and my_rating (0 when not rated).
+        """
+        queryset = self.annotate(
+            num_likes=F("like_count"),
+            num_comments=F("comment_count"),
+            num_ratings=F("rating_count"),
+            avg_rating=F("rating_average"),
+        )
+
+        if user is not None and user.is_authenticated:
+            likes = Recipe.likes.through.objects.filter(recipe=OuterRef("pk"), user=user)
+            saves = Recipe.saved_by.through.objects.filter(recipe=OuterRef("pk"), user=user)
+            rating = Rating.objects.filter(recipe=OuterRef("pk"), user=user).values("value")
+            return queryset.annotate(
+                is_liked=Exists(likes),
+                is_saved=Exists(saves),
+                my_rating=Coalesce(Subquery(rating), Value(0)),
+            )
+        return queryset.annotate(is_liked=Value(False), is_saved=Value(False), my_rating=Value(0))
+
+    def recompute_counters(self):
+        """Rebuild the stored engagement counters from the source tables."""
+        recipe = OuterRef("pk")
+        updated = self.update(
+            like_count=_subquery_aggregate(
+                Recipe.likes.through.objects.filter(recipe=recipe), Count("pk")),
+            save_count=_subquery_aggregate(
+                Recipe.saved_by.through.objects.filter(recipe=recipe), Count("pk")),
+            comment_count=_subquery_aggregate(
+                Comment.objects.filter(recipe=recipe), Count("pk")),
+            rating_sum=_subquery_aggregate(
+                Rating.objects.filter(recipe=recipe), Sum("value")),
+            rating_count=_subquery_aggregate(
+                Rating.objects.filter(recipe=recipe), Count("pk")),
+        )
+        # From the rebuilt columns: an UPDATE's expressions see the old ones
+        self.update(rating_average=_average(F("rating_sum"), F("rating_count")))
+        return updated
 
 
 class Recipe(models.Model):
@@ -19,7 +80,12 @@ class Recipe(models.Model):
     ingredients = models.TextField()
     instructions = models.TextField()
     image = CloudinaryField('image', blank=True, null=True)
+    # Generated WebP/AVIF renditions of `image`, see images.pipeline
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to the recipe or to anything its pages show (counters
+    # included); drives the HTTP validators in recipes.conditional
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Likes field
     likes = models.ManyToManyField(User, related_name="liked_recipes", blank=True)
@@ -30,15 +96,56 @@ class Recipe(models.Model):
     # ⭐ Category field
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
 
+    # Denormalized engagement counters, kept in sync by the views that change
+    # them and repairable with `manage.py recompute_recipe_counters`
+    like_count = models.PositiveIntegerField(default=0)
+    save_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # rating_sum / rating_count, stored so that "Top rated" sorts on an index
+    rating_average = models.FloatField(default=0)
+
+    # Required (non-optional) parsed ingredients, see recipes.ingredients
+    ingredient_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Sort keys of RecipeListView's keyset pagination
+            models.Index(fields=["created_at", "id"], name="recipe_created_idx"),
+            models.Index(fields=["like_count", "created_at", "id"], name="recipe_like_count_idx"),
+            # Category filter on the recipe list, newest first
+            models.Index(fields=["category", "created_at", "id"], name="recipe_category_created_idx"),
+            # "My recipes", newest first
+            models.Index(fields=["author", "created_at"], name="recipe_author_created_idx"),
+            models.Index(fields=["rating_average", "created_at", "id"], name="recipe_rating_average_idx"),
+            # The rating leaderboard only considers recipes that have ratings
+            models.Index(fields=["rating_count"], name="recipe_rating_count_idx"),
+            # Latest change across all recipes, for list/search validators
+            models.Index(fields=["updated_at"], name="recipe_updated_idx"),
+        ]
+
     def total_likes(self):
         """Return the total number of likes for this recipe."""
-        return self.likes.count()
+        return self.like_count
 
     @property
     def average_rating(self):
         """Return the average rating (1-5) for this recipe."""
-        agg = self.ratings.aggregate(avg=Avg('value'))
-        return agg['avg'] or 0
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
+
+    def adjust_counters(self, **deltas):
+        """Atomically add the given deltas to this recipe's stored counters."""
+        values = {field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()}
+        if "rating_sum" in values or "rating_count" in values:
+            values["rating_average"] = _average(
+                values.get("rating_sum", F("rating_sum")), values.get("rating_count", F("rating_count"))
+            )
+        Recipe.objects.filter(pk=self.pk).update(updated_at=Now(), **values)
 
     def user_rating_for(self, user):
         """Return the rating value a given user gave this recipe, or 0."""
@@ -56,6 +163,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A recipe's comment thread, newest first
+            models.Index(fields=["recipe", "created_at", "id"], name="comment_recipe_created_idx"),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.recipe.title}"
 
@@ -68,3 +181,94 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ('user', 'recipe')
+        indexes = [
+            # Covers averaging a recipe's ratings without touching the table
+            models.Index(fields=["recipe", "value"], name="rating_recipe_value_idx"),
+        ]
+
+
+class Ingredient(models.Model):
+    # Normalized by recipes.ingredients.normalize_name: lower case, singular
+    name = models.CharField(max_length=100, unique=True)
+    # Number of recipes using it: the length of its posting list
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIngredient(models.Model):
+    """One parsed ingredient of a recipe; maintained by recipes.ingredients."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="parsed_ingredients")
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name="recipe_ingredients")
+    position = models.PositiveSmallIntegerField(default=0)
+    quantity = models.FloatField(null=True, blank=True)
+    unit = models.CharField(max_length=20, blank=True)
+    optional = models.BooleanField(default=False)
+    # The recipe's ingredient_count, copied here so "missing at most N"
+    # lookups can skip long recipes without leaving the index
+    recipe_size = models.PositiveSmallIntegerField(default=0)
+    # The line as the author wrote it
+    raw = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ["recipe", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["recipe", "ingredient"], name="recipe_ingredient_unique"),
+        ]
+        indexes = [
+            # The inverted index: the recipes using an ingredient, shortest
+            # recipes first
+            models.Index(
+                fields=["ingredient", "recipe_size", "optional", "recipe"], name="ingredient_recipe_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient} in {self.recipe_id}"
+
+
+class RecipeNeighbor(models.Model):
+    """A similar recipe, precomputed by recipes.recommendations."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="neighbors")
+    neighbor = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="neighbor_of")
+    # 0 is the most similar
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # A recipe's neighbours in order: one range read
+            models.Index(fields=["recipe", "rank"], name="recipe_neighbor_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+class RecipeSignature(models.Model):
+    """A recipe's MinHash signature; maintained by recipes.duplicates."""
+
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name="signature")
+    # duplicates.NUM_PERM unsigned 32-bit ints, little-endian
+    minhashes = models.BinaryField()
+
+    def __str__(self):
+        return f"signature of {self.recipe_id}"
+
+
+class SignatureBucket(models.Model):
+    """One LSH band of a recipe's signature: recipes in the same bucket are candidate duplicates."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="signature_buckets")
+    bucket = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["bucket", "recipe"], name="signature_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} in {self.bucket}"
@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination.
+
+Paginator pages with COUNT(*) and OFFSET, so every page costs a count of the
+whole result and page N has to step over N * per_page rows first. Here each
+page is instead a range seek on the sort key: "rows after the last row of the
+previous page". With an index on that key, page 10,000 costs the same as
+page 1. Cursors are signed, opaque tokens holding the boundary row's sort
+values and the direction to read in.
+"""
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = "recipes.pagination.cursor"
+
+
+def approximate_count(queryset, cap=1000):
+    """
+    Count `queryset` but stop after `cap` rows, so the cost stays bounded.
+    Returns (count, exact); `exact` is False when there are more than `cap`.
+    """
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count <= cap
+
+
+def _encode(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return self.paginator.cursor_for(self.object_list[-1], "next")
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous:
+            return self.paginator.cursor_for(self.object_list[0], "previous")
+        return None
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` by `ordering`, a sequence of field or annotation
+    names (with "-" for descending) whose last entry must be unique, e.g.
+    ("-created_at", "-id").
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = [
+            (name.lstrip("-"), name.startswith("-")) for name in ordering
+        ]
+        self.per_page = per_page
+
+    def cursor_for(self, obj, direction):
+        values = [_encode(getattr(obj, name)) for name, _ in self.ordering]
+        return signing.dumps({"d": direction[0], "k": values}, salt=CURSOR_SALT)
+
+    def decode(self, cursor):
+        """Return (direction, key values), or (None, None) for a bad cursor."""
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None, None
+        if data.get("d") not in ("n", "p") or len(data.get("k", ())) != len(self.ordering):
+            return None, None
+        return data["d"], data["k"]
+
+    def _seek(self, values, forward):
+        # (a, b, c) after (x, y, z) == a > x OR (a = x AND b > y) OR ...
+        # The leading a >= x is redundant but lets the database seek the index
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            after = "lt" if descending == forward else "gt"
+            condition |= equal & Q(**{f"{name}__{after}": value})
+            equal &= Q(**{name: value})
+
+        name, descending = self.ordering[0]
+        leading = "lte" if descending == forward else "gte"
+        return Q(**{f"{name}__{leading}": values[0]}) & condition
+
+    def _order_by(self, forward):
+        return [
+            f"-{name}" if descending == forward else name
+            for name, descending in self.ordering
+        ]
+
+    def get_page(self, cursor=None):
+        direction, values = self.decode(cursor) if cursor else (None, None)
+        forward = direction != "p"
+
+        queryset = self.queryset.order_by(*self._order_by(forward))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+
+        # One extra row tells us whether there is another page beyond this one
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            return KeysetPage(rows, self, has_next=has_more, has_previous=values is not None)
+        rows.reverse()
+        return KeysetPage(rows, self, has_next=True, has_previous=has_more)
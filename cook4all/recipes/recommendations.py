@@ -0,0 +1,221 @@
+"""
+"You might also like": item-to-item collaborative filtering.
+
+Every like, save and positive rating is an implicit vote for a recipe. With
+one row per user and one column per recipe, those votes form a sparse
+matrix X (X[u, i] is how strongly user u showed interest in recipe i). The
+co-occurrence matrix X^T X says how often two recipes were liked by the
+same people; normalizing it by the column norms gives the cosine similarity
+between recipes:
+
+    sim(i, j) = (X^T X)[i, j] / (|X[:, i]| * |X[:, j]|) * n / (n + shrink)
+
+where n is the number of users who voted for both, so that a pair seen
+once doesn't outrank a pair seen a hundred times.
+
+`build_recommendations()` computes this in a batch job (`manage.py
+build_recommendations`, from cron) and stores the top-K neighbours of each
+recipe as RecipeNeighbor rows. The recipe page reads its neighbours with
+one indexed query (cached), and a user's feed sums the neighbours of the
+recipes they engaged with.
+
+The product is computed user by user over the sparse rows in plain Python,
+as NumPy/SciPy are not dependencies of this project. The cost is the sum
+over users of (recipes per user)^2, capped by RECIPES_RECOMMENDATION_MAX_USER_ITEMS.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import fragment_cache_timeout, invalidate_recommendations, recommendations_version
+from .models import Rating, Recipe, RecipeNeighbor
+
+# How much each kind of engagement counts towards "this user liked it"
+LIKE_WEIGHT = 1.0
+SAVE_WEIGHT = 2.0
+# Ratings below 4 are not a sign of liking the recipe
+RATING_WEIGHTS = {4: 1.0, 5: 2.0}
+
+
+def neighbor_count():
+    return getattr(settings, "RECIPES_RECOMMENDATION_NEIGHBORS", 20)
+
+
+def shrinkage():
+    return getattr(settings, "RECIPES_RECOMMENDATION_SHRINK", 10.0)
+
+
+def max_user_items():
+    return getattr(settings, "RECIPES_RECOMMENDATION_MAX_USER_ITEMS", 500)
+
+
+# ---------------------------------------
+# Interactions
+# ---------------------------------------
+def interactions(user=None):
+    """Yield (user_id, recipe_id, weight) for every positive engagement."""
+    likes = Recipe.likes.through.objects.all()
+    saves = Recipe.saved_by.through.objects.all()
+    ratings = Rating.objects.filter(value__in=RATING_WEIGHTS)
+    if user is not None:
+        likes, saves, ratings = likes.filter(user=user), saves.filter(user=user), ratings.filter(user=user)
+
+    # Streamed with iterator(): the full history doesn't fit in memory twice
+    for user_id, recipe_id in likes.values_list("user_id", "recipe_id").iterator(chunk_size=10000):
+        yield user_id, recipe_id, LIKE_WEIGHT
+    for user_id, recipe_id in saves.values_list("user_id", "recipe_id").iterator(chunk_size=10000):
+        yield user_id, recipe_id, SAVE_WEIGHT
+    for user_id, recipe_id, value in ratings.values_list("user_id", "recipe_id", "value").iterator(chunk_size=10000):
+        yield user_id, recipe_id, RATING_WEIGHTS[value]
+
+
+# ---------------------------------------
+# Batch job
+# ---------------------------------------
+def compute_neighbors(interactions, k=None, shrink=None, user_items=None):
+    """
+    Top-`k` most similar recipes for every recipe in `interactions`, an
+    iterable of (user_id, recipe_id, weight): {recipe_id: [(neighbor_id, score)]}.
+    """
+    k = k or neighbor_count()
+    shrink = shrinkage() if shrink is None else shrink
+    user_items = user_items or max_user_items()
+
+    # The rows of X: each user's recipes and weights
+    rows = defaultdict(dict)
+    for user_id, recipe_id, weight in interactions:
+        row = rows[user_id]
+        row[recipe_id] = row.get(recipe_id, 0.0) + weight
+
+    # X^T X, accumulated one user (one row of X) at a time. Only the upper
+    # triangle is built; the matrix is symmetric.
+    squared_norms = defaultdict(float)
+    products = defaultdict(dict)   # i -> {j: [dot product, users in common]} for i < j
+    for row in rows.values():
+        if len(row) > user_items:
+            # A handful of very active accounts would dominate the cost
+            row = dict(heapq.nlargest(user_items, row.items(), key=lambda item: (item[1], item[0])))
+        items = sorted(row.items())
+        for index, (i, weight_i) in enumerate(items):
+            squared_norms[i] += weight_i * weight_i
+            products_i = products[i]
+            for j, weight_j in items[index + 1:]:
+                cell = products_i.get(j)
+                if cell is None:
+                    products_i[j] = [weight_i * weight_j, 1]
+                else:
+                    cell[0] += weight_i * weight_j
+                    cell[1] += 1
+
+    norms = {recipe_id: math.sqrt(value) for recipe_id, value in squared_norms.items()}
+    similar = defaultdict(list)
+    for i, row in products.items():
+        for j, (dot, common) in row.items():
+            score = dot / (norms[i] * norms[j]) * common / (common + shrink)
+            similar[i].append((score, j))
+            similar[j].append((score, i))
+
+    return {
+        recipe_id: [(neighbor, score) for score, neighbor in heapq.nlargest(k, candidates)]
+        for recipe_id, candidates in similar.items()
+    }
+
+
+def store_neighbors(neighbors, batch_size=5000):
+    """Replace every RecipeNeighbor row with `neighbors`; returns the row count."""
+    existing = set(Recipe.objects.values_list("pk", flat=True))
+    written = 0
+    with transaction.atomic():
+        RecipeNeighbor.objects.all().delete()
+        batch = []
+        for recipe_id, ranked in neighbors.items():
+            if recipe_id not in existing:
+                continue
+            rank = 0
+            for neighbor_id, score in ranked:
+                if neighbor_id not in existing:
+                    continue
+                batch.append(RecipeNeighbor(
+                    recipe_id=recipe_id, neighbor_id=neighbor_id, rank=rank, score=score,
+                ))
+                rank += 1
+            if len(batch) >= batch_size:
+                RecipeNeighbor.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        RecipeNeighbor.objects.bulk_create(batch)
+        written += len(batch)
+        transaction.on_commit(invalidate_recommendations)
+    return written
+
+
+def build_recommendations(k=None, shrink=None):
+    """Recompute and store every recipe's neighbours from the engagement tables."""
+    return store_neighbors(compute_neighbors(interactions(), k=k, shrink=shrink))
+
+
+# ---------------------------------------
+# Reading
+# ---------------------------------------
+def similar_recipes(recipe, limit=6):
+    """The recipes most similar to `recipe`, best first (cached)."""
+    key = f"recipes:similar:{recipe.pk}:{limit}:{recommendations_version()}"
+
+    def compute():
+        rows = (
+            RecipeNeighbor.objects.filter(recipe=recipe).order_by("rank")
+            .select_related("neighbor")
+            .only("score", "neighbor__title", "neighbor__image", "neighbor__image_variants")[:limit]
+        )
+        similar = []
+        for row in rows:
+            row.neighbor.similarity = row.score
+            similar.append(row.neighbor)
+        return similar
+
+    return cache.get_or_set(key, compute, fragment_cache_timeout())
+
+
+def recommended_for(user, limit=6, seeds=100):
+    """
+    Recipes for `user`: the neighbours of the recipes they liked, saved or
+    rated well, each weighted by that engagement, excluding recipes they
+    already engaged with or wrote. Empty without engagement history.
+    """
+    # The ranking is cached; the recipes themselves are read fresh
+    key = f"recipes:feed:{user.pk}:{limit}:{recommendations_version()}"
+    ranked = cache.get(key)
+    if ranked is None:
+        history = {}
+        for _, recipe_id, weight in interactions(user):
+            history[recipe_id] = history.get(recipe_id, 0.0) + weight
+        # Strongest engagement first, then the newest recipes
+        strongest = heapq.nlargest(seeds, history, key=lambda recipe_id: (history[recipe_id], recipe_id))
+
+        scores = defaultdict(float)
+        for recipe_id, neighbor_id, score in (
+            RecipeNeighbor.objects.filter(recipe_id__in=strongest)
+            .values_list("recipe_id", "neighbor_id", "score")
+        ):
+            if neighbor_id not in history:
+                scores[neighbor_id] += history[recipe_id] * score
+
+        # Extra candidates make up for the user's own recipes dropped below
+        ranked = heapq.nlargest(limit * 2, scores.items(), key=lambda item: (item[1], item[0]))
+        cache.set(key, ranked, getattr(settings, "RECIPES_FEED_CACHE_TIMEOUT", 300))
+
+    if not ranked:
+        return []
+    scores = dict(ranked)
+    recipes = (
+        Recipe.objects.filter(pk__in=scores).exclude(author=user)
+        .only("title", "image", "image_variants", "category")
+    )
+    feed = sorted(recipes, key=lambda recipe: (-scores[recipe.pk], -recipe.pk))[:limit]
+    for recipe in feed:
+        recipe.recommendation_score = scores[recipe.pk]
+    return feed
@@ -0,0 +1,211 @@
+"""
+Full-text search over recipes.
+
+The backend is picked from the database engine (SQLite FTS5, PostgreSQL
+tsvector) unless settings.RECIPES_SEARCH_BACKEND names one explicitly.
+Every backend exposes the same small interface: `search()` narrows and ranks
+a Recipe queryset, `index()`/`remove()` keep the index current (and
+`index_many()` for recipes created in bulk) and `rebuild()` refills it from
+scratch.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .caching import search_version
+
+SEARCH_FIELDS = ("title", "description", "ingredients", "instructions")
+
+# Relative weight of each field when ranking, in SEARCH_FIELDS order
+FIELD_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(query):
+    """Split a user query into plain words, dropping any search syntax."""
+    return WORD_RE.findall(query or "")
+
+
+class BaseSearchBackend:
+    def search(self, queryset, query):
+        """Return `queryset` narrowed to matches for `query`, best match first."""
+        raise NotImplementedError
+
+    def index(self, recipe):
+        pass
+
+    def index_many(self, recipes):
+        for recipe in recipes:
+            self.index(recipe)
+
+    def remove(self, recipe_id):
+        pass
+
+    def rebuild(self, queryset, batch_size=1000):
+        """Re-index every recipe in `queryset`; returns the number indexed."""
+        return 0
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """Unindexed fallback: substring match on title and description."""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    """FTS5 virtual table keyed by recipe id, ranked with bm25()."""
+
+    table = "recipes_recipe_fts"
+
+    def match_expression(self, query):
+        # Each word becomes a quoted prefix term so typeahead input matches
+        return " ".join(f'"{term}"*' for term in search_terms(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+
+        weights = ", ".join(str(weight) for weight in FIELD_WEIGHTS)
+        recipe_table = queryset.model._meta.db_table
+        # A join rather than a subquery: bm25() is only available on the row
+        # the MATCH produced, and a correlated MATCH per recipe is quadratic.
+        return (
+            queryset
+            .extra(
+                tables=[self.table],
+                where=[f"{self.table}.rowid = {recipe_table}.id", f"{self.table} MATCH %s"],
+                params=[match],
+                select={"search_rank": f"bm25({self.table}, {weights})"},
+            )
+            # bm25() is negative; smaller means more relevant
+            .order_by("search_rank", "-created_at")
+        )
+
+    def index(self, recipe):
+        columns = ", ".join(SEARCH_FIELDS)
+        placeholders = ", ".join(["%s"] * (len(SEARCH_FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [recipe.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, {columns}) VALUES ({placeholders})",
+                [recipe.pk] + [getattr(recipe, field) for field in SEARCH_FIELDS],
+            )
+
+    def index_many(self, recipes):
+        columns = ", ".join(SEARCH_FIELDS)
+        placeholders = ", ".join(["%s"] * (len(SEARCH_FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[recipe.pk] for recipe in recipes])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {columns}) VALUES ({placeholders})",
+                [[recipe.pk] + [getattr(recipe, field) for field in SEARCH_FIELDS] for recipe in recipes],
+            )
+
+    def remove(self, recipe_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [recipe_id])
+
+    def rebuild(self, queryset, batch_size=1000):
+        columns = ", ".join(SEARCH_FIELDS)
+        placeholders = ", ".join(["%s"] * (len(SEARCH_FIELDS) + 1))
+        rows = queryset.order_by("pk").values_list("pk", *SEARCH_FIELDS)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+        indexed = 0
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {self.table} (rowid, {columns}) VALUES ({placeholders})",
+                    batch,
+                )
+            indexed += len(batch)
+            last_pk = batch[-1][0]
+        return indexed
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Matches against the same weighted tsvector expression that the
+    recipes_recipe_search_idx GIN index is built on, so PostgreSQL keeps
+    the index current itself and index()/rebuild() have nothing to do.
+    """
+
+    config = "english"
+
+    @classmethod
+    def vector_sql(cls, table=None):
+        prefix = f'"{table}".' if table else ""
+        labels = ("A", "B", "C", "D")
+        return " || ".join(
+            f"setweight(to_tsvector('{cls.config}', coalesce({prefix}{field}, '')), '{label}')"
+            for field, label in zip(SEARCH_FIELDS, labels)
+        )
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        vector = self.vector_sql(queryset.model._meta.db_table)
+        return (
+            queryset
+            .alias(search_match=RawSQL(
+                f"({vector}) @@ to_tsquery('{self.config}', %s)",
+                (tsquery,),
+                output_field=BooleanField(),
+            ))
+            .filter(search_match=True)
+            .annotate(search_rank=RawSQL(
+                f"ts_rank_cd({vector}, to_tsquery('{self.config}', %s))",
+                (tsquery,),
+                output_field=FloatField(),
+            ))
+            .order_by("-search_rank", "-created_at")
+        )
+
+    def rebuild(self, queryset, batch_size=1000):
+        return queryset.count()
+
+
+VENDOR_BACKENDS = {
+    "sqlite": SQLiteFTS5SearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    path = getattr(settings, "RECIPES_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, IContainsSearchBackend)()
+
+
+def search_recipes(queryset, query):
+    return get_search_backend().search(queryset, query)
+
+
+# ---------------------------------------
+# Result cache
+# ---------------------------------------
+def search_cache_key(*parts):
+    """Cache key for a search result, scoped to the current index version."""
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f"recipes:search:{search_version()}:{digest}"
@@ -0,0 +1,252 @@
+"""
+Synthetic data at production scale, for load tests and benchmarks.
+
+`seed()` (and `manage.py seed_scale`) adds users, recipes, likes, saves,
+ratings and comments with bulk inserts. Who acts and what they act on
+follow power laws, as on real sites: each user and each recipe gets a Zipf
+weight 1 / rank^skew, so a few prolific authors write much of the catalogue,
+a few heavy users do much of the liking and a few recipes collect most of
+the likes, while most users and recipes make up the long tail. A skew of 0
+makes everything uniform; higher values concentrate the activity.
+
+Rows are inserted with bulk_create, which sends no signals, so once
+everything is in, the stored counters are recomputed and the ingredient,
+duplicate and search indexes and the recommendations are built in batches,
+as the backfill commands would.
+"""
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import Profile
+
+from . import duplicates, ingredients
+from .caching import invalidate_pages, invalidate_recommendations, invalidate_search_cache
+from .leaderboards import invalidate_leaderboards
+from .models import Comment, Rating, Recipe
+from .recommendations import build_recommendations
+from .search import get_search_backend
+
+FOODS = (
+    "chicken breast", "egg", "onion", "garlic", "butter", "olive oil", "flour", "sugar", "milk",
+    "tomato", "rice", "potato", "carrot", "lemon", "parmesan", "spinach", "basil", "beef mince",
+    "salmon fillet", "tofu", "pasta", "cream", "cheddar", "mushroom", "bell pepper", "ginger",
+    "soy sauce", "honey", "chickpeas", "coconut milk", "cumin", "paprika", "thyme", "rosemary",
+    "yogurt", "banana", "apple", "oats", "chocolate", "vanilla", "cinnamon", "lime", "chili",
+    "coriander", "shrimp", "bacon", "zucchini", "eggplant", "feta", "black beans", "corn",
+    "avocado", "noodles", "pork shoulder", "lentils", "kale", "almonds", "maple syrup", "peas",
+)
+UNITS = ("", "1", "2", "3", "1 cup", "2 cups", "½ cup", "1 tbsp", "2 tbsp", "1 tsp", "200g", "500g", "1 can")
+PREPARATION = ("", "", "", ", chopped", ", diced", ", minced", ", sliced", " (optional)", ", to taste")
+STYLES = ("Spicy", "Creamy", "Quick", "Easy", "Classic", "Roasted", "Grilled", "Crispy", "Smoky", "Lemony",
+          "Garlicky", "Weeknight", "Grandma's", "One-pot", "Sticky", "Herby")
+DISHES = ("Curry", "Stew", "Salad", "Soup", "Bake", "Pasta", "Stir-fry", "Tacos", "Pie", "Risotto",
+          "Bowl", "Traybake", "Pancakes", "Muffins", "Cake", "Omelette", "Sandwich", "Skewers")
+STEPS = (
+    "Heat the {a} in a large pan over medium heat.",
+    "Add the {a} and cook for {n} minutes, stirring often.",
+    "Stir in the {a} and {b} and season well.",
+    "Whisk the {a} with the {b} until smooth.",
+    "Simmer gently for {n} minutes until thickened.",
+    "Bake for {n} minutes until golden.",
+    "Fold through the {a} and let it rest for {n} minutes.",
+    "Serve topped with the {a}.",
+)
+COMMENTS = (
+    "Made this tonight and the whole family loved it!",
+    "Great recipe, I added extra {a}.",
+    "A bit bland for me, next time more {a}.",
+    "Could I swap the {a} for {b}?",
+    "Perfect weeknight dinner, thanks for sharing.",
+    "This is now a regular in our house.",
+    "Took longer than {n} minutes but worth it.",
+)
+# Star ratings lean positive, as they do on recipe sites
+RATING_WEIGHTS = {1: 0.05, 2: 0.07, 3: 0.18, 4: 0.35, 5: 0.35}
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights 1 / rank^skew, for random.choices(cum_weights=...)."""
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def _ranked(rng, items):
+    """`items` in a random order: ranks for the power law, uncorrelated with ids."""
+    items = list(items)
+    rng.shuffle(items)
+    return items
+
+
+def recipe_fields(rng, food_weights):
+    """Title, description, ingredients and instructions of one synthetic recipe."""
+    foods = list(dict.fromkeys(rng.choices(FOODS, cum_weights=food_weights, k=rng.randint(5, 12))))
+    main = foods[0]
+    lines = [f"{rng.choice(UNITS)} {food}{rng.choice(PREPARATION)}".strip() for food in foods]
+    steps = [
+        rng.choice(STEPS).format(a=rng.choice(foods), b=rng.choice(foods), n=rng.randint(2, 45))
+        for _ in range(rng.randint(3, 9))
+    ]
+    return {
+        "title": f"{rng.choice(STYLES)} {main.title()} {rng.choice(DISHES)}",
+        "description": f"A {rng.choice(STYLES).lower()} take on {main} with {foods[-1]}.",
+        "ingredients": "\n".join(lines),
+        "instructions": " ".join(steps),
+    }
+
+
+def _pairs(rng, users, user_weights, recipes, recipe_weights, count):
+    """Up to `count` distinct (user, recipe) pairs drawn from the power laws."""
+    pairs = set()
+    # Popular pairs repeat; a few rounds of redraws make up for them
+    for _ in range(5):
+        missing = count - len(pairs)
+        if missing <= 0:
+            break
+        pairs.update(zip(
+            rng.choices(users, cum_weights=user_weights, k=missing),
+            rng.choices(recipes, cum_weights=recipe_weights, k=missing),
+        ))
+    return list(pairs)[:count]
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed(users=1000, recipes=5000, likes=50000, saves=10000, ratings=20000, comments=10000,
+         author_skew=1.2, activity_skew=1.0, popularity_skew=1.1, days=365, password=None,
+         prefix="seed", batch_size=5000, index=True, recommendations=True, random_seed=0, log=None):
+    """
+    Insert synthetic data; returns {"users": n, "recipes": n, ...}, the rows
+    actually written (likes, saves and ratings are distinct per user and
+    recipe, so a very skewed run may write fewer than asked).
+    """
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    counts = {}
+    now = timezone.now()
+
+    def step(name, started):
+        log(f"{name}: {counts.get(name, '')} in {time.perf_counter() - started:.1f}s")
+
+    # Users, numbered after any earlier seeded ones; one password hash for all
+    started = time.perf_counter()
+    first = User.objects.filter(username__startswith=prefix).count()
+    hashed = make_password(password)
+    new_users = []
+    for batch in _batches(range(first, first + users), batch_size):
+        with transaction.atomic():
+            created = User.objects.bulk_create([
+                User(username=f"{prefix}{number}", password=hashed,
+                     date_joined=now - timedelta(days=rng.uniform(0, days)))
+                for number in batch
+            ])
+            Profile.objects.bulk_create([Profile(user=user) for user in created])
+        new_users.extend(user.pk for user in created)
+    counts["users"] = len(new_users)
+    step("users", started)
+
+    # Recipes, by authors drawn from the power law, dated over `days`
+    started = time.perf_counter()
+    food_weights = zipf_weights(len(FOODS), 1.0)
+    authors = _ranked(rng, new_users)
+    author_weights = zipf_weights(len(authors), author_skew)
+    categories = [key for key, _ in Recipe.CATEGORY_CHOICES]
+    recipe_ids = []
+    for batch in _batches(range(recipes), batch_size):
+        rows = [
+            Recipe(author_id=author_id, category=rng.choice(categories), **recipe_fields(rng, food_weights))
+            for author_id in rng.choices(authors, cum_weights=author_weights, k=len(batch))
+        ]
+        with transaction.atomic():
+            Recipe.objects.bulk_create(rows)
+            # bulk_create stamps created_at with the current time (auto_now_add)
+            for recipe in rows:
+                recipe.created_at = now - timedelta(days=rng.uniform(0, days))
+            Recipe.objects.bulk_update(rows, ["created_at"], batch_size=1000)
+        recipe_ids.extend(recipe.pk for recipe in rows)
+    counts["recipes"] = len(recipe_ids)
+    step("recipes", started)
+
+    # Engagement: active users acting on popular recipes
+    actors = _ranked(rng, new_users)
+    actor_weights = zipf_weights(len(actors), activity_skew)
+    ranked_recipes = _ranked(rng, recipe_ids)
+    recipe_weights = zipf_weights(len(ranked_recipes), popularity_skew)
+
+    def draw(count):
+        return _pairs(rng, actors, actor_weights, ranked_recipes, recipe_weights, count)
+
+    for name, through in (("likes", Recipe.likes.through), ("saves", Recipe.saved_by.through)):
+        started = time.perf_counter()
+        pairs = draw({"likes": likes, "saves": saves}[name])
+        for batch in _batches(pairs, batch_size):
+            through.objects.bulk_create(
+                [through(user_id=user_id, recipe_id=recipe_id) for user_id, recipe_id in batch],
+                ignore_conflicts=True,
+            )
+        counts[name] = len(pairs)
+        step(name, started)
+
+    started = time.perf_counter()
+    values, value_weights = zip(*RATING_WEIGHTS.items())
+    pairs = draw(ratings)
+    for batch in _batches(pairs, batch_size):
+        Rating.objects.bulk_create([
+            Rating(user_id=user_id, recipe_id=recipe_id, value=value)
+            for (user_id, recipe_id), value in zip(batch, rng.choices(values, value_weights, k=len(batch)))
+        ], ignore_conflicts=True)
+    counts["ratings"] = len(pairs)
+    step("ratings", started)
+
+    # Comments are not distinct: a popular recipe gets long threads
+    started = time.perf_counter()
+    for batch in _batches(range(comments), batch_size):
+        Comment.objects.bulk_create([
+            Comment(
+                author_id=user_id, recipe_id=recipe_id,
+                content=rng.choice(COMMENTS).format(a=rng.choice(FOODS), b=rng.choice(FOODS), n=rng.randint(10, 60)),
+            )
+            for user_id, recipe_id in zip(
+                rng.choices(actors, cum_weights=actor_weights, k=len(batch)),
+                rng.choices(ranked_recipes, cum_weights=recipe_weights, k=len(batch)),
+            )
+        ])
+    counts["comments"] = comments
+    step("comments", started)
+
+    # What the signals would have maintained
+    started = time.perf_counter()
+    for batch in _batches(sorted(recipe_ids), batch_size):
+        with transaction.atomic():
+            Recipe.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).recompute_counters()
+    step("counters", started)
+
+    if index:
+        started = time.perf_counter()
+        backend = get_search_backend()
+        for batch in _batches(sorted(recipe_ids), 1000):
+            rows = list(Recipe.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).order_by("pk"))
+            with transaction.atomic():
+                ingredients.index_recipes(rows)
+                duplicates.index_recipes(rows)
+                backend.index_many(rows)
+        step("indexes", started)
+
+    if recommendations:
+        started = time.perf_counter()
+        counts["neighbors"] = build_recommendations()
+        step("neighbors", started)
+
+    invalidate_pages()
+    invalidate_search_cache()
+    invalidate_leaderboards()
+    invalidate_recommendations()
+    return counts
@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from tasks.queue import task
+
+from .caching import invalidate_recipe, invalidate_search_cache
+from . import duplicates, ingredients
+from .leaderboards import invalidate_leaderboards
+from .models import Comment, Ingredient, Rating, Recipe
+from .search import get_search_backend
+
+
+@task
+def index_recipe(recipe_id, indexes):
+    """Background job: bring the named indexes up to date for one recipe."""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None:
+        # Deleted since; the delete signals have cleaned up after it
+        return
+    if "search" in indexes:
+        get_search_backend().index(recipe)
+        invalidate_search_cache()
+    if "ingredients" in indexes:
+        ingredients.index_recipe(recipe)
+    if "signature" in indexes:
+        duplicates.index_recipe(recipe)
+
+
+@receiver(post_save, sender=Recipe)
+def queue_recipe_indexing(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Parsing ingredients and hashing signatures is too slow for the request;
+    # the ingredient index and signatures only read some of the fields
+    if raw:
+        return
+    indexes = ["search"]
+    if update_fields is None or "ingredients" in update_fields:
+        indexes.append("ingredients")
+    if update_fields is None or {"title", "ingredients", "instructions"} & set(update_fields):
+        indexes.append("signature")
+    # One job per saved version of the recipe, however often it is enqueued
+    version = instance.updated_at.isoformat()
+    index_recipe.enqueue(
+        instance.pk, indexes,
+        idempotency_key=f"recipes.index_recipe:{instance.pk}:{version}:{','.join(indexes)}",
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+    invalidate_search_cache()
+
+
+@receiver(pre_delete, sender=Recipe)
+def unindex_recipe_ingredients(sender, instance, **kwargs):
+    # The RecipeIngredient rows go with the recipe; shorten their posting lists
+    Ingredient.objects.filter(recipe_ingredients__recipe=instance).update(
+        recipe_count=F("recipe_count") - 1
+    )
+
+
+# Leaderboards read the stored counters, which the views update after the
+# triggering write, so only mark them stale once the transaction commits:
+# on likes, comments and ratings, whose counts the rails show, and on saves
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def recipe_engagement_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_leaderboards)
+
+
+@receiver(m2m_changed, sender=Recipe.likes.through)
+@receiver(m2m_changed, sender=Recipe.saved_by.through)
+def recipe_likes_or_saves_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(invalidate_leaderboards)
+
+
+# Cached pages and fragments show the counters too, so they are likewise
+# retired once the write has committed
+def _invalidate_recipe_on_commit(recipe_id):
+    transaction.on_commit(lambda: invalidate_recipe(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    _invalidate_recipe_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def recipe_child_changed(sender, instance, **kwargs):
+    _invalidate_recipe_on_commit(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.likes.through)
+@receiver(m2m_changed, sender=Recipe.saved_by.through)
+def recipe_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    # From the user side (user.saved_recipes.add(...)) the recipes are in pk_set
+    recipe_ids = (pk_set or ()) if reverse else [instance.pk]
+    for recipe_id in recipe_ids:
+        _invalidate_recipe_on_commit(recipe_id)
@@ -0,0 +1,29 @@
+document.addEventListener("DOMContentLoaded", function () {
+
+    // -------------------------------
+    // "Load more" comments
+    // -------------------------------
+    const loadMore = document.getElementById("load-more-comments");
+    const commentList = document.getElementById("comment-list");
+
+    if (loadMore && commentList) {
+        loadMore.addEventListener("click", function (event) {
+            event.preventDefault();
+
+            const url = `${loadMore.dataset.url}?cursor=${encodeURIComponent(loadMore.dataset.cursor)}`;
+            fetch(url, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+                .then(response => response.json())
+                .then(data => {
+                    commentList.insertAdjacentHTML("beforeend", data.html);
+
+                    if (data.next) {
+                        loadMore.dataset.cursor = data.next;
+                    } else {
+                        loadMore.remove();
+                    }
+                })
+                .catch(err => console.error("Comments error:", err));
+        });
+    }
+
+});
@@ -68,6 +68,44 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     }
 
+    // -------------------------------
+    // Like / Save without a page reload
+    // -------------------------------
+    // Bound on the document, so only once even if the script is included twice
+    if (!window.__recipeApiBound) {
+        window.__recipeApiBound = true;
+        document.addEventListener("submit", function (event) {
+            const form = event.target.closest("form[data-api-url]");
+            if (!form) return;
+            event.preventDefault();
+
+            fetch(form.dataset.apiUrl, {
+                method: "POST",
+                headers: {
+                    "X-CSRFToken": form.querySelector("[name=csrfmiddlewaretoken]").value,
+                    "X-Requested-With": "XMLHttpRequest",
+                },
+            })
+                .then(response => {
+                    if (!response.ok) throw new Error(response.status);
+                    return response.json();
+                })
+                .then(data => {
+                    const button = form.querySelector("button");
+                    if ("like_count" in data) {
+                        button.textContent = `❤️ ${data.like_count}`;
+                    }
+                    if ("saved" in data) {
+                        button.textContent = data.saved ? "❌ Unsave" : "💾 Save";
+                        button.classList.toggle("btn-outline-secondary", data.saved);
+                        button.classList.toggle("btn-outline-danger", !data.saved);
+                    }
+                })
+                // Fall back to the regular form post (and redirect)
+                .catch(() => form.submit());
+        });
+    }
+
     // -------------------------------
     // Smooth scroll for comment links
     // -------------------------------
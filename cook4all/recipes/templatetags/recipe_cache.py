@@ -0,0 +1,44 @@
+from django import template
+from django.core.cache import cache
+
+from ..caching import fragment_cache_key, fragment_cache_timeout, recipe_version
+
+register = template.Library()
+
+
+class RecipeFragmentNode(template.Node):
+    def __init__(self, nodelist, name, recipe):
+        self.nodelist = nodelist
+        self.name = name
+        self.recipe = recipe
+
+    def render(self, context):
+        recipe = self.recipe.resolve(context)
+        version = getattr(recipe, "cache_version", None) or recipe_version(recipe.pk)
+        key = fragment_cache_key(self.name.resolve(context), recipe.pk, version)
+
+        html = cache.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, fragment_cache_timeout())
+        return html
+
+
+@register.tag
+def recipe_fragment(parser, token):
+    """
+    Cache a block of a recipe's markup under the recipe's cache version:
+
+        {% recipe_fragment "card" recipe %} ... {% endrecipe_fragment %}
+
+    The block must not depend on who is viewing it.
+    """
+    try:
+        _, name, recipe = token.split_contents()
+    except ValueError:
+        raise template.TemplateSyntaxError(
+            "'recipe_fragment' takes a fragment name and a recipe"
+        )
+    nodelist = parser.parse(("endrecipe_fragment",))
+    parser.delete_first_token()
+    return RecipeFragmentNode(nodelist, parser.compile_filter(name), parser.compile_filter(recipe))
@@ -1,3 +1,1439 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Avg, QuerySet
+from django.db.models.signals import m2m_changed
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tasks.models import Task
+from tasks.queue import run_pending
+from users.models import Profile
+
+from . import engagement, signals
+from .duplicates import find_duplicates, shingles, signature, similarity
+from .ingredients import cookable_with, parse_ingredients, with_all_ingredients, with_any_ingredients
+from .leaderboards import (
+    LEADERBOARD_FRESH_KEY, LEADERBOARD_LOCK_KEY, build_leaderboards, get_leaderboards,
+    invalidate_leaderboards, leaderboard_queries,
+)
+from .models import (
+    Comment, Ingredient, Rating, Recipe, RecipeIngredient, RecipeNeighbor, RecipeSignature,
+    SignatureBucket,
+)
+from .pagination import KeysetPaginator, approximate_count
+from .recommendations import build_recommendations, compute_neighbors, recommended_for, similar_recipes
+from .search import search_recipes
+from .transfer import import_recipes
+from .caching import recipe_version
+from .views import COMMENTS_PER_PAGE, SEARCH_MAX_OFFSET, RecipeListView, _rate
+
+
+def make_recipe(author, title="Pancakes", **kwargs):
+    if kwargs.get("rating_count"):
+        kwargs.setdefault("rating_average", kwargs.get("rating_sum", 0) / kwargs["rating_count"])
+    return Recipe.objects.create(
+        author=author,
+        title=title,
+        description=kwargs.pop("description", "Fluffy breakfast pancakes"),
+        ingredients=kwargs.pop("ingredients", "flour\neggs\nmilk"),
+        instructions=kwargs.pop("instructions", "Mix and fry."),
+        **kwargs,
+    )
+
+
+class IndexesInline:
+    """
+    Run the indexing job a recipe save queues straight away, as an idle
+    worker would once the save commits (TestCase never commits).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        patcher = mock.patch.object(
+            signals.index_recipe, "enqueue",
+            lambda recipe_id, indexes, **kwargs: signals.index_recipe(recipe_id, indexes),
+        )
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+        super().setUpClass()
+
+
+class RecipeListQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        self.client.force_login(self.user)
+
+    def count_list_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("recipe_list"), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        make_recipe(self.user)
+        self.count_list_queries()  # warm the leaderboard cache
+        baseline = self.count_list_queries()
+
+        fans = [User.objects.create_user(f"fan{i}") for i in range(5)]
+        for i in range(10):
+            recipe = make_recipe(self.user, title=f"Recipe {i}")
+            recipe.likes.add(self.user, *fans)
+            recipe.saved_by.add(*fans)
+            Comment.objects.create(recipe=recipe, author=fans[0], content="Yum")
+            Rating.objects.create(recipe=recipe, user=fans[0], value=4)
+
+        self.assertEqual(self.count_list_queries(), baseline)
+        self.assertEqual(self.count_list_queries({"page": 2}), baseline)
+
+    def test_card_stats_are_annotated(self):
+        fan = User.objects.create_user("fan")
+        recipe = make_recipe(self.user)
+        recipe.likes.add(self.user, fan)
+        recipe.saved_by.add(self.user)
+        Comment.objects.create(recipe=recipe, author=fan, content="Yum")
+        Rating.objects.create(recipe=recipe, user=fan, value=4)
+        Rating.objects.create(recipe=recipe, user=self.user, value=5)
+        Recipe.objects.recompute_counters()
+
+        card = Recipe.objects.with_stats(self.user).get(pk=recipe.pk)
+        self.assertEqual(card.num_likes, 2)
+        self.assertEqual(card.num_comments, 1)
+        self.assertEqual(card.avg_rating, 4.5)
+        self.assertTrue(card.is_liked)
+        self.assertTrue(card.is_saved)
+
+        card = Recipe.objects.with_stats(fan).get(pk=recipe.pk)
+        self.assertTrue(card.is_liked)
+        self.assertFalse(card.is_saved)
+
+
+class RecipeCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cook", password="pass")
+        self.client.force_login(self.user)
+        self.recipe = make_recipe(self.user)
+
+    def counters(self):
+        return Recipe.objects.values(
+            "like_count", "save_count", "comment_count", "rating_sum", "rating_count", "rating_average"
+        ).get(pk=self.recipe.pk)
+
+    def test_toggles_keep_counters_in_sync(self):
+        self.client.post(reverse("recipe_like", args=[self.recipe.pk]))
+        self.client.post(reverse("toggle_save", args=[self.recipe.pk]))
+        self.assertEqual(self.counters()["like_count"], 1)
+        self.assertEqual(self.counters()["save_count"], 1)
+
+        self.client.post(reverse("recipe_like", args=[self.recipe.pk]))
+        self.client.post(reverse("toggle_save", args=[self.recipe.pk]))
+        self.assertEqual(self.counters()["like_count"], 0)
+        self.assertEqual(self.counters()["save_count"], 0)
+
+    def test_comments_and_ratings_keep_counters_in_sync(self):
+        self.client.post(reverse("add_comment", args=[self.recipe.pk]), {"content": "Yum"})
+        self.assertEqual(self.counters()["comment_count"], 1)
+
+        comment = Comment.objects.get()
+        self.client.post(reverse("delete_comment", args=[self.recipe.pk, comment.pk]))
+        self.assertEqual(self.counters()["comment_count"], 0)
+
+        self.client.post(reverse("recipe_rate", args=[self.recipe.pk]), {"rating": 2})
+        self.assertEqual(self.counters()["rating_average"], 2)
+        self.client.post(reverse("recipe_rate", args=[self.recipe.pk]), {"rating": 5})
+        self.assertEqual(self.counters()["rating_sum"], 5)
+        self.assertEqual(self.counters()["rating_count"], 1)
+        self.assertEqual(self.counters()["rating_average"], 5)
+
+    def test_rating_twice_counts_one_rating(self):
+        self.assertTrue(_rate(self.recipe, self.user, 2))
+        self.assertFalse(_rate(self.recipe, self.user, 4))
+        self.assertEqual(Rating.objects.get().value, 4)
+        counters = self.counters()
+        self.assertEqual((counters["rating_sum"], counters["rating_count"], counters["rating_average"]), (4, 1, 4))
+
+    def test_deleting_a_comment_twice_counts_once(self):
+        self.client.post(reverse("add_comment", args=[self.recipe.pk]), {"content": "Yum"})
+        comment = Comment.objects.get()
+        url = reverse("delete_comment", args=[self.recipe.pk, comment.pk])
+        # The second request found the comment before the first deleted it
+        with mock.patch("recipes.views.get_object_or_404", return_value=comment):
+            self.client.post(url)
+            self.client.post(url)
+        self.assertEqual(self.counters()["comment_count"], 0)
+
+    def test_recompute_command_repairs_drift(self):
+        self.recipe.likes.add(self.user)
+        Comment.objects.create(recipe=self.recipe, author=self.user, content="Yum")
+        Rating.objects.create(recipe=self.recipe, user=self.user, value=3)
+        Recipe.objects.update(save_count=7)
+
+        call_command("recompute_recipe_counters", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(self.counters(), {
+            "like_count": 1, "save_count": 0, "comment_count": 1,
+            "rating_sum": 3, "rating_count": 1, "rating_average": 3,
+        })
+
+
+class RecipeSearchTests(IndexesInline, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cook", password="pass")
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.all(), query).values_list("title", flat=True))
+
+    def test_matches_ingredients_and_ranks_title_first(self):
+        make_recipe(self.user, title="Green smoothie", ingredients="spinach\nbanana")
+        make_recipe(self.user, title="Spinach omelette", ingredients="eggs")
+        make_recipe(self.user, title="Plain toast", ingredients="bread")
+
+        self.assertEqual(self.search("spinach"), ["Spinach omelette", "Green smoothie"])
+        self.assertEqual(self.search("spin"), ["Spinach omelette", "Green smoothie"])
+
+    def test_index_follows_saves_and_deletes(self):
+        recipe = make_recipe(self.user, title="Tomato soup")
+        recipe.title = "Carrot soup"
+        recipe.save()
+        self.assertEqual(self.search("tomato"), [])
+        self.assertEqual(self.search("carrot"), ["Carrot soup"])
+
+        recipe.delete()
+        self.assertEqual(self.search("carrot"), [])
+
+    def test_search_syntax_is_treated_as_text(self):
+        make_recipe(self.user, title="Mac and cheese")
+        self.assertEqual(self.search('"cheese" OR (NEAR'), [])
+        self.assertEqual(self.search('cheese"*'), ["Mac and cheese"])
+        self.assertEqual(self.search("***"), [])
+
+    def test_rebuild_command_indexes_bulk_inserts(self):
+        Recipe.objects.bulk_create([
+            Recipe(author=self.user, title=f"Curry {i}", description="", ingredients="",
+                   instructions="")
+            for i in range(3)
+        ])
+        self.assertEqual(self.search("curry"), [])
+
+        call_command("rebuild_search_index", batch_size=2, stdout=StringIO())
+        self.assertEqual(len(self.search("curry")), 3)
+
+    def test_list_and_ajax_search_use_index(self):
+        make_recipe(self.user, title="Lasagne", ingredients="ricotta")
+        make_recipe(self.user, title="Pancakes")
+
+        response = self.client.get(reverse("recipe_list"), {"q": "ricotta"})
+        self.assertEqual([r.title for r in response.context["recipes"]], ["Lasagne"])
+
+        response = self.client.get(reverse("ajax_search_recipes"), {"q": "ricotta"})
+        self.assertIn("Lasagne", response.json()["html"])
+        self.assertNotIn("Pancakes", response.json()["html"])
+
+
+class RecipeIndexQueueTests(TestCase):
+    def test_saves_queue_one_indexing_job_per_version(self):
+        user = User.objects.create_user("cook", password="pass")
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = make_recipe(user, title="Tomato soup", ingredients="4 tomatoes\n1 onion")
+        # The save itself indexes nothing
+        self.assertEqual(list(search_recipes(Recipe.objects.all(), "tomato")), [])
+        self.assertFalse(RecipeIngredient.objects.exists())
+        self.assertEqual(Task.objects.get().args, [recipe.pk, ["search", "ingredients", "signature"]])
+
+        # Queueing the same version again is ignored
+        with self.captureOnCommitCallbacks(execute=True):
+            signals.queue_recipe_indexing(Recipe, recipe)
+        self.assertEqual(Task.objects.count(), 1)
+
+        run_pending()
+        self.assertEqual(list(search_recipes(Recipe.objects.all(), "tomato")), [recipe])
+        self.assertTrue(RecipeIngredient.objects.filter(recipe=recipe).exists())
+        self.assertTrue(RecipeSignature.objects.filter(recipe=recipe).exists())
+
+        # A save of some fields only refreshes the indexes that read them
+        recipe.title = "Tomato stew"
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save(update_fields=["title", "updated_at"])
+        self.assertEqual(Task.objects.latest("pk").args, [recipe.pk, ["search", "signature"]])
+
+
+class AjaxSearchTests(IndexesInline, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        self.url = reverse("ajax_search_recipes")
+
+    def test_short_query_skips_database(self):
+        make_recipe(self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"q": "p"})
+        self.assertEqual(response.json(), {"html": "", "next": None})
+
+    def test_results_are_limited_and_offset_paginated(self):
+        for i in range(5):
+            make_recipe(self.user, title=f"Soup {i}")
+
+        titles = []
+        params = {"q": "soup", "limit": 2, "format": "json"}
+        while True:
+            data = self.client.get(self.url, params).json()
+            self.assertLessEqual(len(data["results"]), 2)
+            titles += [card["title"] for card in data["results"]]
+            if not data["next"]:
+                break
+            params["offset"] = data["next"]
+
+        self.assertCountEqual(titles, [f"Soup {i}" for i in range(5)])
+        self.assertEqual(
+            set(data["results"][0]),
+            {"id", "title", "description", "category", "image", "srcset", "url"},
+        )
+
+    def test_invalid_or_too_deep_offset_is_rejected(self):
+        for offset in ("-1", "abc", SEARCH_MAX_OFFSET + 1):
+            response = self.client.get(self.url, {"q": "soup", "offset": offset})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"q": "soup", "offset": SEARCH_MAX_OFFSET}).status_code, 200)
+
+    def test_repeated_query_is_cached_until_recipes_change(self):
+        recipe = make_recipe(self.user, title="Pea soup")
+        self.client.get(self.url, {"q": "soup"})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"q": "  SOUP "})
+        self.assertIn("Pea soup", response.json()["html"])
+
+        recipe.title = "Pea stew"
+        recipe.save()
+        response = self.client.get(self.url, {"q": "soup"})
+        self.assertNotIn("Pea", response.json()["html"])
+
+
+@override_settings(RECIPES_PAGE_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        for i in range(14):
+            make_recipe(self.user, title=f"Recipe {i}")
+        # Plenty of ties on the leading sort keys
+        Recipe.objects.filter(title__in=["Recipe 3", "Recipe 4", "Recipe 5"]).update(like_count=2)
+        Recipe.objects.exclude(title__in=["Recipe 0", "Recipe 1"]).update(
+            rating_sum=4, rating_count=1, rating_average=4, created_at=timezone.now()
+        )
+
+    def walk(self, params):
+        pages = []
+        response = self.client.get(reverse("recipe_list"), {**params, "cursor": ""})
+        while True:
+            page = response.context["recipes"]
+            pages.append([recipe.title for recipe in page])
+            if not page.has_next:
+                return pages, response
+            response = self.client.get(
+                reverse("recipe_list"), {**params, "cursor": page.next_cursor}
+            )
+
+    def test_pages_follow_offset_order_for_every_sort(self):
+        for filter_option in ["", "most_liked", "top_rated", "dinner", "other"]:
+            params = {"filter": filter_option} if filter_option else {}
+            expected = []
+            for number in range(1, 4):
+                response = self.client.get(reverse("recipe_list"), {**params, "page": number})
+                expected += [recipe.title for recipe in response.context["recipes"]]
+                if not response.context["recipes"].has_next():
+                    break
+
+            pages, _ = self.walk(params)
+            self.assertEqual(sum(pages, []), expected, filter_option)
+            self.assertTrue(all(len(page) <= 6 for page in pages))
+
+    def test_previous_cursor_returns_to_earlier_page(self):
+        pages, response = self.walk({})
+        page = response.context["recipes"]
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(page.has_previous)
+
+        response = self.client.get(reverse("recipe_list"), {"cursor": page.previous_cursor})
+        page = response.context["recipes"]
+        self.assertEqual([recipe.title for recipe in page], pages[1])
+        self.assertTrue(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    def test_setting_picks_the_default_pagination(self):
+        self.assertNotIn("keyset_pagination", self.client.get(reverse("recipe_list")).context)
+        with self.settings(RECIPES_LIST_PAGINATION="keyset"):
+            response = self.client.get(reverse("recipe_list"))
+            self.assertTrue(response.context["keyset_pagination"])
+            self.assertNotIn("keyset_pagination", self.client.get(reverse("recipe_list"), {"q": "recipe"}).context)
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        response = self.client.get(reverse("recipe_list"), {"cursor": "bogus"})
+        self.assertEqual(len(response.context["recipes"]), 6)
+        self.assertFalse(response.context["recipes"].has_previous)
+
+    def test_approximate_total_is_capped(self):
+        self.assertEqual(approximate_count(Recipe.objects.all()), (14, True))
+        self.assertEqual(approximate_count(Recipe.objects.all(), cap=10), (10, False))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+
+    def test_bayesian_average_needs_votes_to_win(self):
+        one_vote = make_recipe(self.user, title="One vote", rating_sum=5, rating_count=1)
+        many_votes = make_recipe(self.user, title="Many votes", rating_sum=4 * 20, rating_count=20)
+        mediocre = make_recipe(self.user, title="Mediocre", rating_sum=2 * 20, rating_count=20)
+        make_recipe(self.user, title="Unrated")
+
+        rated = build_leaderboards()["rated"]
+        self.assertEqual([recipe.pk for recipe in rated], [many_votes.pk, one_vote.pk, mediocre.pk])
+        self.assertEqual(rated[1].avg_rating, 5)
+
+    def test_category_leaders(self):
+        make_recipe(self.user, title="Porridge", category="breakfast", like_count=1)
+        make_recipe(self.user, title="Omelette", category="breakfast", like_count=3)
+        make_recipe(self.user, title="Brownie", category="dessert", like_count=2)
+        make_recipe(self.user, title="Stew", category="dinner")
+
+        by_category = build_leaderboards(size=5)["by_category"]
+        self.assertEqual([r.title for r in by_category["breakfast"]], ["Omelette", "Porridge"])
+        self.assertEqual([r.title for r in by_category["dessert"]], ["Brownie"])
+        self.assertEqual(by_category["dinner"], [])
+
+    @override_settings(RECIPES_PAGE_CACHE_TIMEOUT=0)
+    def test_list_shows_the_picked_category_leaders(self):
+        omelette = make_recipe(self.user, title="Omelette", category="breakfast", like_count=3)
+        make_recipe(self.user, title="Brownie", category="dessert", like_count=2)
+        omelette.saved_by.add(self.user)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("recipe_list"), {"filter": "breakfast"})
+        self.assertEqual([r.title for r in response.context["category_leaders"]], ["Omelette"])
+        self.assertTrue(response.context["category_leaders"][0].is_saved)
+        self.assertContains(response, "Top 3 Breakfast Recipes")
+
+        response = self.client.get(reverse("recipe_list"))
+        self.assertEqual(response.context["category_leaders"], [])
+        self.assertNotContains(response, "Top 3 Breakfast Recipes")
+
+    @override_settings(RECIPES_PAGE_CACHE_TIMEOUT=0)
+    def test_rails_are_served_from_cache(self):
+        make_recipe(self.user, like_count=2)
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(len(response.context["top_recipes"]), 1)
+
+    def test_logged_in_viewer_gets_own_flags(self):
+        recipe = make_recipe(self.user)
+        recipe.saved_by.add(self.user)
+        recipe.likes.add(self.user)
+        Recipe.objects.recompute_counters()
+
+        self.assertFalse(get_leaderboards()["liked"][0].is_saved)
+        with self.assertNumQueries(1):
+            boards = get_leaderboards(self.user)
+        self.assertTrue(boards["liked"][0].is_saved)
+        self.assertTrue(boards["liked"][0].is_liked)
+
+    def test_engagement_marks_boards_stale(self):
+        recipe = make_recipe(self.user)
+        self.client.force_login(self.user)
+        self.assertEqual(get_leaderboards()["liked"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("recipe_like", args=[recipe.pk]))
+        self.assertEqual([r.pk for r in get_leaderboards()["liked"]], [recipe.pk])
+
+    def test_comments_and_saves_mark_boards_stale(self):
+        recipe = make_recipe(self.user, like_count=1)
+        fan = User.objects.create_user("fan")
+        for change in (
+            lambda: Comment.objects.create(recipe=recipe, author=fan, content="Yum"),
+            lambda: recipe.saved_by.add(fan),
+        ):
+            get_leaderboards()
+            self.assertIn(LEADERBOARD_FRESH_KEY, cache)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertNotIn(LEADERBOARD_FRESH_KEY, cache)
+
+    def test_stale_boards_are_served_while_one_request_rebuilds(self):
+        recipe = make_recipe(self.user, like_count=1)
+        get_leaderboards()
+        Recipe.objects.update(like_count=0)
+        invalidate_leaderboards()
+
+        # Another request holds the rebuild: serve what is cached, no queries
+        cache.add(LEADERBOARD_LOCK_KEY, True)
+        with self.assertNumQueries(0):
+            self.assertEqual([r.pk for r in get_leaderboards()["liked"]], [recipe.pk])
+
+        cache.delete(LEADERBOARD_LOCK_KEY)
+        self.assertEqual(get_leaderboards()["liked"], [])
+        self.assertNotIn(LEADERBOARD_LOCK_KEY, cache)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every hot query against a seeded database and fail if any of them
+    reads a whole table instead of going through an index. The queries are
+    built the way the views build them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(f"user{i}") for i in range(20)]
+        cls.user = users[0]
+        categories = [choice for choice, _ in Recipe.CATEGORY_CHOICES]
+        for i in range(200):
+            recipe = make_recipe(users[i % 20], title=f"Recipe {i}", category=categories[i % 5])
+            recipe.likes.add(*users[:i % 7])
+            recipe.saved_by.add(*users[:i % 3])
+            for user in users[:i % 4]:
+                Rating.objects.create(recipe=recipe, user=user, value=1 + i % 5)
+                Comment.objects.create(recipe=recipe, author=user, content="Nice")
+        Recipe.objects.recompute_counters()
+        cls.recipe = recipe
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("ANALYZE")
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            # PostgreSQL rightly scans tables this small, so its plans here
+            # would say nothing about production-sized ones
+            self.skipTest("Query plan checks run on SQLite only.")
+
+    def list_queryset(self, **params):
+        """The queryset RecipeListView builds for a request with `params`."""
+        request = RequestFactory().get(reverse("recipe_list"), params)
+        request.user = self.user
+        view = RecipeListView()
+        view.setup(request)
+        return view.get_queryset()
+
+    def assertUsesIndexes(self, queryset, ordered=False):
+        """
+        Fail on a full table scan and, with `ordered`, on a sort step: those
+        queries should read rows in index order and stop at the LIMIT.
+        """
+        # queryset.explain() puts its prefix inside the subquery Django wraps
+        # window filters in, so the compiled SQL is explained directly
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        # Scans of subquery results (CO-ROUTINE, MATERIALIZE) are not table scans
+        subqueries = set(re.findall(r"(?:CO-ROUTINE|MATERIALIZE) (\w+)", plan))
+        full_scans = [
+            table for table in re.findall(r"\bSCAN (\w+)(?: AS \w+)?$", plan, re.MULTILINE)
+            if table not in subqueries
+        ]
+        sorts = re.findall(r"USE TEMP B-TREE FOR .*ORDER BY", plan)
+        self.assertFalse(full_scans, f"Full table scan of {full_scans}:\n{plan}")
+        if ordered:
+            self.assertFalse(sorts, f"Sort instead of index order:\n{plan}")
+
+    def test_recipe_list_queries(self):
+        for filter_option in ("", "most_liked", "top_rated", "dinner"):
+            with self.subTest(filter_option or "all"):
+                recipes = self.list_queryset(filter=filter_option)
+                ordering = RecipeListView.keyset_ordering.get(filter_option, RecipeListView.ordering)
+                paginator = KeysetPaginator(recipes, ordering, RecipeListView.per_page)
+                # What paginator.get_page() runs, without and with a cursor
+                ordered = recipes.order_by(*paginator._order_by(forward=True))
+                boundary = paginator.decode(paginator.cursor_for(self.recipe, "next"))[1]
+                limit = RecipeListView.per_page + 1
+
+                self.assertUsesIndexes(ordered[:limit], ordered=True)
+                self.assertUsesIndexes(ordered.filter(paginator._seek(boundary, forward=True))[:limit], ordered=True)
+        self.assertUsesIndexes(self.list_queryset(q="recipe")[:12])
+
+    def test_leaderboard_queries(self):
+        queries = leaderboard_queries()
+        self.assertUsesIndexes(queries["liked"], ordered=True)
+        # Sorted, but only the rated recipes are read
+        self.assertUsesIndexes(queries["rated"])
+        self.assertUsesIndexes(queries["by_category"])
+
+    def test_recipe_detail_queries(self):
+        self.assertUsesIndexes(Recipe.objects.with_stats(self.user).filter(pk=self.recipe.pk))
+        self.assertUsesIndexes(
+            Comment.objects.filter(recipe=self.recipe).select_related("author")
+            .order_by("-created_at", "-id")[:21],
+            ordered=True,
+        )
+        self.assertUsesIndexes(Rating.objects.filter(recipe=self.recipe, user=self.user))
+        self.assertUsesIndexes(
+            Rating.objects.filter(recipe=self.recipe).values("recipe").annotate(avg=Avg("value"))
+        )
+
+    def test_engagement_queries(self):
+        for through in (Recipe.likes.through, Recipe.saved_by.through):
+            self.assertUsesIndexes(through.objects.filter(recipe=self.recipe, user=self.user))
+
+    def test_user_page_queries(self):
+        self.assertUsesIndexes(self.user.saved_recipes.all())
+        self.assertUsesIndexes(self.user.recipes.order_by("-created_at"), ordered=True)
+
+
+class EngagementToggleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = make_recipe(self.user)
+
+    def test_toggle_flips_membership_and_counter(self):
+        self.assertEqual(engagement.toggle_like(self.recipe, self.user), (True, 1))
+        self.assertTrue(self.recipe.likes.filter(pk=self.user.pk).exists())
+        self.assertEqual(Recipe.objects.get().like_count, 1)
+
+        self.assertEqual(engagement.toggle_like(self.recipe, self.user), (False, 0))
+        self.assertFalse(self.recipe.likes.exists())
+        self.assertEqual(Recipe.objects.get().like_count, 0)
+
+        self.assertEqual(engagement.toggle_save(self.recipe, self.user), (True, 1))
+        self.assertEqual(Recipe.objects.get().save_count, 1)
+
+    def test_cost_does_not_grow_with_popularity(self):
+        fans = [User.objects.create_user(f"fan{i}") for i in range(30)]
+        with CaptureQueriesContext(connection) as few:
+            engagement.toggle_like(self.recipe, fans[0])
+        self.recipe.likes.add(*fans[1:])
+        with CaptureQueriesContext(connection) as many:
+            engagement.toggle_like(self.recipe, self.user)
+        self.assertEqual(len(many), len(few))
+
+    def test_lost_insert_race_counts_once(self):
+        self.recipe.likes.add(self.user)
+        Recipe.objects.update(like_count=1)
+        # The concurrent request's row appears after our DELETE found nothing
+        with mock.patch.object(QuerySet, "delete", return_value=(0, {})):
+            self.assertEqual(engagement.toggle_like(self.recipe, self.user), (True, 1))
+        self.assertEqual(self.recipe.likes.count(), 1)
+        self.assertEqual(Recipe.objects.get().like_count, 1)
+
+    def test_signal_names_the_database_written_to(self):
+        received = []
+
+        def receiver(**kwargs):
+            received.append(kwargs["using"])
+
+        m2m_changed.connect(receiver, sender=Recipe.likes.through)
+        self.addCleanup(m2m_changed.disconnect, receiver, sender=Recipe.likes.through)
+        # As when the replica router sends reads to a replica
+        with mock.patch("django.db.router.db_for_read", return_value="replica1"):
+            engagement.toggle_like(self.recipe, self.user)
+        self.assertEqual(received, ["default"])
+
+    def test_json_api(self):
+        url = reverse("api_toggle_like", args=[self.recipe.pk])
+        self.assertEqual(self.client.post(url).status_code, 401)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url).json(), {"liked": True, "like_count": 1})
+        self.assertEqual(self.client.post(url).json(), {"liked": False, "like_count": 0})
+
+        url = reverse("api_toggle_save", args=[self.recipe.pk])
+        self.assertEqual(self.client.post(url).json(), {"saved": True, "save_count": 1})
+        self.assertEqual(self.client.post(reverse("api_toggle_save", args=[999])).status_code, 404)
+
+    def test_pages_load_the_toggle_script_once(self):
+        # Loaded twice, the submit handler would send two POSTs and undo the toggle
+        self.client.force_login(self.user)
+        for url in (reverse("recipe_list"), reverse("saved_recipes"), reverse("user_recipes")):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), "recipes/recipe_list.js", count=1)
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite profile")
+    def test_sqlite_connections_wait_for_the_writer(self):
+        # Writers queue on BEGIN IMMEDIATE and busy_timeout instead of failing
+        # with "database is locked"; see benchmarks/concurrency.py
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_BUSY_TIMEOUT_MS)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+@override_settings(RECIPES_PAGE_CACHE_TIMEOUT=0)
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = make_recipe(self.user)
+
+    def add_comments(self, count):
+        start = Comment.objects.count()
+        authors = [User.objects.create_user(f"author{i}") for i in range(start, start + count)]
+        Comment.objects.bulk_create([
+            Comment(recipe=self.recipe, author=author, content=f"Comment {i}")
+            for i, author in enumerate(authors)
+        ])
+
+    def detail_queries(self):
+        cache.clear()  # bulk_create sends no signals to retire cached state
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("recipe_detail", args=[self.recipe.pk]))
+        return response, len(ctx.captured_queries)
+
+    def test_detail_shows_first_page_in_constant_queries(self):
+        self.add_comments(3)
+        _, few = self.detail_queries()
+
+        self.add_comments(COMMENTS_PER_PAGE + 5)
+        response, many = self.detail_queries()
+        self.assertEqual(many, few)
+        self.assertEqual(len(response.context["comments"]), COMMENTS_PER_PAGE)
+        self.assertContains(response, "Load more comments")
+
+    def test_load_more_returns_the_rest(self):
+        self.add_comments(COMMENTS_PER_PAGE + 5)
+        response, _ = self.detail_queries()
+        first_page = [comment.pk for comment in response.context["comments"]]
+
+        data = self.client.get(
+            reverse("recipe_comments", args=[self.recipe.pk]),
+            {"cursor": response.context["comments"].next_cursor},
+        ).json()
+        self.assertIsNone(data["next"])
+        self.assertEqual(data["html"].count('class="list-group-item'), 5)
+
+        shown = set(first_page) | {
+            int(pk) for pk in re.findall(r'id="comment-(\d+)"', data["html"])
+        }
+        self.assertEqual(shown, set(Comment.objects.values_list("pk", flat=True)))
+
+
+@override_settings(RECIPES_PAGE_CACHE_TIMEOUT=0)
+class RecipeDetailQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = make_recipe(self.user)
+        self.url = reverse("recipe_detail", args=[self.recipe.pk])
+
+    def test_anonymous_detail_queries(self):
+        # The HTTP validators, the recipe with its stats and author, the
+        # first comment page and the similar recipes; the validators and
+        # similar recipes are cached after that
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_stats_and_viewer_state_come_with_the_recipe(self):
+        fans = [User.objects.create_user(f"fan{i}") for i in range(5)]
+        for fan in fans:
+            engagement.toggle_like(self.recipe, fan)
+            Rating.objects.create(recipe=self.recipe, user=fan, value=4)
+            Comment.objects.create(recipe=self.recipe, author=fan, content="Yum")
+        engagement.toggle_save(self.recipe, self.user)
+        Rating.objects.create(recipe=self.recipe, user=self.user, value=2)
+        Recipe.objects.recompute_counters()
+
+        self.client.force_login(self.user)
+        # The user (the session itself is read from the cache), then the same
+        # four queries as an anonymous visit
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+
+        recipe = response.context["recipe"]
+        self.assertEqual(response.context["user_rating"], 2)
+        self.assertAlmostEqual(response.context["average_rating"], 22 / 6)
+        self.assertEqual(
+            (recipe.num_likes, recipe.num_comments, recipe.num_ratings), (5, 5, 6)
+        )
+        self.assertTrue(recipe.is_saved)
+        self.assertFalse(recipe.is_liked)
+        self.assertContains(response, "6 votes")
+
+
+class AsyncViewTests(IndexesInline, TestCase):
+    """The async views served through the ASGI handler."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = make_recipe(self.user, title="Pea soup")
+
+    async def test_detail_page_and_revalidation(self):
+        url = reverse("recipe_detail", args=[self.recipe.pk])
+        response = await self.async_client.get(url)
+        self.assertContains(response, "Pea soup")
+        self.assertIn("public", response["Cache-Control"])
+
+        response = await self.async_client.get(url, headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertEqual(response.context["recipe"].my_rating, 0)
+
+    async def test_missing_recipe_is_404(self):
+        response = await self.async_client.get(reverse("recipe_detail", args=[self.recipe.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_ajax_search(self):
+        url = reverse("ajax_search_recipes")
+        data = (await self.async_client.get(url, {"q": "soup", "format": "json"})).json()
+        self.assertEqual([card["title"] for card in data["results"]], ["Pea soup"])
+        data = (await self.async_client.get(url, {"q": "soup"})).json()
+        self.assertIn("Pea soup", data["html"])
+
+    async def test_toggles_and_rating(self):
+        like = reverse("api_toggle_like", args=[self.recipe.pk])
+        response = await self.async_client.post(like)
+        self.assertEqual(response.status_code, 401)
+
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual((await self.async_client.post(like)).json(), {"liked": True, "like_count": 1})
+        self.assertEqual((await self.async_client.post(like)).json(), {"liked": False, "like_count": 0})
+        response = await self.async_client.post(reverse("api_toggle_save", args=[self.recipe.pk]))
+        self.assertEqual(response.json(), {"saved": True, "save_count": 1})
+        response = await self.async_client.post(reverse("recipe_like", args=[self.recipe.pk]))
+        self.assertEqual(response.status_code, 302)
+
+        rate = reverse("recipe_rate", args=[self.recipe.pk])
+        await self.async_client.post(rate, {"rating": 4})
+        await self.async_client.post(rate, {"rating": 2})
+        recipe = await Recipe.objects.aget(pk=self.recipe.pk)
+        self.assertEqual(
+            (recipe.like_count, recipe.save_count, recipe.rating_sum, recipe.rating_count), (1, 1, 2, 1)
+        )
+
+    async def test_bad_ratings_are_ignored(self):
+        await self.async_client.aforce_login(self.user)
+        rate = reverse("recipe_rate", args=[self.recipe.pk])
+        for rating in ("abc", "", "9"):
+            with self.subTest(rating=rating):
+                response = await self.async_client.post(rate, {"rating": rating})
+                self.assertRedirects(
+                    response, reverse("recipe_detail", args=[self.recipe.pk]), fetch_redirect_response=False
+                )
+        response = await self.async_client.get(rate)
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(await Rating.objects.aexists())
+
+
+class ListFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        make_recipe(self.user, title="Porridge", category="breakfast")
+        make_recipe(self.user, title="Stew", category="dinner")
+
+    def titles(self, response):
+        return [recipe.title for recipe in response.context["recipes"]]
+
+    @override_settings(RECIPES_PAGE_CACHE_TIMEOUT=0)
+    def test_filter_comes_from_the_url(self):
+        url = reverse("recipe_list")
+        response = self.client.get(url, {"filter": "breakfast"})
+        self.assertEqual(self.titles(response), ["Porridge"])
+        # The active button links back to the unfiltered list
+        self.assertContains(response, 'href="?"')
+
+        # Requesting the same filter again keeps it; it is not a toggle
+        response = self.client.get(url, {"filter": "breakfast"})
+        self.assertEqual(self.titles(response), ["Porridge"])
+        self.assertEqual(len(self.titles(self.client.get(url))), 2)
+        self.assertEqual(len(self.titles(self.client.get(url, {"filter": "bogus"}))), 2)
+
+    def test_list_reads_never_write(self):
+        self.client.force_login(self.user)
+        for client in [self.client_class(), self.client]:
+            for params in [{}, {"filter": "dinner"}, {"filter": "dinner", "page": 1},
+                           {"cursor": ""}, {"q": "stew"}]:
+                with CaptureQueriesContext(connection) as ctx:
+                    response = client.get(reverse("recipe_list"), params)
+                self.assertEqual(response.status_code, 200)
+                writes = [q["sql"] for q in ctx.captured_queries
+                          if not q["sql"].lstrip().upper().startswith("SELECT")]
+                self.assertEqual(writes, [], params)
+                # Anonymous visitors don't get a session either
+                if client is not self.client:
+                    self.assertNotIn("sessionid", response.cookies)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = make_recipe(self.user, like_count=1)
+        self.url = reverse("recipe_detail", args=[self.recipe.pk])
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url in [reverse("home"), self.url]:
+            with self.subTest(url):
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertContains(response, "Pancakes")
+
+    def test_logged_in_pages_are_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+    def test_engagement_retires_cached_detail_page(self):
+        fan = User.objects.create_user("fan")
+        self.assertContains(self.client.get(self.url), "❤️ 1")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            engagement.toggle_like(self.recipe, fan)
+        self.assertContains(self.client.get(self.url), "❤️ 2")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(recipe=self.recipe, author=fan, content="Lovely stack")
+        self.assertContains(self.client.get(self.url), "Lovely stack")
+
+    def test_edit_retires_fragments(self):
+        self.client.get(self.url)
+        version = recipe_version(self.recipe.pk)
+
+        self.recipe.title = "Crepes"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertNotEqual(recipe_version(self.recipe.pk), version)
+
+        # Logged in, so the page is rendered and only the fragments could be stale
+        self.client.force_login(self.user)
+        for url in [self.url, reverse("recipe_list")]:
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertContains(response, "Crepes")
+                self.assertNotContains(response, "Pancakes")
+
+    def test_reverse_save_retires_recipe(self):
+        version = recipe_version(self.recipe.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.saved_recipes.add(self.recipe)
+        self.assertNotEqual(recipe_version(self.recipe.pk), version)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("cook", password="pass")
+        self.recipe = make_recipe(self.user)
+        self.url = reverse("recipe_detail", args=[self.recipe.pk])
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(
+            url, params,
+            HTTP_IF_NONE_MATCH=response["ETag"],
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+        )
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        urls = [
+            (self.url, {}),
+            (reverse("recipe_list"), {"page": 1, "filter": "other"}),
+            (reverse("ajax_search_recipes"), {"q": "pancakes"}),
+        ]
+        for url, params in urls:
+            with self.subTest(url):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("ETag", response)
+                self.assertIn("Last-Modified", response)
+                with self.assertNumQueries(0):
+                    response = self.revalidate(url, response, **params)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+
+    def test_engagement_changes_the_etag(self):
+        fan = User.objects.create_user("fan", password="pass")
+        response = self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            engagement.toggle_like(self.recipe, fan)
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_comment_edit_changes_the_etag(self):
+        comment = Comment.objects.create(recipe=self.recipe, author=self.user, content="Nice")
+        response = self.client.get(self.url)
+
+        comment.content = "Very nice"
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.save()
+        self.assertContains(self.revalidate(self.url, response), "Very nice")
+
+    def test_logging_in_changes_the_etag(self):
+        response = self.client.get(self.url)
+        self.client.force_login(self.user)
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_cache_control_depends_on_viewer(self):
+        response = self.client.get(self.url)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_missing_recipe_is_still_404(self):
+        response = self.client.get(reverse("recipe_detail", args=[self.recipe.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class IngredientParserTests(TestCase):
+    def parse(self, text):
+        return [(p.name, p.quantity, p.unit, p.optional) for p in parse_ingredients(text)]
+
+    def test_quantities_units_and_descriptors(self):
+        self.assertEqual(self.parse(
+            "2 tbsp olive oil\n"
+            "1 can (400g) diced tomatoes\n"
+            "200g chorizo, sliced\n"
+            "1 ½ cups shredded mozzarella cheese\n"
+            "2–3 cloves garlic, minced\n"
+            "a pinch of salt\n"
+        ), [
+            ("olive oil", 2.0, "tbsp", False),
+            ("tomato", 1.0, "can", False),
+            ("chorizo", 200.0, "g", False),
+            ("mozzarella", 1.5, "cup", False),
+            ("garlic", 2.0, "clove", False),
+            ("salt", 1.0, "pinch", False),
+        ])
+
+    def test_plurals_synonyms_and_alternatives(self):
+        self.assertEqual([name for name, *_ in self.parse(
+            "3 large eggs\n2 celery stalks\n4 scallions\n1 cup chicken broth\n"
+            "2 tomatoes\n1 cup white or brown rice\nparsley or basil\n"
+        )], ["egg", "celery", "green onion", "chicken stock", "tomato", "white rice", "parsley"])
+
+    def test_headings_notes_and_optional_lines(self):
+        self.assertEqual(self.parse(
+            "For the sauce:\nSalt and pepper, to taste\n\n1 tsp paprika (optional)\n"
+            "Optional: sour cream, salsa, or guacamole"
+        ), [
+            ("salt", None, "", False),
+            ("pepper", None, "", False),
+            ("paprika", 1.0, "tsp", True),
+            ("sour cream", None, "", True),
+        ])
+
+
+class IngredientIndexTests(IndexesInline, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cook", password="pass")
+        self.omelette = make_recipe(self.user, "Omelette", ingredients="3 eggs\n1 cup spinach\nsalt")
+        self.frittata = make_recipe(
+            self.user, "Frittata", ingredients="6 eggs\n2 cups spinach\n1 onion\n100g feta\nchives (optional)"
+        )
+        self.pancakes = make_recipe(self.user, "Pancakes", ingredients="flour\n2 eggs\nmilk")
+
+    def titles(self, queryset):
+        return sorted(queryset.values_list("title", flat=True))
+
+    def test_saving_a_recipe_indexes_its_ingredients(self):
+        self.assertEqual(
+            list(self.frittata.parsed_ingredients.values_list("ingredient__name", "optional")),
+            [("egg", False), ("spinach", False), ("onion", False), ("feta", False), ("chive", True)],
+        )
+        self.frittata.refresh_from_db()
+        self.assertEqual(self.frittata.ingredient_count, 4)
+        self.assertEqual(Ingredient.objects.get(name="egg").recipe_count, 3)
+
+        self.pancakes.ingredients = "flour\nmilk"
+        self.pancakes.save()
+        self.assertEqual(Ingredient.objects.get(name="egg").recipe_count, 2)
+        self.omelette.delete()
+        self.assertEqual(Ingredient.objects.get(name="egg").recipe_count, 1)
+
+    def test_all_any_and_missing_one(self):
+        recipes = Recipe.objects.all()
+        self.assertEqual(self.titles(with_all_ingredients(recipes, ["Eggs", "spinach"])), ["Frittata", "Omelette"])
+        self.assertEqual(self.titles(with_all_ingredients(recipes, ["eggs", "caviar"])), [])
+        self.assertEqual(
+            [r.title for r in with_any_ingredients(recipes, ["spinach", "egg", "onion"])][:1], ["Frittata"]
+        )
+        self.assertEqual(self.titles(with_any_ingredients(recipes, ["milk"])), ["Pancakes"])
+
+        # Omelette needs salt; frittata needs onion and feta; pancakes flour and milk
+        cookable = cookable_with(recipes, ["eggs", "spinach"], missing=1)
+        self.assertEqual([(r.title, r.missing) for r in cookable], [("Omelette", 1)])
+        cookable = cookable_with(recipes, ["eggs", "spinach", "onion"], missing=1)
+        self.assertEqual([(r.title, r.missing) for r in cookable], [("Frittata", 1), ("Omelette", 1)])
+        cookable = cookable_with(recipes, ["eggs", "spinach", "salt"], missing=0)
+        self.assertEqual([(r.title, r.missing) for r in cookable], [("Omelette", 0)])
+
+    def test_all_walks_the_rarest_posting_list(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(with_all_ingredients(Recipe.objects.all(), ["eggs", "feta"]))
+        feta = Ingredient.objects.get(name="feta").pk
+        self.assertIn(f"\"ingredient_id\" = {feta}", ctx.captured_queries[-1]["sql"])
+
+    def test_backfill_command(self):
+        Recipe.objects.bulk_create([
+            Recipe(author=self.user, title=f"Salad {i}", description="", ingredients="spinach\nfeta",
+                   instructions="")
+            for i in range(3)
+        ])
+        # Rows lost behind the index's back are restored, and counts recounted
+        RecipeIngredient.objects.filter(recipe=self.omelette).delete()
+        out = StringIO()
+        call_command("backfill_ingredients", batch_size=2, stdout=out)
+        self.assertIn("Parsed 6 recipes", out.getvalue())
+
+        self.assertEqual(Ingredient.objects.get(name="spinach").recipe_count, 5)
+        self.assertEqual(Ingredient.objects.get(name="feta").recipe_count, 4)
+        self.assertEqual(len(with_all_ingredients(Recipe.objects.all(), ["spinach", "feta"])), 4)
+
+    def test_ajax_endpoint(self):
+        url = reverse("ajax_ingredient_search")
+        response = self.client.get(url, {"have": "eggs, spinach, onion", "match": "missing-one"})
+        self.assertEqual(
+            [(r["title"], r["missing"]) for r in response.json()["results"]],
+            [("Frittata", 1), ("Omelette", 1)],
+        )
+        response = self.client.get(url, {"have": "eggs,spinach", "match": "all", "limit": 1})
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertEqual(response.json()["next"], 1)
+        response = self.client.get(url, {"have": "eggs,spinach", "match": "all", "limit": 1, "offset": 1})
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIsNone(response.json()["next"])
+        self.assertEqual(self.client.get(url, {"have": "eggs", "offset": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"have": "eggs", "match": "some"}).status_code, 400)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user("author")
+        self.pasta, self.pesto, self.salad, self.cake = (
+            make_recipe(self.author, title) for title in ("Pasta", "Pesto", "Salad", "Cake")
+        )
+        self.fans = [User.objects.create_user(f"fan{i}") for i in range(4)]
+
+    def test_neighbors_are_cosine_similarity_with_shrinkage(self):
+        interactions = [
+            ("u1", "a", 1.0), ("u1", "b", 1.0),
+            ("u2", "a", 1.0), ("u2", "b", 1.0),
+            ("u3", "a", 1.0), ("u3", "c", 1.0),
+        ]
+        neighbors = compute_neighbors(interactions, k=5, shrink=0)
+        self.assertEqual([n for n, _ in neighbors["a"]], ["b", "c"])
+        self.assertAlmostEqual(dict(neighbors["a"])["b"], 2 / (3 ** 0.5 * 2 ** 0.5))
+        self.assertEqual([n for n, _ in neighbors["c"]], ["a"])
+
+        # Shrinkage favours pairs with more users in common
+        damped = compute_neighbors(interactions, k=5, shrink=10)
+        self.assertLess(dict(damped["a"])["c"], dict(neighbors["a"])["c"] / 2)
+        self.assertEqual(len(compute_neighbors(interactions, k=1, shrink=0)["a"]), 1)
+
+    def test_build_from_likes_saves_and_ratings(self):
+        for fan in self.fans[:3]:
+            engagement.toggle_like(self.pasta, fan)
+            engagement.toggle_save(self.pesto, fan)
+        Rating.objects.create(user=self.fans[3], recipe=self.pasta, value=5)
+        Rating.objects.create(user=self.fans[3], recipe=self.salad, value=4)
+        # A poor rating is not a vote for the cake
+        Rating.objects.create(user=self.fans[3], recipe=self.cake, value=1)
+
+        out = StringIO()
+        call_command("build_recommendations", stdout=out)
+        self.assertIn("Stored 4 neighbours", out.getvalue())
+        self.assertEqual([r.title for r in similar_recipes(self.pasta)], ["Pesto", "Salad"])
+        self.assertFalse(RecipeNeighbor.objects.filter(neighbor=self.cake).exists())
+
+        with self.assertNumQueries(0):
+            similar_recipes(self.pasta)
+
+    def test_detail_page_shows_neighbours_and_rebuilds_change_its_etag(self):
+        url = reverse("recipe_detail", args=[self.pasta.pk])
+        etag = self.client.get(url)["ETag"]
+
+        for fan in self.fans:
+            engagement.toggle_like(self.pasta, fan)
+            engagement.toggle_like(self.pesto, fan)
+        with self.captureOnCommitCallbacks(execute=True):
+            build_recommendations()
+
+        response = self.client.get(url)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "You might also like")
+        self.assertContains(response, reverse("recipe_detail", args=[self.pesto.pk]))
+
+    def test_personal_feed(self):
+        reader = self.fans[0]
+        for fan in self.fans[1:]:
+            engagement.toggle_like(self.pasta, fan)
+            engagement.toggle_like(self.salad, fan)
+        engagement.toggle_like(self.pesto, self.fans[1])
+        engagement.toggle_like(self.pasta, self.fans[1])
+        mine = make_recipe(reader, "My own")
+        for fan in self.fans[1:]:
+            engagement.toggle_like(mine, fan)
+        with self.captureOnCommitCallbacks(execute=True):
+            build_recommendations()
+
+        # Nothing to go on yet
+        self.assertEqual(recommended_for(reader), [])
+        cache.clear()
+
+        engagement.toggle_like(self.pasta, reader)
+        feed = recommended_for(reader)
+        self.assertEqual(feed[0].title, "Salad")
+        self.assertNotIn("Pasta", [r.title for r in feed])
+        self.assertNotIn("My own", [r.title for r in feed])
+
+        self.client.force_login(reader)
+        self.assertContains(self.client.get(reverse("home")), "Recommended for You")
+
+
+SHAKSHUKA = dict(
+    ingredients="2 tbsp olive oil\n1 onion, diced\n2 garlic cloves\n1 red pepper\n1 can tomatoes\n"
+                "1 tsp cumin\n1 tsp paprika\n4 eggs\nfeta and parsley to serve",
+    instructions=(
+        "Heat the oil in a wide pan and soften the onion and pepper for ten minutes. Add the garlic, "
+        "cumin and paprika and cook for a minute until fragrant. Pour in the tomatoes, season well and "
+        "simmer until thick, about fifteen minutes. Make four wells in the sauce and crack an egg into "
+        "each one. Cover and cook gently until the whites are set but the yolks are still runny. "
+        "Scatter over the feta and parsley and serve straight from the pan with warm bread."
+    ),
+)
+
+
+class DuplicateDetectionTests(IndexesInline, TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author", password="pass")
+        self.original = make_recipe(self.author, "Shakshuka", **SHAKSHUKA)
+        self.other = make_recipe(self.author, "Banana bread", ingredients="3 bananas\nflour\nsugar\nbutter",
+                                 instructions="Mash the bananas, mix everything and bake for an hour.")
+
+    def repost(self, **changes):
+        fields = {
+            "title": "Best shakshuka",
+            "ingredients": SHAKSHUKA["ingredients"],
+            "instructions": SHAKSHUKA["instructions"].replace("warm bread", "crusty bread or pita"),
+        }
+        fields.update(changes)
+        return Recipe(author=self.author, description="", **fields)
+
+    def test_signatures_estimate_jaccard_similarity(self):
+        copy = self.repost()
+        first, second = shingles(self.original), shingles(copy)
+        jaccard = len(first & second) / len(first | second)
+        self.assertAlmostEqual(similarity(signature(self.original), signature(copy)), jaccard, delta=0.15)
+        self.assertLess(similarity(signature(self.original), signature(self.other)), 0.2)
+        self.assertIsNone(signature(Recipe(title="", ingredients="", instructions="")))
+
+    def test_reposts_are_found_and_unrelated_recipes_are_not(self):
+        with self.assertNumQueries(3):
+            found = find_duplicates(self.repost())
+        self.assertEqual(found, [self.original])
+        self.assertGreater(found[0].similarity, 0.7)
+        self.assertEqual(find_duplicates(self.repost(instructions="Fry two eggs.", ingredients="eggs")), [])
+        # A saved recipe isn't its own duplicate
+        self.assertEqual(find_duplicates(self.original), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.original.instructions = "Boil pasta and toss it with pesto."
+        self.original.save()
+        self.assertEqual(find_duplicates(self.repost()), [])
+
+        self.original.instructions = SHAKSHUKA["instructions"]
+        self.original.save(update_fields=["instructions"])
+        self.assertEqual(find_duplicates(self.repost()), [self.original])
+
+        self.original.delete()
+        self.assertEqual(find_duplicates(self.repost()), [])
+
+    def test_author_is_warned_before_posting_a_duplicate(self):
+        self.client.login(username="author", password="pass")
+        data = {
+            "title": "Best shakshuka", "description": "Eggs in tomato sauce",
+            "ingredients": SHAKSHUKA["ingredients"], "instructions": SHAKSHUKA["instructions"],
+            "category": Recipe.CATEGORY_CHOICES[0][0],
+        }
+        response = self.client.post(reverse("recipe_create"), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "This looks a lot like")
+        self.assertContains(response, reverse("recipe_detail", args=[self.original.pk]))
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        response = self.client.post(reverse("recipe_create"), {**data, "confirm_duplicate": "1"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_find_duplicates_command_clusters_the_catalogue(self):
+        for n in range(2):
+            self.repost(title=f"Shakshuka {n}").save()
+        RecipeSignature.objects.all().delete()
+        SignatureBucket.objects.all().delete()
+
+        out = StringIO()
+        call_command("find_duplicates", stdout=out)
+        self.assertIn("Found 0 clusters", out.getvalue())
+
+        out = StringIO()
+        call_command("find_duplicates", "--missing", stdout=out)
+        self.assertIn("Signed 4 recipes.", out.getvalue())
+        self.assertIn("3 recipes:", out.getvalue())
+        self.assertIn(f"#{self.original.pk} Shakshuka", out.getvalue())
+        self.assertIn("Found 1 clusters of near-duplicates (3 recipes).", out.getvalue())
+
+
+class ImportExportTests(TestCase):
+    def setUp(self):
+        self.chef = User.objects.create_user("chef")
+        self.baker = User.objects.create_user("baker")
+        self.soup = make_recipe(self.chef, "Tomato soup", category="dinner",
+                                ingredients="1 can tomatoes\n1 onion\n2 cups stock")
+        self.cake = make_recipe(self.baker, "Lemon cake", category="dessert",
+                                ingredients="2 lemons\n200g flour\n3 eggs")
+        Recipe.objects.filter(pk=self.cake.pk).update(created_at=timezone.now() - timezone.timedelta(days=30))
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def round_trip(self, name):
+        out = StringIO()
+        call_command("export_recipes", self.path(name), stdout=out)
+        self.assertIn("Exported 2 recipes", out.getvalue())
+        before = list(Recipe.objects.order_by("pk").values_list(
+            "title", "ingredients", "category", "author__username", "created_at",
+        ))
+        Recipe.objects.all().delete()
+
+        out = StringIO()
+        call_command("import_recipes", self.path(name), stdout=out)
+        self.assertIn("Imported 2 recipes (0 skipped)", out.getvalue())
+        after = list(Recipe.objects.order_by("pk").values_list(
+            "title", "ingredients", "category", "author__username", "created_at",
+        ))
+        self.assertEqual(after, before)
+
+    def test_jsonl_round_trip_rebuilds_the_indexes(self):
+        self.round_trip("recipes.jsonl")
+        with open(self.path("recipes.jsonl"), encoding="utf-8") as stream:
+            self.assertEqual(json.loads(next(stream))["author"], "chef")
+
+        recipes = Recipe.objects.all()
+        self.assertEqual([r.title for r in with_all_ingredients(recipes, ["lemon", "egg"])], ["Lemon cake"])
+        self.assertEqual([r.title for r in search_recipes(recipes, "tomato")], ["Tomato soup"])
+        self.assertEqual(find_duplicates(Recipe(title="Lemon cake", ingredients="2 lemons\n200g flour\n3 eggs",
+                                                instructions="Mix and fry.")), [Recipe.objects.get(title="Lemon cake")])
+
+    def test_csv_round_trip(self):
+        self.round_trip("recipes.csv")
+
+    def test_export_to_stdout_with_filters(self):
+        out, err = StringIO(), StringIO()
+        call_command("export_recipes", "--category", "dessert", stdout=out, stderr=err)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record["title"] for record in records], ["Lemon cake"])
+        self.assertIn("Exported 1 recipes", err.getvalue())
+
+    def test_invalid_records_are_skipped_and_reported(self):
+        records = [
+            {"title": "Good", "ingredients": "rice", "instructions": "Boil.", "author": "chef", "category": "Dinner"},
+            "not json",
+            {"title": "", "ingredients": "rice", "instructions": "Boil.", "author": "chef"},
+            {"title": "Odd", "ingredients": "rice", "instructions": "Boil.", "author": "chef", "category": "brunch"},
+            {"title": "Stranger's", "ingredients": "rice", "instructions": "Boil.", "author": "nobody"},
+        ]
+        with open(self.path("in.jsonl"), "w", encoding="utf-8") as stream:
+            for record in records:
+                stream.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+
+        out, err = StringIO(), StringIO()
+        call_command("import_recipes", self.path("in.jsonl"), stdout=out, stderr=err)
+        self.assertIn("Imported 1 recipes (4 skipped)", out.getvalue())
+        self.assertIn("line 2: invalid JSON", err.getvalue())
+        self.assertIn("line 3: missing title", err.getvalue())
+        self.assertIn("line 4: unknown category 'brunch'", err.getvalue())
+        self.assertIn("line 5: unknown author 'nobody'", err.getvalue())
+        self.assertEqual(Recipe.objects.get(title="Good").category, "dinner")
+
+        call_command("import_recipes", self.path("in.jsonl"), "--create-authors", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Recipe.objects.get(title="Stranger's").author.username, "nobody")
+        self.assertFalse(User.objects.get(username="nobody").has_usable_password())
+        self.assertTrue(Profile.objects.filter(user__username="nobody").exists())
+
+    def test_batches_and_worker_processes(self):
+        lines = "".join(
+            json.dumps({"title": f"Recipe {n}", "ingredients": "flour\nwater", "instructions": "Bake.",
+                        "author": "someone"}) + "\n"
+            for n in range(25)
+        )
+        batches = []
+        # One author lookup, then an insert per batch (in a savepoint)
+        with self.assertNumQueries(1 + 3 * 3):
+            result = import_recipes(StringIO(lines), "jsonl", batch_size=10, default_author=self.chef,
+                                    index=False, progress=lambda imported, skipped: batches.append(imported))
+        self.assertEqual(result, (25, 0, []))
+        self.assertEqual(batches, [10, 20, 25])
+
+        result = import_recipes(StringIO(lines), "jsonl", batch_size=10, workers=2, default_author=self.baker)
+        self.assertEqual(result.imported, 25)
+        self.assertEqual(
+            list(self.baker.recipes.order_by("pk").values_list("title", flat=True)[:3]),
+            ["Lemon cake", "Recipe 0", "Recipe 1"],
+        )
+
+
+class SeedScaleTests(TestCase):
+    def test_seed_scale(self):
+        out = StringIO()
+        call_command(
+            "seed_scale", "--users", "30", "--recipes", "60", "--likes", "300", "--saves", "60",
+            "--ratings", "100", "--comments", "50", "--password", "pass", stdout=out,
+        )
+        self.assertIn("Added 30 users, 60 recipes", out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith="seed").count(), 30)
+        # Users are bulk-created, so no post_save runs: seeding adds their profiles itself
+        self.assertFalse(User.objects.filter(username__startswith="seed", profile__isnull=True).exists())
+        self.assertEqual(Recipe.objects.count(), 60)
+        self.assertTrue(self.client.login(username="seed0", password="pass"))
+
+        # The stored counters match the rows, as if the views had written them
+        likes = Recipe.likes.through.objects.count()
+        self.assertGreater(likes, 250)
+        self.assertEqual(sum(Recipe.objects.values_list("like_count", flat=True)), likes)
+        self.assertEqual(sum(Recipe.objects.values_list("comment_count", flat=True)), 50)
+        self.assertEqual(RecipeSignature.objects.count(), 60)
+        self.assertTrue(RecipeIngredient.objects.exists())
+        self.assertTrue(RecipeNeighbor.objects.exists())
+
+        # Popularity follows a power law: the top recipe has many times the median
+        counts = sorted(Recipe.objects.values_list("like_count", flat=True), reverse=True)
+        self.assertGreater(counts[0], 4 * max(counts[len(counts) // 2], 1))
+
+        # Recipes are spread over the past year, not all stamped "now"
+        oldest = Recipe.objects.order_by("created_at").first().created_at
+        self.assertLess(oldest, timezone.now() - timezone.timedelta(days=30))
+
+        # Seeding again adds new users rather than clashing with the first ones
+        call_command("seed_scale", "--users", "5", "--recipes", "5", "--likes", "5", "--saves", "0",
+                     "--ratings", "0", "--comments", "0", "--no-index", "--no-recommendations", stdout=StringIO())
+        self.assertTrue(User.objects.filter(username="seed34").exists())
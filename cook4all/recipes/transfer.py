@@ -0,0 +1,343 @@
+"""
+Bulk import and export of recipes, as JSON Lines or CSV.
+
+Both directions stream: the export reads recipes in keyset batches and
+writes one record per line, and the import reads, validates and writes
+`batch_size` records at a time, so memory stays flat however large the
+file. A record has the fields in FIELDS; `author` is a username and
+`category` a category key or label.
+
+Each import batch is one transaction: its authors are resolved with one
+query, its recipes are inserted with one bulk_create and, unless
+`index=False`, the ingredient, duplicate and search indexes are updated
+for the whole batch (bulk_create sends no post_save signals). With
+`workers`, decoding and validating records, parsing their ingredients and
+computing their MinHash signatures is spread over processes while the main
+process writes; a bounded number of chunks is in flight at once.
+"""
+import csv
+import itertools
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import django
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.models import Profile
+
+from . import duplicates, ingredients
+from .caching import invalidate_pages, invalidate_search_cache
+from .leaderboards import invalidate_leaderboards
+from .models import Recipe
+from .search import get_search_backend
+
+FIELDS = ("title", "description", "ingredients", "instructions", "category", "author", "image", "created_at")
+FORMATS = ("jsonl", "csv")
+REQUIRED = ("title", "ingredients", "instructions", "author")
+
+CATEGORIES = {
+    **{label.lower(): key for key, label in Recipe.CATEGORY_CHOICES},
+    **{key: key for key, _ in Recipe.CATEGORY_CHOICES},
+}
+TITLE_MAX_LENGTH = Recipe._meta.get_field("title").max_length
+# Invalid records reported back in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    skipped: int
+    # (line number, message) for the first MAX_REPORTED_ERRORS invalid records
+    errors: list
+
+
+def detect_format(path, format=None):
+    """`format` if given, else the one named by the file extension."""
+    if format:
+        return format
+    for candidate in FORMATS:
+        if str(path).lower().endswith(f".{candidate}"):
+            return candidate
+    if str(path).lower().endswith((".json", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass one of {', '.join(FORMATS)}.")
+
+
+# ---------------------------------------
+# Export
+# ---------------------------------------
+def export_records(queryset=None, batch_size=2000):
+    """Yield one dict per recipe, with the fields in FIELDS, oldest first."""
+    queryset = Recipe.objects.all() if queryset is None else queryset
+    image_field = Recipe._meta.get_field("image")
+    rows = (
+        queryset.order_by("pk")
+        .values_list("title", "description", "ingredients", "instructions", "category",
+                     "author__username", "image", "created_at")
+        .iterator(chunk_size=batch_size)
+    )
+    for title, description, ingredients_, instructions, category, author, image, created_at in rows:
+        yield {
+            "title": title,
+            "description": description,
+            "ingredients": ingredients_,
+            "instructions": instructions,
+            "category": category,
+            "author": author,
+            # The stored form ("image/upload/v1/id.jpg"), which imports back as is
+            "image": image_field.get_prep_value(image) if image else "",
+            "created_at": created_at.isoformat(),
+        }
+
+
+def export_recipes(stream, format, queryset=None, batch_size=2000):
+    """Write the recipes of `queryset` (all by default) to the text `stream`; returns the count."""
+    records = export_records(queryset, batch_size)
+    count = 0
+    if format == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            count += 1
+    else:
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+# ---------------------------------------
+# Import: reading and validating
+# ---------------------------------------
+def read_records(stream, format):
+    """
+    Yield (line number, raw record) from the text `stream`: the undecoded
+    line for JSON Lines, a dict for CSV (parsed here, as a quoted field can
+    span lines).
+    """
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield number, line
+
+
+def clean_record(raw):
+    """
+    Decode and validate one raw record; returns the dict of Recipe field
+    values, with the author's username under "author". Raises ValueError.
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"invalid JSON: {exc}") from None
+        if not isinstance(raw, dict):
+            raise ValueError("a record must be an object")
+
+    record = {field: str(raw.get(field) or "").strip() for field in FIELDS}
+    missing = [field for field in REQUIRED if not record[field]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if len(record["title"]) > TITLE_MAX_LENGTH:
+        raise ValueError(f"title longer than {TITLE_MAX_LENGTH} characters")
+
+    category = CATEGORIES.get((record["category"] or "other").lower())
+    if category is None:
+        raise ValueError(f"unknown category {record['category']!r}")
+    record["category"] = category
+
+    if record["created_at"]:
+        created_at = parse_datetime(record["created_at"])
+        if created_at is None:
+            raise ValueError(f"invalid created_at {record['created_at']!r}")
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+        record["created_at"] = created_at
+    else:
+        record["created_at"] = None
+    return record
+
+
+def prepare_record(record):
+    """
+    Do the CPU-bound part of indexing a record ahead of the insert: parse its
+    ingredients and compute its MinHash signature.
+    """
+    recipe = Recipe(title=record["title"], ingredients=record["ingredients"], instructions=record["instructions"])
+    record["parsed_ingredients"] = ingredients.distinct_ingredients(ingredients.parse_ingredients(recipe.ingredients))
+    record["signature"] = duplicates.signature(recipe)
+    return record
+
+
+def clean_chunk(chunk, prepare=False):
+    """
+    clean_record() (and prepare_record() if `prepare`) over [(line, raw)]:
+    [(line, record or None, error or None)].
+    """
+    cleaned = []
+    for line, raw in chunk:
+        try:
+            record = clean_record(raw)
+        except ValueError as exc:
+            cleaned.append((line, None, str(exc)))
+            continue
+        cleaned.append((line, prepare_record(record) if prepare else record, None))
+    return cleaned
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _clean_in_parallel(chunks, workers, prepare):
+    """clean_chunk() over `chunks` in `workers` processes, in order, with at
+    most two chunks per worker in flight so the input is not read far ahead."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(clean_chunk, chunk, prepare))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# ---------------------------------------
+# Import: writing
+# ---------------------------------------
+class AuthorResolver:
+    """Username -> user id, looked up (and optionally created) a batch at a time."""
+
+    def __init__(self, create=False, default=None):
+        self.create = create
+        self.default = default
+        self.ids = {}
+
+    def resolve(self, usernames):
+        missing = set(usernames) - self.ids.keys()
+        if missing:
+            self.ids.update(User.objects.filter(username__in=missing).values_list("username", "pk"))
+            missing -= self.ids.keys()
+        if missing and self.create:
+            new_users = []
+            for username in missing:
+                user = User(username=username)
+                user.set_unusable_password()
+                new_users.append(user)
+            User.objects.bulk_create(new_users, ignore_conflicts=True)
+            created = dict(User.objects.filter(username__in=missing).values_list("username", "pk"))
+            # bulk_create sends no post_save, so add the profiles sign-up would
+            Profile.objects.bulk_create(
+                [Profile(user_id=user_id) for user_id in created.values()], ignore_conflicts=True
+            )
+            self.ids.update(created)
+            missing -= self.ids.keys()
+        # Remembered as unknown, so later batches don't look them up again
+        self.ids.update(dict.fromkeys(missing))
+
+    def get(self, username):
+        author_id = self.ids.get(username)
+        if author_id is None and self.default is not None:
+            return self.default.pk
+        return author_id
+
+
+def write_batch(records, authors, index=True):
+    """
+    Insert `records` (from clean_record) as recipes in one transaction and
+    index them. Returns (recipes created, [(line, error)] for the rest).
+    """
+    errors = []
+    with transaction.atomic():
+        authors.resolve(record["author"] for _, record in records)
+        recipes, kept, dated = [], [], []
+        for line, record in records:
+            author_id = authors.get(record["author"])
+            if author_id is None:
+                errors.append((line, f"unknown author {record['author']!r}"))
+                continue
+            recipe = Recipe(
+                author_id=author_id,
+                title=record["title"],
+                description=record["description"],
+                ingredients=record["ingredients"],
+                instructions=record["instructions"],
+                category=record["category"],
+                image=record["image"] or None,
+            )
+            recipes.append(recipe)
+            kept.append(record)
+            if record["created_at"]:
+                dated.append((recipe, record["created_at"]))
+
+        Recipe.objects.bulk_create(recipes)
+        # bulk_create stamps created_at with the current time (auto_now_add);
+        # the dates from the file are put back in one UPDATE
+        if dated:
+            for recipe, created_at in dated:
+                recipe.created_at = created_at
+            Recipe.objects.bulk_update([recipe for recipe, _ in dated], ["created_at"])
+
+        if index and recipes:
+            # Records prepared by prepare_record() in the workers aren't parsed again
+            prepared = [(recipe.pk, record) for recipe, record in zip(recipes, kept) if "signature" in record]
+            ingredients.index_recipes(recipes, {pk: record["parsed_ingredients"] for pk, record in prepared})
+            duplicates.index_recipes(recipes, {pk: record["signature"] for pk, record in prepared})
+            get_search_backend().index_many(recipes)
+    return recipes, errors
+
+
+def import_recipes(stream, format, batch_size=1000, workers=0, create_authors=False,
+                   default_author=None, index=True, progress=None):
+    """
+    Import every record in the text `stream`. Invalid records are skipped
+    and reported in the result. `progress(imported, skipped)` is called
+    after each batch.
+    """
+    authors = AuthorResolver(create=create_authors, default=default_author)
+    chunks = _chunks(read_records(stream, format), batch_size)
+    if workers > 1:
+        cleaned_chunks = _clean_in_parallel(chunks, workers, prepare=index)
+    else:
+        cleaned_chunks = map(clean_chunk, chunks)
+
+    imported = skipped = 0
+    errors = []
+
+    def report(line, message):
+        nonlocal skipped
+        skipped += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line, message))
+
+    for cleaned in cleaned_chunks:
+        valid = []
+        for line, record, error in cleaned:
+            if error:
+                report(line, error)
+            else:
+                valid.append((line, record))
+        recipes, rejected = write_batch(valid, authors, index=index)
+        imported += len(recipes)
+        for line, message in rejected:
+            report(line, message)
+        if progress:
+            progress(imported, skipped)
+
+    if imported:
+        invalidate_pages()
+        invalidate_search_cache()
+        invalidate_leaderboards()
+    return ImportResult(imported, skipped, errors)
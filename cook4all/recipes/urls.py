@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RecipeListView, RecipeDetailView, RecipeCreateView, toggle_like
+from .views import RecipeListView, RecipeCreateView, toggle_like
 from .views import ajax_search_recipes
 from . import views
 
@@ -7,10 +7,14 @@ from . import views
 urlpatterns = [
     path("", RecipeListView.as_view(), name="recipe_list"),
     path("new/", RecipeCreateView.as_view(), name="recipe_create"),
-    path("<int:pk>/", RecipeDetailView.as_view(), name="recipe_detail"),
+    path("<int:pk>/", views.recipe_detail, name="recipe_detail"),
     path("<int:pk>/like/", toggle_like, name="recipe_like"),  # <-- Like/unlike view
+    path("api/<int:pk>/like/", views.api_toggle_like, name="api_toggle_like"),
+    path("api/<int:pk>/save/", views.api_toggle_save, name="api_toggle_save"),
     path('ajax/search/', ajax_search_recipes, name='ajax_search_recipes'),
+    path('ajax/ingredients/', views.ajax_ingredient_search, name='ajax_ingredient_search'),
     path('recipe/<int:pk>/comment/', views.add_comment, name='add_comment'),
+    path('<int:pk>/comments/', views.recipe_comments, name='recipe_comments'),
     path('recipe/<int:pk>/comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
     path('<int:pk>/rate/', views.recipe_rate, name='recipe_rate'),
     path('recipes/<int:pk>/comment/<int:comment_id>/edit/', views.edit_comment, name='edit_comment'),
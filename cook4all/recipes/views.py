@@ -1,135 +1,359 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from django.views.generic import CreateView, ListView, DetailView
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.views.generic import CreateView, ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count, Avg
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
 from django.contrib import messages
+from django.views.decorators.http import require_POST
+from django.utils.decorators import method_decorator
+from django.utils.text import Truncator
+from functools import wraps
+from images.pipeline import schedule_variants, srcsets
+from instrumentation import metrics
 from .models import Recipe, Rating, Comment
+from . import engagement
+from .caching import attach_cache_versions, cache_anonymous_page, recipe_page_version
+from .conditional import (
+    conditional_page, recipe_etag, recipe_last_modified, recipes_etag, recipes_last_modified,
+    search_etag,
+)
+from .duplicates import find_duplicates
 from .forms import RecipeForm
+from .ingredients import MATCH_MODES
+from .leaderboards import get_leaderboards
+from .pagination import KeysetPaginator, approximate_count
+from .recommendations import similar_recipes
+from .search import search_cache_key, search_recipes
+
+COMMENTS = metrics.counter("recipes_comments_total", "Comments added, edited and deleted.", ["action"])
+RATINGS = metrics.counter("recipes_ratings_total", "Ratings given and changed.", ["action"])
+SEARCHES = metrics.counter("recipes_searches_total", "Searches, by where they were made.", ["kind"])
+
+
+def counts_searches(kind, parameter="q"):
+    """
+    Count requests carrying `parameter` as searches. Put it outermost, so
+    answers from the page cache and 304s are counted too.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_counted(request, *args, **kwargs):
+                if request.GET.get(parameter, "").strip():
+                    SEARCHES.inc(kind=kind)
+                return await view(request, *args, **kwargs)
+            return async_counted
+
+        @wraps(view)
+        def counted(request, *args, **kwargs):
+            if request.GET.get(parameter, "").strip():
+                SEARCHES.inc(kind=kind)
+            return view(request, *args, **kwargs)
+        return counted
+    return decorator
 
 
 # ---------------------------------------
 # Recipe List View (search + filters + pagination + toggle)
 # ---------------------------------------
+@method_decorator(counts_searches("list"), name="dispatch")
+@method_decorator(conditional_page(recipes_etag, recipes_last_modified), name="dispatch")
+@method_decorator(cache_anonymous_page(), name="dispatch")
 class RecipeListView(ListView):
     model = Recipe
     template_name = "recipes/recipe_list.html"
     context_object_name = "recipes"
-    ordering = ["-created_at"]
+    ordering = ["-created_at", "-id"]
+    per_page = 6
+
+    # Sort keys for keyset pagination, per filter; the last key must be unique
+    keyset_ordering = {
+        "most_liked": ("-like_count", "-created_at", "-id"),
+        "top_rated": ("-rating_average", "-created_at", "-id"),
+    }
+    filters = ("most_liked", "top_rated", "breakfast", "dinner", "snack", "dessert", "other")
 
     # Main queryset
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().with_stats(self.request.user)
 
         # Search
         query = self.request.GET.get("q")
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query)
-            )
+            queryset = search_recipes(queryset, query)
 
-        # Toggle filter
+        # Filter, carried in the URL. The active filter's button links to the
+        # list without it, so clicking it again toggles it off; nothing is
+        # stored in the session, so reading the list never writes.
         filter_option = self.request.GET.get("filter")
-        current_filter = self.request.session.get("current_filter")
-
-        # If user clicks same filter again, remove it
-        if filter_option and filter_option == current_filter:
-            self.request.session["current_filter"] = None
+        if filter_option not in self.filters:
             filter_option = None
-        else:
-            self.request.session["current_filter"] = filter_option
 
         # Apply filters
         if filter_option == "most_liked":
-            queryset = (
-                queryset.annotate(like_count=Count("likes"))
-                        .filter(like_count__gt=0)
-                        .order_by("-like_count")
-            )
+            queryset = queryset.filter(like_count__gt=0).order_by(*self.keyset_ordering["most_liked"])
         elif filter_option == "top_rated":
-            queryset = (
-                queryset.annotate(avg_rating=Avg("ratings__value"))
-                        .filter(avg_rating__gt=0)
-                        .order_by("-avg_rating")
-            )
+            queryset = queryset.filter(rating_count__gt=0).order_by(*self.keyset_ordering["top_rated"])
         elif filter_option in ["breakfast", "dinner", "snack", "dessert", "other"]:
             queryset = queryset.filter(category=filter_option)
 
+        self.filter_option = filter_option
         return queryset
 
+    def uses_keyset_pagination(self):
+        """
+        Keyset pagination is used when settings.RECIPES_LIST_PAGINATION is
+        "keyset" or the request carries a cursor. Search results keep page
+        numbers because they are ordered by relevance, not a stored key.
+        """
+        if self.request.GET.get("q"):
+            return False
+        return (
+            "cursor" in self.request.GET
+            or getattr(settings, "RECIPES_LIST_PAGINATION", "page") == "keyset"
+        )
+
     # Context
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["search_query"] = self.request.GET.get("q", "")
-        context["filter_option"] = self.request.session.get("current_filter", "")
+        context["filter_option"] = self.filter_option or ""
 
         # Pagination
         recipes = context["recipes"]
-        paginator = Paginator(recipes, 6)
-        page_obj = paginator.get_page(self.request.GET.get("page"))
-        context["recipes"] = page_obj
-
-        # Top 3 Liked Recipes
-        context["favorites"] = (
-            Recipe.objects.annotate(num_likes=Count("likes"))
-            .order_by("-num_likes")[:3]
+        if self.uses_keyset_pagination():
+            ordering = self.keyset_ordering.get(self.filter_option, self.ordering)
+            paginator = KeysetPaginator(recipes, ordering, self.per_page)
+            context["recipes"] = paginator.get_page(self.request.GET.get("cursor"))
+            context["keyset_pagination"] = True
+            context["total_count"], context["total_is_exact"] = approximate_count(recipes)
+        else:
+            paginator = Paginator(recipes, self.per_page)
+            context["recipes"] = paginator.get_page(self.request.GET.get("page"))
+
+        # Top 3 Liked / Rated Recipes, and the category's leaders when one is
+        # picked, from the cached leaderboards
+        categories = dict(Recipe.CATEGORY_CHOICES)
+        category = self.filter_option if self.filter_option in categories else None
+        leaderboards = get_leaderboards(self.request.user, category)
+        context["favorites"] = leaderboards["liked"][:3]
+        context["top_rated"] = leaderboards["rated"][:3]
+        context["category_leaders"] = leaderboards["by_category"].get(category, [])[:3]
+        context["category_label"] = categories.get(category, "")
+
+        # Cache versions for every card's fragment, in one cache read
+        attach_cache_versions(
+            list(context["recipes"]) + context["favorites"] + context["top_rated"]
+            + context["category_leaders"]
         )
+        return context
+
 
-        # Top 3 Rated Recipes
-        context["top_rated"] = (
-            Recipe.objects.annotate(avg_rating=Avg("ratings__value"))
-            .order_by("-avg_rating")[:3]
+# ---------------------------------------
+# AJAX Search
+# ---------------------------------------
+SEARCH_MIN_QUERY_LENGTH = 2
+SEARCH_PAGE_SIZE = 12
+SEARCH_MAX_PAGE_SIZE = 48
+# Results are ranked by relevance, which no index holds, so pages are
+# OFFSET-based; deep offsets scan and discard rows, hence the cap
+SEARCH_MAX_OFFSET = 480
+
+
+def _search_card(recipe):
+    """Compact JSON representation of a recipe card."""
+    return {
+        "id": recipe.pk,
+        "title": recipe.title,
+        "description": Truncator(recipe.description).words(20),
+        "category": recipe.category,
+        "image": recipe.image.url if recipe.image else None,
+        "srcset": srcsets(recipe.image_variants, "card"),
+        "url": reverse("recipe_detail", args=[recipe.pk]),
+    }
+
+
+def _search_page(request):
+    """(limit, offset) from ?limit= and ?offset=, or None if the offset is invalid."""
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = SEARCH_PAGE_SIZE
+    try:
+        offset = int(request.GET.get('offset') or 0)
+    except ValueError:
+        return None
+    if not 0 <= offset <= SEARCH_MAX_OFFSET:
+        return None
+    return limit, offset
+
+
+def _next_offset(limit, offset, has_next):
+    """The offset of the following page, or None past the last one (or the cap)."""
+    if has_next and offset + limit <= SEARCH_MAX_OFFSET:
+        return offset + limit
+    return None
+
+
+def _search_validator(func):
+    # Too-short queries are answered without the database; keep it that way
+    def validator(request, *args, **kwargs):
+        if len(" ".join(request.GET.get('q', '').split())) < SEARCH_MIN_QUERY_LENGTH:
+            return None
+        return func(request, *args, **kwargs)
+    return validator
+
+
+@counts_searches("ajax")
+@conditional_page(_search_validator(search_etag), _search_validator(recipes_last_modified))
+async def ajax_search_recipes(request):
+    query = " ".join(request.GET.get('q', '').split())
+    compact = request.GET.get('format') == 'json'
+
+    # Too short to be selective: answer without touching the database
+    if len(query) < SEARCH_MIN_QUERY_LENGTH:
+        return JsonResponse({'results': [], 'next': None} if compact else {'html': '', 'next': None})
+
+    paging = _search_page(request)
+    if paging is None:
+        return JsonResponse({'error': 'Invalid offset.'}, status=400)
+    limit, offset = paging
+
+    cache_key = await sync_to_async(search_cache_key)(query.lower(), offset, limit, compact)
+    payload = await cache.aget(cache_key)
+    if payload is None:
+        recipes = search_recipes(
+            Recipe.objects.only("title", "description", "image", "image_variants", "category", "created_at"),
+            query,
         )
+        # Fetch one extra row to learn whether there is a next page
+        page = [recipe async for recipe in recipes[offset:offset + limit + 1]]
+        has_next = len(page) > limit
+        page = page[:limit]
+
+        payload = {
+            'next': _next_offset(limit, offset, has_next),
+        }
+        if compact:
+            payload['results'] = [_search_card(recipe) for recipe in page]
+        else:
+            payload['html'] = await sync_to_async(render_to_string)(
+                'recipes/partials/recipe_cards.html',
+                {'recipes': page, 'user': await request.auser()}
+            )
+        await cache.aset(cache_key, payload, getattr(settings, "RECIPES_SEARCH_CACHE_TIMEOUT", 60))
 
-        return context
+    return JsonResponse(payload)
 
 
 # ---------------------------------------
-# AJAX Search
+# AJAX Ingredient Search
 # ---------------------------------------
-def ajax_search_recipes(request):
-    query = request.GET.get('q', '')
-    recipes = Recipe.objects.filter(
-        Q(title__icontains=query) |
-        Q(description__icontains=query)
-    ).order_by('-created_at')
+INGREDIENT_SEARCH_MAX_INGREDIENTS = 20
+
+
+@counts_searches("ingredients", parameter="have")
+def ajax_ingredient_search(request):
+    """
+    Recipes by ingredient: ?have=eggs,spinach&match=all|any|missing-one.
+    "missing-one" finds recipes needing at most one ingredient beyond those.
+    """
+    names = [name.strip() for name in request.GET.get('have', '').split(',') if name.strip()]
+    names = names[:INGREDIENT_SEARCH_MAX_INGREDIENTS]
+    mode = request.GET.get('match', 'all')
+    if mode not in MATCH_MODES:
+        return JsonResponse({'error': 'Unknown match mode.'}, status=400)
+    if not names:
+        return JsonResponse({'results': [], 'next': None})
+
+    paging = _search_page(request)
+    if paging is None:
+        return JsonResponse({'error': 'Invalid offset.'}, status=400)
+    limit, offset = paging
+
+    # Recipe saves move the search cache version, and they are also what
+    # re-parses ingredients, so the same cache serves here
+    cache_key = search_cache_key("ingredients", mode, sorted(names), offset, limit)
+    payload = cache.get(cache_key)
+    if payload is None:
+        recipes = MATCH_MODES[mode](
+            Recipe.objects.only("title", "description", "image", "image_variants", "category"),
+            names,
+        )
+        if mode == "all":
+            recipes = recipes.order_by("-like_count", "-id")
+        page = list(recipes[offset:offset + limit + 1])
+        has_next = len(page) > limit
+        page = page[:limit]
 
-    html = render_to_string(
-        'recipes/partials/recipe_cards.html',
-        {'recipes': recipes, 'user': request.user}
-    )
+        payload = {
+            'next': _next_offset(limit, offset, has_next),
+            'results': [
+                dict(_search_card(recipe), missing=getattr(recipe, 'missing', 0)) for recipe in page
+            ],
+        }
+        cache.set(cache_key, payload, getattr(settings, "RECIPES_SEARCH_CACHE_TIMEOUT", 60))
 
-    return JsonResponse({'html': html})
+    return JsonResponse(payload)
 
 
 # ---------------------------------------
 # Recipe Detail
 # ---------------------------------------
-class RecipeDetailView(DetailView):
-    model = Recipe
-    template_name = "recipes/recipe_detail.html"
-    context_object_name = "recipe"
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        recipe = self.object
-        user = self.request.user
+COMMENTS_PER_PAGE = 20
+
+
+def comment_page(recipe, cursor=None):
+    """One page of a recipe's comments, newest first, with their authors."""
+    comments = Comment.objects.filter(recipe=recipe).select_related("author")
+    return KeysetPaginator(comments, ("-created_at", "-id"), COMMENTS_PER_PAGE).get_page(cursor)
+
+
+def _detail_context(recipe, comments_cursor):
+    attach_cache_versions([recipe])
+    return {
+        'recipe': recipe,
+        'object': recipe,
+        'user_rating': recipe.my_rating,
+        'average_rating': recipe.avg_rating,
+        # First page of comments; "load more" fetches the rest
+        'comments': comment_page(recipe, comments_cursor),
+        'similar_recipes': similar_recipes(recipe),
+    }
+
+
+@conditional_page(recipe_etag, recipe_last_modified)
+@cache_anonymous_page(recipe_page_version)
+async def recipe_detail(request, pk):
+    # Author, stats and the viewer's own like/save/rating in the same query
+    recipe = await aget_object_or_404(
+        Recipe.objects.with_stats(await request.auser()).select_related("author"), pk=pk
+    )
+    # The comments and recommendations go through cached, synchronous helpers
+    context = await sync_to_async(_detail_context)(recipe, request.GET.get("comments"))
+    return TemplateResponse(request, "recipes/recipe_detail.html", context)
 
-        # User rating
-        if user.is_authenticated:
-            rating = recipe.ratings.filter(user=user).first()
-            context['user_rating'] = rating.value if rating else 0
-        else:
-            context['user_rating'] = 0
 
-        # Average rating
-        context['average_rating'] = recipe.average_rating
-        return context
+# ---------------------------------------
+# Comments "load more" (JSON)
+# ---------------------------------------
+def recipe_comments(request, pk):
+    recipe = get_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    comments = comment_page(recipe, request.GET.get("cursor"))
+    html = render_to_string(
+        'recipes/partials/comment_items.html',
+        {'comments': comments, 'recipe': recipe},
+        request=request,
+    )
+    return JsonResponse({'html': html, 'next': comments.next_cursor})
 
 
 # ---------------------------------------
@@ -143,20 +367,28 @@ class RecipeCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        return super().form_valid(form)
+        # Likely reposts are shown to the author, who can still post anyway
+        if not self.request.POST.get("confirm_duplicate"):
+            duplicates = find_duplicates(form.instance)
+            if duplicates:
+                return self.render_to_response(self.get_context_data(
+                    form=form, duplicates=duplicates, image_dropped="image" in self.request.FILES,
+                ))
+        response = super().form_valid(form)
+        # Thumbnails are rendered in the background once the recipe is saved
+        if "image" in self.request.FILES:
+            schedule_variants(self.object, self.request.FILES["image"])
+        return response
 
 
 # ---------------------------------------
 # Like / Unlike
 # ---------------------------------------
 @login_required
-def toggle_like(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    user = request.user
-    if user in recipe.likes.all():
-        recipe.likes.remove(user)
-    else:
-        recipe.likes.add(user)
+async def toggle_like(request, pk):
+    recipe = await aget_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    # The toggles run in a transaction, which the async ORM can't open
+    await sync_to_async(engagement.toggle_like)(recipe, await request.auser())
     return redirect(request.META.get('HTTP_REFERER', 'recipe_list'))
 
 
@@ -164,16 +396,35 @@ def toggle_like(request, pk):
 # Save / Unsave
 # ---------------------------------------
 @login_required
-def toggle_save(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    user = request.user
-    if user in recipe.saved_by.all():
-        recipe.saved_by.remove(user)
-    else:
-        recipe.saved_by.add(user)
+async def toggle_save(request, pk):
+    recipe = await aget_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    await sync_to_async(engagement.toggle_save)(recipe, await request.auser())
     return redirect(request.META.get('HTTP_REFERER', 'recipe_list'))
 
 
+# ---------------------------------------
+# Like / Save JSON API (no redirect, for in-page buttons)
+# ---------------------------------------
+@require_POST
+async def api_toggle_like(request, pk):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Login required.'}, status=401)
+    recipe = await aget_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    liked, like_count = await sync_to_async(engagement.toggle_like)(recipe, user)
+    return JsonResponse({'liked': liked, 'like_count': like_count})
+
+
+@require_POST
+async def api_toggle_save(request, pk):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Login required.'}, status=401)
+    recipe = await aget_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    saved, save_count = await sync_to_async(engagement.toggle_save)(recipe, user)
+    return JsonResponse({'saved': saved, 'save_count': save_count})
+
+
 # ---------------------------------------
 # Add Comment
 # ---------------------------------------
@@ -183,7 +434,10 @@ def add_comment(request, pk):
     if request.method == "POST":
         content = request.POST.get("content")
         if content:
-            Comment.objects.create(recipe=recipe, author=request.user, content=content)
+            with transaction.atomic():
+                Comment.objects.create(recipe=recipe, author=request.user, content=content)
+                recipe.adjust_counters(comment_count=1)
+            COMMENTS.inc(action="add")
             messages.success(request, "Comment added successfully!")
         return redirect('recipe_detail', pk=pk)
 
@@ -193,8 +447,16 @@ def add_comment(request, pk):
 # ---------------------------------------
 @login_required
 def delete_comment(request, pk, comment_id):
-    comment = get_object_or_404(Comment, pk=comment_id, author=request.user)
-    comment.delete()
+    comment = get_object_or_404(
+        Comment.objects.select_related("recipe"), pk=comment_id, author=request.user
+    )
+    with transaction.atomic():
+        # A concurrent or repeated delete removes nothing and must not count
+        deleted = Comment.objects.filter(pk=comment.pk).delete()[0]
+        if deleted:
+            comment.recipe.adjust_counters(comment_count=-deleted)
+    if deleted:
+        COMMENTS.inc(action="delete")
     messages.success(request, "Comment deleted!")
     return redirect('recipe_detail', pk=pk)
 
@@ -210,6 +472,7 @@ def edit_comment(request, pk, comment_id):
         if new_content:
             comment.content = new_content
             comment.save()
+            COMMENTS.inc(action="edit")
             messages.success(request, "Comment updated!")
         return redirect('recipe_detail', pk=pk)
 
@@ -217,11 +480,34 @@ def edit_comment(request, pk, comment_id):
 # ---------------------------------------
 # Rate Recipe
 # ---------------------------------------
+def _rate(recipe, user, value):
+    """Store `user`'s rating of `recipe`; True if it is their first."""
+    with transaction.atomic():
+        try:
+            # In a savepoint: if a concurrent first rating wins, this is a change
+            with transaction.atomic():
+                Rating.objects.create(user=user, recipe=recipe, value=value)
+        except IntegrityError:
+            previous = Rating.objects.select_for_update().get(user=user, recipe=recipe)
+            delta = value - previous.value
+            previous.value = value
+            previous.save(update_fields=["value"])
+            recipe.adjust_counters(rating_sum=delta)
+            return False
+        recipe.adjust_counters(rating_sum=value, rating_count=1)
+    return True
+
+
 @login_required
-def recipe_rate(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    if request.method == "POST":
-        value = int(request.POST.get("rating", 0))
-        if 1 <= value <= 5:
-            Rating.objects.update_or_create(user=request.user, recipe=recipe, defaults={'value': value})
-        return redirect('recipe_detail', pk=pk)
+@require_POST
+async def recipe_rate(request, pk):
+    recipe = await aget_object_or_404(Recipe, pk=pk)
+    try:
+        value = int(request.POST.get("rating", ""))
+    except ValueError:
+        value = 0
+    # Anything but 1-5 stars is ignored
+    if 1 <= value <= 5:
+        first = await sync_to_async(_rate)(recipe, await request.auser(), value)
+        RATINGS.inc(action="new" if first else "change")
+    return redirect('recipe_detail', pk=pk)
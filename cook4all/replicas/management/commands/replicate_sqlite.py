@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from replicas.replication import replicate, sqlite_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database over each SQLite replica in "
+        "DATABASE_REPLICAS: a local stand-in for replication (see replicas.replication)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=0,
+            help="Copy again every this many seconds until interrupted (default: copy once).",
+        )
+
+    def handle(self, *args, **options):
+        if not sqlite_replicas():
+            raise CommandError("No SQLite replicas configured; set SQLITE_REPLICAS.")
+
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        while True:
+            count = replicate(log=log)
+            self.stdout.write(self.style.SUCCESS(f"Copied the primary to {count} replica(s)."))
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
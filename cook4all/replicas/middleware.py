@@ -0,0 +1,75 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .router import fail_over, routing
+
+PIN_COOKIE = "primary_pin"
+UNSAFE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def pin_seconds():
+    return getattr(settings, "REPLICA_PIN_SECONDS", 5)
+
+
+def pinned_until(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read the request from a replica (see replicas.router) unless it is a
+    write, or the visitor wrote in the last REPLICA_PIN_SECONDS; a request
+    that writes pins its visitor to the primary with a cookie. A read-only
+    request whose replica fails is served again from the primary. Put it
+    before any middleware that reads the database.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        now = time.time()
+        with routing(pinned=self.is_pinned(request, now)) as state:
+            response = self.get_response(request)
+        if state.failed_over:
+            # The replica failed before anything was written: start over on the primary
+            with routing(pinned=True) as state:
+                response = self.get_response(request)
+        return self.pin(response, state, now)
+
+    async def __acall__(self, request):
+        now = time.time()
+        # The routing state is a context variable, seen by the ORM's threads
+        with routing(pinned=self.is_pinned(request, now)) as state:
+            response = await self.get_response(request)
+        if state.failed_over:
+            with routing(pinned=True) as state:
+                response = await self.get_response(request)
+        return self.pin(response, state, now)
+
+    def process_exception(self, request, exception):
+        # Let the error response through: when the replica failed, __call__
+        # discards it and serves the request again from the primary
+        fail_over(exception)
+        return None
+
+    def is_pinned(self, request, now):
+        return request.method in UNSAFE_METHODS or pinned_until(request) > now
+
+    def pin(self, response, state, now):
+        if state.wrote:
+            until = int(now + pin_seconds()) + 1
+            response.set_cookie(PIN_COOKIE, str(until), max_age=pin_seconds(), httponly=True, samesite="Lax")
+        return response
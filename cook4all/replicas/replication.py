@@ -0,0 +1,46 @@
+"""
+A stand-in for replication, to try replica routing with SQLite on one
+machine: `manage.py replicate_sqlite` copies the primary's file over each
+replica's with SQLite's online backup, a consistent snapshot taken while
+the site keeps writing. Run it in a loop (`--interval`) and the replicas lag
+behind by up to the interval, like real asynchronous replicas do.
+"""
+import sqlite3
+import time
+
+from django.conf import settings
+
+from .router import replica_aliases
+
+
+def sqlite_replicas():
+    """[(alias, file)] of the configured SQLite replicas."""
+    return [
+        (alias, settings.DATABASES[alias]["NAME"])
+        for alias in replica_aliases()
+        if settings.DATABASES[alias]["ENGINE"] == "django.db.backends.sqlite3"
+    ]
+
+
+def copy_database(source, target, pages=1024, retry_delay=0.05):
+    """Copy the SQLite file `source` over `target`, `pages` pages per step."""
+    source_db = sqlite3.connect(source)
+    target_db = sqlite3.connect(target)
+    try:
+        # A step blocked by a reader of the replica is retried after `retry_delay`
+        source_db.backup(target_db, pages=pages, sleep=retry_delay)
+    finally:
+        source_db.close()
+        target_db.close()
+
+
+def replicate(log=None):
+    """Copy the primary over every SQLite replica; returns how many were copied."""
+    source = settings.DATABASES["default"]["NAME"]
+    replicas = sqlite_replicas()
+    for alias, target in replicas:
+        begin = time.perf_counter()
+        copy_database(source, target)
+        if log:
+            log(f"{alias}: copied in {time.perf_counter() - begin:.2f}s")
+    return len(replicas)
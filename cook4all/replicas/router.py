@@ -0,0 +1,166 @@
+"""
+Reads from read replicas, writes to the primary ("default").
+
+Only requests read from replicas: ReplicaPinningMiddleware opens a routing
+state for each one, and code outside a request (management commands, the
+task worker, the shell) keeps reading from the primary. Within a request:
+
+- reads go to one replica, picked round-robin from those in
+  settings.DATABASE_REPLICAS that passed their last health check, and kept
+  for the rest of the request so every query sees the same copy;
+- POST, PUT, PATCH and DELETE requests read from the primary throughout, as
+  they usually read what they are about to change;
+- after the first write, later reads in the request go to the primary, and
+  the middleware pins the visitor to it for REPLICA_PIN_SECONDS so the next
+  pages show what they just did while the replicas catch up;
+- with no healthy replica, everything is read from the primary;
+- if the replica fails during a request that has not written anything, it
+  is taken out of rotation and the middleware serves the request again
+  from the primary (see fail_over).
+
+A replica is checked at most every REPLICA_HEALTH_CHECK_INTERVAL seconds
+per process, with a query on its django_migrations table, so an empty or
+missing copy counts as down.
+"""
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingState:
+    """Where the current request reads from."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica = None
+        self.wrote = False
+        self.failed_over = False
+
+
+_state = contextvars.ContextVar("replica_routing", default=None)
+
+
+def replica_aliases():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def health_check_interval():
+    return getattr(settings, "REPLICA_HEALTH_CHECK_INTERVAL", 5)
+
+
+@contextmanager
+def routing(pinned=False):
+    """Route the reads of the block to replicas, unless `pinned` to the primary."""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+# ---------------------------------------
+# Health
+# ---------------------------------------
+_health = {}
+_health_lock = threading.Lock()
+
+
+def check(alias):
+    """Query the replica now; returns True if it answered."""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM django_migrations LIMIT 1")
+        return True
+    except DatabaseError as exc:
+        logger.warning("Replica %s failed its health check: %s", alias, exc)
+        connections[alias].close()
+        return False
+
+
+def is_healthy(alias, now=None):
+    now = time.monotonic() if now is None else now
+    healthy, checked = _health.get(alias, (None, None))
+    if checked is None or now - checked >= health_check_interval():
+        healthy = check(alias)
+        with _health_lock:
+            _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_down(alias):
+    """Take a replica out of rotation until its next health check."""
+    with _health_lock:
+        _health[alias] = (False, time.monotonic())
+
+
+def fail_over(exception):
+    """
+    After `exception` escaped the view: if it is a database error and the
+    request read from a replica without writing, take the replica out of
+    rotation and return True, so the request can be served again from the
+    primary.
+    """
+    state = _state.get()
+    if state is None or state.wrote or state.replica in (None, DEFAULT_DB_ALIAS):
+        return False
+    if not isinstance(exception, OperationalError):
+        return False
+    logger.warning("Replica %s failed during a request: %s", state.replica, exception)
+    # The broken connection is closed by Django at the end of the request
+    mark_down(state.replica)
+    state.failed_over = True
+    return True
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+_turns = itertools.count()
+
+
+def next_replica():
+    """The next healthy replica in turn, or None if none is."""
+    aliases = replica_aliases()
+    for _ in range(len(aliases)):
+        alias = aliases[next(_turns) % len(aliases)]
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+# ---------------------------------------
+# Router
+# ---------------------------------------
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = next_replica() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in replica_aliases()
@@ -0,0 +1,173 @@
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from recipes.models import Recipe
+
+from . import router
+from .middleware import PIN_COOKIE, ReplicaPinningMiddleware
+from .replication import copy_database
+from .router import ReplicaRouter, routing
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        router.reset_health()
+        self.router = ReplicaRouter()
+        self.healthy = {"replica1": True, "replica2": True}
+        patcher = mock.patch.object(router, "check", side_effect=lambda alias: self.healthy[alias])
+        self.check = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self):
+        return self.router.db_for_read(Recipe)
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(self.read(), "default")
+
+    def test_round_robin_sticky_within_a_request(self):
+        chosen = []
+        for _ in range(4):
+            with routing():
+                chosen.append(self.read())
+                self.assertEqual(self.read(), chosen[-1])
+        self.assertEqual(set(chosen), {"replica1", "replica2"})
+        self.assertNotEqual(chosen[0], chosen[1])
+
+    def test_reads_after_a_write_use_the_primary(self):
+        with routing() as state:
+            self.assertNotEqual(self.read(), "default")
+            self.assertEqual(self.router.db_for_write(Recipe), "default")
+            self.assertTrue(state.wrote)
+            self.assertEqual(self.read(), "default")
+        with routing(pinned=True):
+            self.assertEqual(self.read(), "default")
+
+    def test_unhealthy_replicas_are_skipped(self):
+        self.healthy["replica1"] = False
+        for _ in range(3):
+            with routing():
+                self.assertEqual(self.read(), "replica2")
+
+        self.healthy["replica2"] = False
+        router.mark_down("replica2")
+        with routing():
+            self.assertEqual(self.read(), "default")
+
+        # Checked again once the interval has passed
+        self.healthy["replica1"] = True
+        with override_settings(REPLICA_HEALTH_CHECK_INTERVAL=0), routing():
+            self.assertEqual(self.read(), "replica1")
+
+    def test_health_is_checked_once_per_interval(self):
+        for _ in range(10):
+            with routing():
+                self.read()
+        self.assertEqual(self.check.call_count, 2)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate("default", "recipes"))
+        self.assertFalse(self.router.allow_migrate("replica1", "recipes"))
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"], REPLICA_PIN_SECONDS=5)
+class ReplicaPinningMiddlewareTests(TestCase):
+    def setUp(self):
+        router.reset_health()
+        patcher = mock.patch.object(router, "check", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def respond(self, request, write=False):
+        seen = {}
+
+        def view(request):
+            seen["read"] = ReplicaRouter().db_for_read(Recipe)
+            if write:
+                User.objects.create_user("writer")
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(view)(request)
+        return seen["read"], response
+
+    def test_reads_go_to_a_replica(self):
+        read, response = self.respond(self.factory.get("/"))
+        self.assertEqual(read, "replica1")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writes_pin_the_visitor(self):
+        read, response = self.respond(self.factory.post("/"), write=True)
+        self.assertEqual(read, "default")
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 5)
+
+        request = self.factory.get("/")
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        self.assertEqual(self.respond(request)[0], "default")
+
+        request.COOKIES[PIN_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(self.respond(request)[0], "replica1")
+
+    def test_a_get_that_writes_pins_too(self):
+        read, response = self.respond(self.factory.get("/"), write=True)
+        self.assertEqual(read, "replica1")
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_a_failing_replica_is_marked_down_and_the_read_retried(self):
+        reads = []
+        write = False
+
+        def view(request):
+            reads.append(ReplicaRouter().db_for_read(Recipe))
+            if write:
+                User.objects.create_user(f"writer{len(reads)}")
+            if reads[-1] == "replica1":
+                raise OperationalError("server closed the connection unexpectedly")
+            return HttpResponse()
+
+        def handler(request):
+            # What Django's handler does with an exception from the view
+            try:
+                return view(request)
+            except OperationalError as exc:
+                middleware.process_exception(request, exc)
+                return HttpResponse(status=500)
+
+        middleware = ReplicaPinningMiddleware(handler)
+        self.assertEqual(middleware(self.factory.get("/")).status_code, 200)
+        self.assertEqual(reads, ["replica1", "default"])
+        # Out of rotation until its next health check
+        self.assertEqual(self.respond(self.factory.get("/"))[0], "default")
+
+        # A request that has written is not served twice
+        router.reset_health()
+        reads.clear()
+        write = True
+        self.assertEqual(middleware(self.factory.get("/")).status_code, 500)
+        self.assertEqual(reads, ["replica1"])
+
+
+class ReplicationTests(SimpleTestCase):
+    def test_copy_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = Path(directory, "primary.sqlite3"), Path(directory, "replica.sqlite3")
+            with sqlite3.connect(primary) as db:
+                db.execute("CREATE TABLE recipe (title TEXT)")
+                db.executemany("INSERT INTO recipe VALUES (?)", [("Soup",), ("Stew",)])
+            copy_database(primary, replica)
+            with sqlite3.connect(primary) as db:
+                db.execute("INSERT INTO recipe VALUES ('Pie')")
+            reader = sqlite3.connect(replica)
+            self.assertEqual(reader.execute("SELECT COUNT(*) FROM recipe").fetchone(), (2,))
+            # Caught up on the next copy, with a reader still connected
+            copy_database(primary, replica)
+            self.assertEqual(reader.execute("SELECT COUNT(*) FROM recipe").fetchone(), (3,))
+            reader.close()
@@ -0,0 +1,79 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tasks.queue import claim, prune, requeue_stale, run_pending, run_task
+
+# How often the housekeeping (stale locks, old tasks) runs, in seconds
+HOUSEKEEPING_INTERVAL = 300
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks. Each thread claims and runs one task at a "
+        "time; start several workers (on one or more machines) to scale out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=4,
+            help="Number of tasks run concurrently by this worker (default: 4).",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Seconds to wait before polling again when the queue is empty (default: 1).",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Run every task that is due, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options["once"]:
+            requeue_stale()
+            ran = run_pending(worker_id)
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} tasks."))
+            return
+
+        stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        self.stdout.write(f"Worker {worker_id} running with {options['threads']} threads.")
+        with ThreadPoolExecutor(max_workers=options["threads"], thread_name_prefix="worker") as pool:
+            for number in range(options["threads"]):
+                pool.submit(self.work, f"{worker_id}:{number}", options["poll_interval"], stopping)
+
+            last_housekeeping = 0
+            while not stopping.wait(1):
+                if time.monotonic() - last_housekeeping > HOUSEKEEPING_INTERVAL:
+                    requeue_stale()
+                    prune()
+                    close_old_connections()
+                    last_housekeeping = time.monotonic()
+
+        self.stdout.write("Worker stopped.")
+
+    def work(self, worker_id, poll_interval, stopping):
+        while not stopping.is_set():
+            try:
+                claimed = claim(worker_id)
+                for task in claimed:
+                    ok = run_task(task)
+                    self.stdout.write(f"{'done' if ok else 'failed'}: {task.name} #{task.pk}")
+            except Exception as exc:
+                # A lost database connection must not kill the thread
+                self.stderr.write(f"{worker_id}: {exc!r}")
+                claimed = []
+            finally:
+                close_old_connections()
+            if not claimed:
+                stopping.wait(poll_interval)
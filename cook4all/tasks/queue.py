@@ -0,0 +1,179 @@
+"""
+A small database-backed task queue for work that should not hold up a
+response.
+
+    from tasks.queue import task
+
+    @task(max_attempts=3)
+    def send_welcome_email(user_id):
+        ...
+
+    send_welcome_email.enqueue(user.pk, idempotency_key=f"welcome:{user.pk}")
+
+`enqueue` writes a Task row once the current transaction commits: the job
+never runs for a write that was rolled back, and it never runs before that
+write is visible. `manage.py runworker` claims due tasks and runs them. A
+failed task is retried with exponential backoff until it has used up
+`max_attempts`.
+
+Claiming needs no row locks, so it works on SQLite as well as PostgreSQL.
+A worker picks candidate ids and then flips them from "queued" to
+"running" with a conditional UPDATE; a row that another worker claimed
+first no longer matches. Tasks left "running" by a crashed worker are
+queued again after settings.TASKS_LOCK_TIMEOUT seconds.
+
+With settings.TASKS_ALWAYS_EAGER a task runs as soon as it is enqueued,
+in the same process (still after commit), which is handy in tests.
+"""
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+def task(func=None, *, max_attempts=5, backoff=30, max_backoff=3600):
+    """
+    Mark `func` as runnable by the worker. Failures are retried after
+    about `backoff` seconds, doubling each time up to `max_backoff`.
+    Arguments must be JSON serializable.
+    """
+    def decorate(func):
+        func.task_name = f"{func.__module__}.{func.__qualname__}"
+        func.task_options = {"max_attempts": max_attempts, "backoff": backoff, "max_backoff": max_backoff}
+        func.enqueue = lambda *args, **kwargs: enqueue(func, *args, **kwargs)
+        return func
+
+    return decorate(func) if func is not None else decorate
+
+
+def resolve(name):
+    func = import_string(name)
+    if not hasattr(func, "task_options"):
+        raise ValueError(f"{name} is not a task")
+    return func
+
+
+# ---------------------------------------
+# Producing
+# ---------------------------------------
+def enqueue(func, *args, idempotency_key=None, delay=0, **kwargs):
+    """Queue `func(*args, **kwargs)` to run after the current transaction commits."""
+    name = func if isinstance(func, str) else func.task_name
+    options = resolve(name).task_options
+
+    def push():
+        try:
+            with transaction.atomic():
+                queued = Task.objects.create(
+                    name=name, args=list(args), kwargs=kwargs,
+                    idempotency_key=idempotency_key,
+                    max_attempts=options["max_attempts"],
+                    run_after=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            # Already enqueued under this idempotency key
+            return
+        if getattr(settings, "TASKS_ALWAYS_EAGER", False) and not delay:
+            claimed = claim("eager", ids=[queued.pk])
+            if claimed:
+                run_task(claimed[0])
+
+    transaction.on_commit(push)
+
+
+# ---------------------------------------
+# Consuming
+# ---------------------------------------
+def claim(worker_id, limit=1, ids=None):
+    """Mark up to `limit` due tasks as running for `worker_id` and return them."""
+    now = timezone.now()
+    if ids is None:
+        ids = list(
+            Task.objects.filter(status=Task.QUEUED, run_after__lte=now)
+            .order_by("run_after", "pk").values_list("pk", flat=True)[:limit]
+        )
+    if not ids:
+        return []
+    Task.objects.filter(pk__in=ids, status=Task.QUEUED).update(
+        status=Task.RUNNING, locked_by=worker_id, locked_at=now, attempts=F("attempts") + 1,
+    )
+    return list(
+        Task.objects.filter(pk__in=ids, status=Task.RUNNING, locked_by=worker_id, locked_at=now)
+        .order_by("run_after", "pk")
+    )
+
+
+def backoff_delay(attempts, backoff, max_backoff):
+    """Seconds to wait before attempt `attempts + 1`: doubling, with jitter."""
+    delay = min(max_backoff, backoff * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_task(queued):
+    """Run a claimed task and record the outcome; returns True on success."""
+    func = None
+    try:
+        func = resolve(queued.name)
+        func(*queued.args, **queued.kwargs)
+    except Exception:
+        queued.last_error = traceback.format_exc()
+        options = getattr(func, "task_options", None)
+        if options is None or queued.attempts >= queued.max_attempts:
+            # Out of attempts, or not a task at all: give up
+            queued.status = Task.FAILED
+            queued.finished_at = timezone.now()
+        else:
+            queued.status = Task.QUEUED
+            queued.run_after = timezone.now() + timedelta(seconds=backoff_delay(
+                queued.attempts, options["backoff"], options["max_backoff"]
+            ))
+    else:
+        queued.status = Task.DONE
+        queued.finished_at = timezone.now()
+        queued.last_error = ""
+
+    Task.objects.filter(pk=queued.pk, locked_by=queued.locked_by).update(
+        status=queued.status, run_after=queued.run_after, finished_at=queued.finished_at,
+        last_error=queued.last_error, locked_by="", locked_at=None,
+    )
+    return queued.status == Task.DONE
+
+
+def requeue_stale(timeout=None):
+    """Queue again tasks whose worker stopped before finishing them."""
+    if timeout is None:
+        timeout = getattr(settings, "TASKS_LOCK_TIMEOUT", 600)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff).update(
+        status=Task.QUEUED, locked_by="", locked_at=None,
+    )
+
+
+def prune(days=None):
+    """Delete finished tasks (and so their idempotency keys) older than `days`."""
+    if days is None:
+        days = getattr(settings, "TASKS_RETENTION_DAYS", 7)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Task.objects.filter(
+        status__in=[Task.DONE, Task.FAILED], finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def run_pending(worker_id="inline", limit=None):
+    """Run due tasks one at a time until none are left; returns how many ran."""
+    ran = 0
+    while limit is None or ran < limit:
+        claimed = claim(worker_id)
+        if not claimed:
+            break
+        run_task(claimed[0])
+        ran += 1
+    return ran
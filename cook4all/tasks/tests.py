@@ -0,0 +1,126 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import claim, enqueue, prune, requeue_stale, run_pending, run_task, task
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task(max_attempts=2, backoff=10)
+def explode():
+    raise RuntimeError("boom")
+
+
+def not_a_task():
+    pass
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            record.enqueue("a")
+            self.assertFalse(Task.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+        queued = Task.objects.get()
+        self.assertEqual((queued.name, queued.args, queued.status), ("tasks.tests.record", ["a"], Task.QUEUED))
+        self.assertEqual(calls, [])
+
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, ["a"])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_by), (Task.DONE, 1, ""))
+
+    def test_idempotency_key_runs_work_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("a", idempotency_key="once")
+            record.enqueue("a", idempotency_key="once")
+        self.assertEqual(Task.objects.count(), 1)
+        run_pending()
+        self.assertEqual(calls, ["a"])
+
+    def test_only_tasks_can_be_enqueued(self):
+        with self.assertRaises(ValueError):
+            enqueue("tasks.tests.not_a_task")
+
+    def test_failures_back_off_then_give_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            explode.enqueue()
+        before = timezone.now()
+        self.assertEqual(run_pending(), 1)
+
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertIn("RuntimeError: boom", queued.last_error)
+        # Not due again until the backoff (5-10s with jitter) has passed
+        self.assertGreaterEqual(queued.run_after, before + timedelta(seconds=5))
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_after=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_a_task_is_claimed_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("a")
+        first = claim("worker-1")
+        self.assertEqual(len(first), 1)
+        self.assertEqual(claim("worker-2"), [])
+        # Nor can another worker claim it by id
+        self.assertEqual(claim("worker-2", ids=[first[0].pk]), [])
+
+    def test_stale_tasks_are_requeued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("a")
+        [claimed] = claim("dead-worker")
+        Task.objects.update(locked_at=timezone.now() - timedelta(seconds=700))
+
+        self.assertEqual(requeue_stale(timeout=600), 1)
+        self.assertEqual(run_pending("worker-2"), 1)
+        self.assertEqual(calls, ["a"])
+        # The dead worker finishing late doesn't overwrite the result
+        claimed.name = "tasks.tests.explode"
+        run_task(claimed)
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_prune_removes_old_finished_tasks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("a", idempotency_key="old")
+            record.enqueue("b", delay=60)
+        run_pending()
+        Task.objects.filter(status=Task.DONE).update(finished_at=timezone.now() - timedelta(days=8))
+
+        self.assertEqual(prune(days=7), 1)
+        self.assertEqual(Task.objects.get().args, ["b"])
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("a")
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_runworker_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("a")
+            record.enqueue("b")
+        out = StringIO()
+        call_command("runworker", "--once", stdout=out)
+        self.assertIn("Ran 2 tasks.", out.getvalue())
+        self.assertEqual(calls, ["a", "b"])
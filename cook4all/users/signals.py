@@ -1,15 +1,21 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+
 from .models import Profile
 
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
+    # A single INSERT: cheaper than queueing a task, and every account has a
+    # profile from the start
     if created:
         Profile.objects.create(user=instance)
 
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def save_profile(sender, instance, created, raw=False, **kwargs):
+    # Users bulk-created without signals (e.g. by older imports) get their
+    # profile the next time they are saved
+    if not created and not raw:
+        Profile.objects.get_or_create(user=instance)
@@ -1,3 +1,50 @@
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from recipes import engagement
+from recipes.models import Recipe
+
+from .models import Profile
+
+
+class UserRecipePagesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cook", password="pass")
+        self.client.force_login(self.user)
+
+    def add_recipes(self, count):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=self.user, title=f"Recipe {Recipe.objects.count()}", description="",
+                ingredients="", instructions="",
+            )
+            engagement.toggle_save(recipe, self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_recipes(self):
+        for name in ["saved_recipes", "user_recipes"]:
+            with self.subTest(name):
+                self.add_recipes(1)
+                few = self.count_queries(reverse(name))
+                self.add_recipes(5)
+                self.assertEqual(self.count_queries(reverse(name)), few)
+
+
+class ProfileSignalTests(TestCase):
+    def test_accounts_get_a_profile_straight_away(self):
+        user = User.objects.create_user("cook", password="pass")
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+    def test_bulk_created_users_get_one_when_next_saved(self):
+        user = User.objects.bulk_create([User(username="imported")])[0]
+        self.assertFalse(Profile.objects.filter(user=user).exists())
+        user.save()
+        self.assertTrue(Profile.objects.filter(user=user).exists())
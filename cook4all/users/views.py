@@ -3,19 +3,18 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from recipes.models import Recipe  # Import Recipe model
+from recipes import engagement
+from images.pipeline import schedule_variants
 
 from django.contrib.auth.decorators import login_required
 from .forms import UserUpdateForm, ProfileUpdateForm
+from .models import Profile
 
 
 @login_required
 def toggle_save(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    user = request.user
-    if user in recipe.saved_by.all():
-        recipe.saved_by.remove(user)
-    else:
-        recipe.saved_by.add(user)
+    recipe = get_object_or_404(Recipe.objects.only("pk"), pk=pk)
+    engagement.toggle_save(recipe, request.user)
     return redirect(request.META.get('HTTP_REFERER', 'recipe_list'))
 
 
@@ -25,7 +24,10 @@ class SavedRecipesView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Fetch saved recipes for the logged-in user
-        context['saved_recipes'] = self.request.user.saved_recipes.all()
+        context['saved_recipes'] = (
+            Recipe.objects.with_stats(self.request.user)
+            .filter(saved_by=self.request.user)
+        )
         return context
 
 
@@ -35,18 +37,22 @@ class AccountInfoView(LoginRequiredMixin, TemplateView):
 
 @login_required
 def edit_profile(request):
+    # Users bulk-created without signals may not have a profile yet
+    profile, _ = Profile.objects.get_or_create(user=request.user)
     if request.method == "POST":
         user_form = UserUpdateForm(request.POST, instance=request.user)
-        profile_form = ProfileUpdateForm(request.POST, request.FILES, instance=request.user.profile)
+        profile_form = ProfileUpdateForm(request.POST, request.FILES, instance=profile)
 
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
-            profile_form.save()
-            return redirect("profile")  # redirect to profile page
+            profile = profile_form.save()
+            if "profile_image" in request.FILES:
+                schedule_variants(profile, request.FILES["profile_image"])
+            return redirect("account_info")  # redirect to profile page
 
     else:
         user_form = UserUpdateForm(instance=request.user)
-        profile_form = ProfileUpdateForm(instance=request.user.profile)
+        profile_form = ProfileUpdateForm(instance=profile)
 
     return render(request, "users/edit_profile.html", {
         "user_form": user_form,
@@ -56,5 +62,9 @@ def edit_profile(request):
 
 @login_required
 def user_recipes(request):
-    recipes = request.user.recipes.all()  # uses related_name="recipes"
+    recipes = (
+        Recipe.objects.with_stats(request.user)
+        .filter(author=request.user)
+        .order_by("-created_at")
+    )
     return render(request, "users/user_recipes.html", {"recipes": recipes})